@@ -2,10 +2,39 @@
 # construct_gallery module
 #############################################################################
 
-from .construct_gallery import ConstructGallery, GalleryItem, HexEditorGrid
-from .config_editor import ConfigEditorPanel
-try:
-    from .bleak_scanner_construct import BleakScannerConstruct
-except ImportError:
-    class BleakScannerConstruct:
-        BLEAK_IS_USED = False  # it means invalid class and black not installed
+# The wxPython widgets are imported when first used, so that the modules
+# which do not need wx (e.g., ble_scanner and ble_capture for headless
+# capture, and the storage and parsing modules) can be imported without it
+_exports = {
+    "ConstructGallery": ".construct_gallery",
+    "GalleryItem": ".construct_gallery",
+    "HexEditorGrid": ".construct_gallery",
+    "ConfigEditorPanel": ".config_editor",
+    "BleakScannerConstruct": ".bleak_scanner_construct",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    try:
+        value = getattr(import_module(_exports[name], __name__), name)
+    except ImportError:
+        if name != "BleakScannerConstruct":
+            raise
+
+        class BleakScannerConstruct:
+            # it means invalid class and bleak not installed
+            BLEAK_IS_USED = False
+
+        value = BleakScannerConstruct
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
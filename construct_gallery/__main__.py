@@ -10,20 +10,22 @@ import sys
 import argparse
 import logging
 import importlib.util
-import wx
-import construct as cs
-import construct_editor.gallery
-from construct_gallery import (
-    ConstructGallery, GalleryItem, ConfigEditorPanel, BleakScannerConstruct
-)
-from construct_editor.core.model import IntegerFormat
 try:
     import bleak.uuids
+    BLEAK_IS_USED = True
 except ImportError:
-    pass
+    BLEAK_IS_USED = False
+
+# wx, construct and construct_editor are imported by the GUI applications,
+# so that the headless capture (-H) does not need them
 
 
 def config_app(construct_module):
+    import wx
+    import construct as cs
+    from construct_editor.core.model import IntegerFormat
+    from construct_gallery import ConfigEditorPanel
+
     if construct_module:
         editing_structure = construct_module.editing_structure
     else:
@@ -93,6 +95,9 @@ def config_app(construct_module):
 
 
 def bleak_app(construct_module, args):
+    import wx
+    from construct_gallery import BleakScannerConstruct
+
     class SDBleakScannerConstruct(BleakScannerConstruct):
         sep = " \u250a "  # thin vertical dotted bar
 
@@ -155,23 +160,75 @@ def bleak_app(construct_module, args):
     main_panel = SDBleakScannerConstruct(
         frame,
         gallery_descriptor=construct_module,
+        filter_mac_file=args.filter_mac_file,
+        scanner_backend=synthetic_backend(args),
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+        upsert=args.upsert,
+        history_size=args.history_size,
+        gallery_store=args.store,
+        payload_arena=args.arena,
+        virtual_gallery=args.virtual_gallery,
+        gallery_columns=["time", "reference", "length", "description"],
         reference_label=args.reference_label or "MAC Address",
         key_label=args.key_label,
         description_label=args.description_label or "Description",
         gallery_descriptor_var=args.gallery_descriptor_var,
         construct_format_var=args.construct_format_var
     )
+    main_panel.filter_mac = args.filter_mac or ""
+    main_panel.filter_name = args.filter_name or ""
+    main_panel.compile_filter()
+    if args.replay:
+        wx.CallLater(
+            200, main_panel.replay_capture, args.replay, args.replay_speed)
     frame.Bind(wx.EVT_CLOSE, lambda event: on_close(main_panel, event))
     frame.Show(True)
     app.MainLoop()
 
 
+def headless_app(args):
+    from construct_gallery.ble_scanner import BleakCapture
+
+    logging.basicConfig(level=logging.WARNING)
+    capture = BleakCapture(
+        args.headless,
+        filter_mac=args.filter_mac,
+        filter_name=args.filter_name,
+        filter_mac_file=args.filter_mac_file,
+        scanner_backend=synthetic_backend(args),
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+    )
+    capture.run()
+
+
+def synthetic_backend(args):
+    """SyntheticBackend configured by the -S/--synthetic option, or None"""
+    if not args.synthetic:
+        return None
+    from construct_gallery.ble_backends import SyntheticBackend
+
+    values = args.synthetic.split(",")
+    return SyntheticBackend(
+        devices=int(values[0]),
+        rate=float(values[1]) if len(values) > 1 else 100.0,
+        count=int(values[2]) if len(values) > 2 else None,
+        seed=args.seed,
+    )
+
+
 def on_close(frame, event):
     frame.on_application_close()
     event.Skip()
 
 
 def gallery_app(construct_module, args):
+    import wx
+    import construct as cs
+    import construct_editor.gallery
+    from construct_gallery import ConstructGallery, GalleryItem
+
     app = wx.App(False)
     width, height = wx.GetDisplaySize()
     title = "Construct Gallery Editor"
@@ -243,7 +300,9 @@ def gallery_app(construct_module, args):
         key_label=args.key_label,
         description_label=args.description_label,
         gallery_descriptor_var=args.gallery_descriptor_var,
-        construct_format_var=args.construct_format_var
+        construct_format_var=args.construct_format_var,
+        virtual_gallery=args.virtual_gallery,
+        gallery_columns=["length"]
     )
     frame.Bind(wx.EVT_CLOSE, lambda event: on_close(main_panel, event))
     frame.Show(True)
@@ -255,7 +314,7 @@ def ble_main():
 
 
 def main(run_bleak=False):
-    package = sys.modules[ConstructGallery.__module__].__package__
+    package = __package__ or "construct_gallery"
     parser = argparse.ArgumentParser(
         prog=package,
         description="Run as python3 -m %s ..." % package,
@@ -291,7 +350,8 @@ def main(run_bleak=False):
         type=str,
         help='"description_label" string.'
     )
-    if BleakScannerConstruct.BLEAK_IS_USED:
+    group = parser.add_mutually_exclusive_group()
+    if BLEAK_IS_USED:
         parser.add_argument(
             '-M',
             "--not_detect_svc_data",
@@ -312,7 +372,146 @@ def main(run_bleak=False):
             "Default is not to detect manufacturer data "
             "and only detect service data."
         )
-    group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            '-H',
+            "--headless",
+            dest='headless',
+            action='store',
+            type=str,
+            default=None,
+            metavar='CAPTURE_FILE',
+            help="Capture BLE advertisements to CAPTURE_FILE without GUI "
+            "(stop with Ctrl-C). The file can be loaded with the -b option. "
+            "Cannot be used with the options of the GUI."
+        )
+        parser.add_argument(
+            '-r',
+            "--replay",
+            dest='replay',
+            action='store',
+            type=str,
+            default=None,
+            metavar='CAPTURE_FILE',
+            help="Only used with -b/--bleak option. "
+            "Replay the advertisements of CAPTURE_FILE."
+        )
+        parser.add_argument(
+            '-s',
+            "--replay_speed",
+            dest='replay_speed',
+            action='store',
+            type=float,
+            default=1.0,
+            help="Only used with -r/--replay option. Replay speed: "
+            "1 = real time (default), N = N times faster, 0 = maximum speed."
+        )
+        parser.add_argument(
+            "--filter_mac",
+            dest='filter_mac',
+            action='store',
+            type=str,
+            default=None,
+            help="Used with -b/--bleak and -H/--headless options. "
+            "MAC addresses or initial portions, separated by comma "
+            "(prefix with ! to exclude)."
+        )
+        parser.add_argument(
+            "--filter_name",
+            dest='filter_name',
+            action='store',
+            type=str,
+            default=None,
+            help="Used with -b/--bleak and -H/--headless options. "
+            "Local names or initial portions, separated by comma "
+            "(prefix with ! to exclude)."
+        )
+        parser.add_argument(
+            "--filter_mac_file",
+            dest='filter_mac_file',
+            action='store',
+            type=str,
+            default=None,
+            help="Used with -b/--bleak and -H/--headless options. "
+            "File of MAC addresses or initial portions, one per line."
+        )
+        parser.add_argument(
+            '-S',
+            "--synthetic",
+            dest='synthetic',
+            action='store',
+            type=str,
+            default=None,
+            metavar='DEVICES[,RATE[,COUNT]]',
+            help="Used with -b/--bleak and -H/--headless options. "
+            "Use a synthetic advertiser instead of the Bluetooth adapter: "
+            "DEVICES devices sending RATE advertisements per second in total "
+            "(default 100, 0 = maximum speed); stop after COUNT "
+            "advertisements."
+        )
+        parser.add_argument(
+            "--seed",
+            dest='seed',
+            action='store',
+            type=int,
+            default=0,
+            help="Only used with -S/--synthetic option. "
+            "Random seed of the synthetic advertiser (default 0)."
+        )
+        parser.add_argument(
+            "--metrics_file",
+            dest='metrics_file',
+            action='store',
+            type=str,
+            default=None,
+            help="Used with -b/--bleak and -H/--headless options. "
+            "Periodically append the scanner and ingestion metrics to "
+            "METRICS_FILE (JSON Lines)."
+        )
+        parser.add_argument(
+            "--metrics_interval",
+            dest='metrics_interval',
+            action='store',
+            type=float,
+            default=10.0,
+            help="Only used with --metrics_file option. "
+            "Seconds between two metrics exports (default 10)."
+        )
+        parser.add_argument(
+            '-u',
+            "--upsert",
+            dest='upsert',
+            action='store_true',
+            help="Only used with -b/--bleak option. "
+            "Show only the last advertisement of each device and data type, "
+            "updating its element in place."
+        )
+        parser.add_argument(
+            "--history_size",
+            dest='history_size',
+            action='store',
+            type=int,
+            default=0,
+            help="Only used with -u/--upsert option. "
+            "Number of previous values kept for each element (default 0)."
+        )
+        parser.add_argument(
+            "--store",
+            dest='store',
+            action='store',
+            type=str,
+            default=None,
+            help="Only used with -b/--bleak option. "
+            "Store the gallery in the STORE SQLite database (created if "
+            "missing) instead of memory."
+        )
+        parser.add_argument(
+            "--arena",
+            dest='arena',
+            action='store_true',
+            help="Only used with -b/--bleak option. "
+            "Store the payloads in a compact arena buffer instead of "
+            "separate objects (for long captures)."
+        )
     group.add_argument(
         '-g',
         "--gallery",
@@ -337,7 +536,14 @@ def main(run_bleak=False):
         default=None,
         help='Custom "construct_format" variable name.'
     )
-    if BleakScannerConstruct.BLEAK_IS_USED:
+    parser.add_argument(
+        "--virtual_gallery",
+        dest='virtual_gallery',
+        action='store_true',
+        help="Use a virtual list with additional columns for the gallery "
+        "elements (for very large galleries)."
+    )
+    if BLEAK_IS_USED:
         group.add_argument(
             '-b',
             "--bleak",
@@ -351,16 +557,41 @@ def main(run_bleak=False):
             action='store_true',
             help="Config Editor.")
     args = parser.parse_args()
-    if BleakScannerConstruct.BLEAK_IS_USED:
+    if BLEAK_IS_USED:
         if (
-            (args.not_detect_svc_data or args.detect_manuf_data)
-            and not (args.bleak or run_bleak)
+            (
+                args.not_detect_svc_data or args.detect_manuf_data
+                or args.replay or args.upsert or args.store or args.arena
+            )
+            and (args.headless or not (args.bleak or run_bleak))
         ):
             print(
-                "Options -M/--not_detect_svc_data and -m/--detect_manuf_data "
-                "can only be used with the -b/--bleak option."
+                "Options -M/--not_detect_svc_data, -m/--detect_manuf_data, "
+                "-r/--replay, -u/--upsert, --store and --arena can only be "
+                "used with the -b/--bleak option (not with -H/--headless)."
             )
             sys.exit(2)
+        if args.headless and (
+            args.construct_module or args.reference_label
+            or args.key_label or args.description_label
+            or args.gallery_descriptor_var or args.construct_format_var
+            or args.virtual_gallery
+        ):
+            print(
+                "Option -H/--headless cannot be used with CONSTRUCT_MODULE "
+                "and with the -R, -K, -D, -F, -f and --virtual_gallery "
+                "options of the GUI."
+            )
+            sys.exit(2)
+        if args.synthetic:
+            try:
+                synthetic_backend(args)
+            except ValueError:
+                print(
+                    "Invalid -S/--synthetic value; "
+                    "format: DEVICES[,RATE[,COUNT]]."
+                )
+                sys.exit(2)
     if (
         args.gallery_descriptor_var or args.construct_format_var
     ) and not args.construct_module:
@@ -390,7 +621,9 @@ def main(run_bleak=False):
             print("Construct module import error:", str(e))
             sys.exit(2)
 
-    if BleakScannerConstruct.BLEAK_IS_USED and (args.bleak or run_bleak):
+    if BLEAK_IS_USED and args.headless:
+        sys.exit(headless_app(args))
+    if BLEAK_IS_USED and (args.bleak or run_bleak):
         sys.exit(bleak_app(construct_module, args))
     elif args.config:
         sys.exit(config_app(construct_module))
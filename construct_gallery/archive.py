@@ -0,0 +1,146 @@
+#############################################################################
+# archive module
+#############################################################################
+
+import os
+import gc
+import json
+import mmap
+import struct
+
+ARCHIVE_MAGIC = b"CGARCH01"
+# magic, index offset, index length, number of elements
+ARCHIVE_HEADER = struct.Struct("<8sQQQ")
+
+
+class ArchivePayload:
+    """Payload of an element stored in a GalleryArchive, loaded on demand."""
+    __slots__ = ("archive", "offset", "length")
+
+    def __init__(self, archive, offset, length):
+        self.archive = archive
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def load(self):
+        return self.archive.read(self.offset, self.length)
+
+
+def write_archive(filename, elements, key_descr_dict):
+    """
+    Write an indexed archive. elements is an iterable of (label, binary,
+    reference) tuples. The archive has a fixed header, the payload region
+    and, at the end, the index (labels, offsets, lengths, references and
+    key/description of the references, in JSON format). Identical payloads
+    are written once and share their offset. Return the number of written
+    elements.
+    """
+    written = {}  # payload -> offset
+    labels = []
+    offsets = []
+    lengths = []
+    references = []
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as file:
+        file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, 0, 0, 0))
+        offset = ARCHIVE_HEADER.size
+        for label, binary, reference in elements:
+            payload_offset = written.get(binary)
+            if payload_offset is None:
+                payload_offset = written[binary] = offset
+                file.write(binary)
+                offset += len(binary)
+            labels.append(label)
+            offsets.append(payload_offset)
+            lengths.append(len(binary))
+            references.append(reference)
+        index = json.dumps(
+            {
+                "labels": labels,
+                "offsets": offsets,
+                "lengths": lengths,
+                "references": references,
+                "key_descr": key_descr_dict,
+            },
+            separators=(",", ":")
+        ).encode("utf-8")
+        file.write(index)
+        file.seek(0)
+        file.write(ARCHIVE_HEADER.pack(
+            ARCHIVE_MAGIC, offset, len(index), len(labels)))
+    os.replace(temp_filename, filename)
+    return len(labels)
+
+
+def is_archive_file(filename):
+    """Check the header of a file written by write_archive()."""
+    try:
+        with open(filename, "rb") as file:
+            return file.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+    except OSError:
+        return False
+
+
+class GalleryArchive:
+    """
+    Indexed archive opened with lazy loading: only the header and the index
+    are read when the archive is opened; the payload region is memory-mapped
+    and each payload is read when requested, so that large archives open
+    quickly with a small resident set.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        try:
+            magic, index_offset, index_length, count = ARCHIVE_HEADER.unpack(
+                self.file.read(ARCHIVE_HEADER.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError("Not an archive: '%s'" % filename)
+            self.file.seek(index_offset)
+            self.index = json.loads(self.file.read(index_length))
+            if len(self.index["labels"]) != count:
+                raise ValueError("Corrupted archive index: '%s'" % filename)
+            self.mmap = mmap.mmap(
+                self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+        self.key_descr_dict = self.index["key_descr"]
+
+    def __len__(self):
+        return len(self.index["labels"])
+
+    def read(self, offset, length):
+        return self.mmap[offset:offset + length]
+
+    def elements(self):
+        """
+        Return a dictionary of label -> (ArchivePayload, reference), without
+        reading the payloads.
+        """
+        index = self.index
+        gc_enabled = gc.isenabled()
+        gc.disable()  # no garbage collections while allocating the objects
+        try:
+            return dict(zip(
+                index["labels"],
+                (
+                    (ArchivePayload(self, offset, length), reference)
+                    for offset, length, reference in zip(
+                        index["offsets"],
+                        index["lengths"],
+                        index["references"])
+                )
+            ))
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def close(self):
+        if not self.file.closed:
+            self.mmap.close()
+            self.file.close()
@@ -0,0 +1,195 @@
+#############################################################################
+# ble_backends module
+#############################################################################
+
+import abc
+import asyncio
+import random
+import time
+import subprocess
+from .ble_capture import AdvDevice, AdvData
+
+
+class ScannerBackend(abc.ABC):
+    """
+    Source of BLE advertisements used by BleakScannerEngine.bt_adv().
+
+    Subclasses implement scan(), which has to call
+    detection_callback(device, advertisement_data) for each advertisement,
+    until stop_event (asyncio.Event) is set.
+    """
+
+    @abc.abstractmethod
+    async def scan(self, detection_callback, stop_event):
+        """Produce advertisements until stop_event is set."""
+
+    def unavailable_errors(self):
+        """Exceptions raised by scan() when the scanner is not available."""
+        return (FileNotFoundError,)
+
+
+class BleakBackend(ScannerBackend):
+    """Advertisements received by the Bluetooth adapter via bleak."""
+
+    def __init__(self, bleak_scanner_kwargs=None):
+        self.bleak_scanner_kwargs = bleak_scanner_kwargs or {}
+
+    def unavailable_errors(self):
+        from bleak import BleakError
+
+        return (FileNotFoundError, BleakError)
+
+    async def scan(self, detection_callback, stop_event):
+        import bleak
+        from bleak import BleakScanner  # pip3 install bleak
+
+        bleak_scanner_kwargs = self.bleak_scanner_kwargs
+        scanning_mode = bleak_scanner_kwargs.get('scanning_mode')
+        bluez_passive = (
+            scanning_mode
+            and scanning_mode.lower() == 'passive'
+            and "BleakScannerBlueZDBus" in str(
+                bleak.get_platform_scanner_backend_type()
+            )
+        )
+        if bluez_passive:
+            from bleak.assigned_numbers import AdvertisementDataType
+            from bleak.backends.bluezdbus.advertisement_monitor import OrPattern
+            from bleak.backends.bluezdbus.scanner import BlueZScannerArgs
+            ble_z_args = {
+                'bluez': BlueZScannerArgs(
+                    or_patterns=[
+                        OrPattern(0, AdvertisementDataType.FLAGS, b"\x06"),
+                        OrPattern(0, AdvertisementDataType.FLAGS, b"\x1a"),
+                    ]
+                )
+            }
+            bleak_scanner_kwargs = {**bleak_scanner_kwargs, **ble_z_args}
+        async with BleakScanner(
+            detection_callback=detection_callback,
+            **bleak_scanner_kwargs
+        ):
+            if bluez_passive:  # https://stackoverflow.com/questions/55336017/disable-filter-duplicates-setting-for-le-set-scan-enable-command
+                subprocess.run(  # Disable the 'Filter duplicates' kernel setting when the bluez Advertising Monitor is enabled
+                    "which hcitool"
+                    " && sudo -n hcitool cmd 0x08 0x000C 0x00 0x00"  # Scan disabled (needed)
+                    " && sudo -n hcitool cmd 0x08 0x000C 0x01 0x00",  # Scan enabled, disabling Filter duplicates
+                    shell=True,
+                    capture_output=True
+                )
+            await stop_event.wait()
+
+
+class SyntheticBackend(ScannerBackend):
+    """
+    Synthetic advertiser, generating a deterministic (seeded) population of
+    devices advertising at a given total rate, without Bluetooth adapter.
+
+    Each device has a MAC address, a local name and a payload sent either
+    as service data (service_uuid) or as manufacturer data
+    (manufacturer_id). Like real sensors, devices mostly repeat the same
+    payload; with probability mutation_rate the payload changes: the first
+    byte is a frame counter and the next two bytes are a measurement
+    (little endian) doing a random walk. The RSSI also does a random walk.
+
+    rate is the total number of advertisements per second (0 means
+    unthrottled); if count is set, the scan stops after count
+    advertisements.
+    """
+
+    def __init__(
+            self,
+            devices=10,
+            rate=100.0,
+            count=None,
+            payload_size=16,
+            mutation_rate=0.1,
+            manufacturer_ratio=0.0,
+            service_uuid="0000181a-0000-1000-8000-00805f9b34fb",
+            manufacturer_id=0xFFFF,
+            seed=0,
+            tick=0.01):
+        self.devices = devices
+        self.rate = rate
+        self.count = count
+        self.payload_size = max(payload_size, 3)
+        self.mutation_rate = mutation_rate
+        self.manufacturer_ratio = manufacturer_ratio
+        self.service_uuid = service_uuid
+        self.manufacturer_id = manufacturer_id
+        self.seed = seed
+        self.tick = tick
+        self.sent = 0
+        self.random = random.Random(seed)
+        self.population = [self.create_device(i) for i in range(devices)]
+
+    def create_device(self, number):
+        rnd = self.random
+        address = "5A:%02X:%02X:%02X:%02X:%02X" % tuple(
+            rnd.randrange(256) for _ in range(5))
+        payload = bytearray(
+            rnd.randrange(256) for _ in range(self.payload_size))
+        return {
+            "device": AdvDevice(address, "SYN-%04d" % number),
+            "manufacturer": rnd.random() < self.manufacturer_ratio,
+            "payload": payload,
+            "rssi": rnd.randrange(-90, -40),
+        }
+
+    def mutate(self, state):
+        rnd = self.random
+        payload = state["payload"]
+        state["rssi"] = min(-30, max(-100, state["rssi"] + rnd.randint(-2, 2)))
+        if rnd.random() >= self.mutation_rate:
+            return
+        payload[0] = (payload[0] + 1) & 0xFF
+        value = int.from_bytes(payload[1:3], "little")
+        value = (value + rnd.randint(-16, 16)) & 0xFFFF
+        payload[1:3] = value.to_bytes(2, "little")
+
+    def next_advertisement(self):
+        state = self.population[self.sent % self.devices]
+        self.mutate(state)
+        payload = bytes(state["payload"])
+        device = state["device"]
+        if state["manufacturer"]:
+            manufacturer_data = {self.manufacturer_id: payload}
+            service_data = {}
+            service_uuids = []
+        else:
+            manufacturer_data = {}
+            service_data = {self.service_uuid: payload}
+            service_uuids = [self.service_uuid]
+        self.sent += 1
+        return device, AdvData(
+            local_name=device.name,
+            manufacturer_data=manufacturer_data,
+            service_data=service_data,
+            service_uuids=service_uuids,
+            tx_power=None,
+            rssi=state["rssi"],
+            platform_data=(),
+        )
+
+    async def scan(self, detection_callback, stop_event):
+        if not self.devices:
+            await stop_event.wait()
+            return
+        start = time.monotonic()
+        while not stop_event.is_set():
+            if self.rate:
+                target = int((time.monotonic() - start) * self.rate)
+            else:
+                target = self.sent + 1000
+            if self.count is not None:
+                target = min(target, self.count)
+            while self.sent < target:
+                detection_callback(*self.next_advertisement())
+            if self.count is not None and self.sent >= self.count:
+                stop_event.set()
+                break
+            try:
+                await asyncio.wait_for(
+                    stop_event.wait(), self.tick if self.rate else 0)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,149 @@
+#############################################################################
+# ble_benchmark module
+#############################################################################
+
+import sys
+import time
+import json
+import asyncio
+import argparse
+import threading
+from .ble_scanner import BleakScannerEngine
+from .ble_backends import SyntheticBackend
+from .ingestion import IngestionQueue, DuplicateSuppressor
+
+
+class BenchmarkScanner(BleakScannerEngine):
+    """
+    Ingestion pipeline of BleakScannerConstruct without GUI: the
+    advertisements of scanner_backend go through the MAC/name filter, the
+    duplicate suppression and the ingestion queue, which is drained in
+    batches every flush_interval milliseconds by a thread standing in for
+    the timer of the GUI.
+    """
+
+    def __init__(
+            self,
+            scanner_backend,
+            filter_mac="",
+            filter_name="",
+            dedup_mode=None,
+            dedup_window=1000,
+            flush_interval=100,
+            max_batch_size=500):
+        self.filter_mac = filter_mac
+        self.filter_name = filter_name
+        self.init_scanner(scanner_backend=scanner_backend)
+        self.duplicate_suppressor = DuplicateSuppressor(
+            dedup_mode, dedup_window)
+        self.ingestion_queue = IngestionQueue(max_batch_size, self.metrics)
+        self.flush_interval = flush_interval / 1000
+        self.scanning = threading.Event()
+
+    def bleak_advertising(self, device, advertisement_data):
+        data_items = list(advertisement_data.service_data.items())
+        data_items += advertisement_data.manufacturer_data.items()
+        for data_key, data in data_items:
+            if not self.duplicate_suppressor.accept(
+                    device.address, data, data_key):
+                self.metrics.incr("deduplicated")
+                continue
+            self.ingestion_queue.put((device.address, data_key, data))
+            self.metrics.incr("queued")
+
+    def insert(self, batch):
+        self.metrics.incr("inserted", len(batch))
+
+    def run_consumer(self):
+        while self.scanning.is_set() or self.ingestion_queue.depth:
+            time.sleep(self.flush_interval)
+            self.ingestion_queue.flush(self.insert)
+
+    def run(self):
+        """Scan until the backend stops; return the metrics snapshot."""
+        self.scanning.set()
+        consumer = threading.Thread(target=self.run_consumer, daemon=True)
+        consumer.start()
+        try:
+            asyncio.run(self.bt_adv(self.bleak_scanner_kwargs))
+        finally:
+            self.scanning.clear()
+            consumer.join()
+        return self.metrics.snapshot()
+
+
+def run_benchmark(
+        devices=100,
+        rate=0.0,
+        count=100000,
+        seed=0,
+        **kwargs):
+    """
+    Run BenchmarkScanner with a SyntheticBackend sending count
+    advertisements; kwargs are passed to BenchmarkScanner. Return the
+    snapshot of its PipelineMetrics, with the received advertisements per
+    second.
+    """
+    scanner = BenchmarkScanner(
+        SyntheticBackend(devices=devices, rate=rate, count=count, seed=seed),
+        **kwargs)
+    snapshot = scanner.run()
+    uptime = snapshot["uptime"]
+    snapshot["received_rate"] = (
+        snapshot["counters"]["received"] / uptime if uptime else 0.0)
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python3 -m construct_gallery.ble_benchmark",
+        description="Benchmark of the BLE ingestion pipeline with the "
+        "synthetic advertiser (no Bluetooth adapter and no GUI needed).")
+    parser.add_argument(
+        '-d', "--devices", dest='devices', type=int, default=100,
+        help="Number of synthetic devices (default 100).")
+    parser.add_argument(
+        '-r', "--rate", dest='rate', type=float, default=0.0,
+        help="Advertisements per second in total (default 0 = maximum "
+        "speed).")
+    parser.add_argument(
+        '-c', "--count", dest='count', type=int, default=100000,
+        help="Number of advertisements (default 100000).")
+    parser.add_argument(
+        "--seed", dest='seed', type=int, default=0,
+        help="Random seed of the synthetic advertiser (default 0).")
+    parser.add_argument(
+        "--dedup", dest='dedup_mode', choices=["change", "window"],
+        default=None, help="Duplicate suppression mode (default none).")
+    parser.add_argument(
+        "--flush_interval", dest='flush_interval', type=int, default=100,
+        help="Milliseconds between two flushes of the queue (default 100).")
+    parser.add_argument(
+        "--json", dest='json', action='store_true',
+        help="Print the metrics snapshot in JSON format.")
+    args = parser.parse_args()
+    snapshot = run_benchmark(
+        devices=args.devices,
+        rate=args.rate,
+        count=args.count,
+        seed=args.seed,
+        dedup_mode=args.dedup_mode,
+        flush_interval=args.flush_interval)
+    if args.json:
+        print(json.dumps(snapshot, indent=2, default=str))
+        return 0
+    counters = snapshot["counters"]
+    latency = snapshot["histograms"]["insert_latency"]
+    print("Received: %d advertisements in %.2f seconds (%.0f/s)" % (
+        counters["received"], snapshot["uptime"], snapshot["received_rate"]))
+    print("Filtered: %d, deduplicated: %d, queued: %d, inserted: %d" % (
+        counters["filtered"], counters["deduplicated"], counters["queued"],
+        counters["inserted"]))
+    print("Insert latency: p50 <= %g s, p95 <= %g s, p99 <= %g s, "
+          "max %.4f s" % (latency["p50"], latency["p95"], latency["p99"],
+                          latency["max"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#############################################################################
+# ble_capture module
+#############################################################################
+
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+CAPTURE_FORMAT = "construct-gallery-capture"
+CAPTURE_VERSION = 1
+
+# Lightweight replacements of bleak BLEDevice and AdvertisementData, used
+# when advertisements are read from a capture file; they expose the same
+# attributes used by bleak_advertising().
+AdvDevice = namedtuple("AdvDevice", "address name")
+AdvData = namedtuple(
+    "AdvData",
+    "local_name manufacturer_data service_data service_uuids tx_power rssi "
+    "platform_data"
+)
+
+
+class CaptureWriter:
+    """
+    Append-only writer of BLE advertisements, one JSON object per line
+    (JSON Lines). The first line of a new file is a header identifying the
+    format. Written data is flushed to disk at least every flush_interval
+    seconds, so that a crash loses at most the last second of capture.
+    """
+
+    def __init__(self, filename, flush_interval=1.0):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        new_file = (
+            not os.path.exists(filename) or os.path.getsize(filename) == 0
+        )
+        self.file = open(filename, "a", encoding="utf-8")
+        self.last_flush = time.monotonic()
+        self.written = 0
+        if new_file:
+            self.file.write(json.dumps(
+                {"format": CAPTURE_FORMAT, "version": CAPTURE_VERSION}) + "\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        self.close()
+
+    def write(self, device, advertisement_data, timestamp=None):
+        record = {
+            "time": (timestamp or datetime.now(timezone.utc)).timestamp(),
+            "address": device.address,
+            "name": getattr(device, "name", None),
+            "local_name": advertisement_data.local_name,
+            "rssi": advertisement_data.rssi,
+            "tx_power": getattr(advertisement_data, "tx_power", None),
+            "service_uuids": list(advertisement_data.service_uuids or []),
+            "service_data": {
+                uuid: data.hex() for uuid, data in
+                (advertisement_data.service_data or {}).items()
+            },
+            "manufacturer_data": {
+                str(adv_id): data.hex() for adv_id, data in
+                (advertisement_data.manufacturer_data or {}).items()
+            },
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.written += 1
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def is_capture_file(filename):
+    """Check the header of a file written by CaptureWriter."""
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+    except (OSError, ValueError):
+        return False
+    return isinstance(header, dict) and header.get("format") == CAPTURE_FORMAT
+
+
+def read_capture(filename):
+    """
+    Read a capture file, yielding (timestamp, device, advertisement_data)
+    tuples with the original addresses, timestamps and data keys. A
+    truncated last line (e.g., after a crash) is ignored.
+    """
+    with open(filename, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "address" not in record:  # header
+                continue
+            yield (
+                datetime.fromtimestamp(record["time"], timezone.utc),
+                AdvDevice(record["address"], record.get("name")),
+                AdvData(
+                    local_name=record.get("local_name"),
+                    manufacturer_data={
+                        int(adv_id): bytes.fromhex(data) for adv_id, data in
+                        record.get("manufacturer_data", {}).items()
+                    },
+                    service_data={
+                        uuid: bytes.fromhex(data) for uuid, data in
+                        record.get("service_data", {}).items()
+                    },
+                    service_uuids=record.get("service_uuids", []),
+                    tx_power=record.get("tx_power"),
+                    rssi=record.get("rssi"),
+                    platform_data=(),
+                )
+            )
+
+
+class CaptureReplay:
+    """
+    Replay the advertisements of a capture file in a thread, passing each
+    (timestamp, device, advertisement_data) tuple to callback.
+
+    speed is the replay rate compared to the capture: 1 is real time, N is
+    N times faster, 0 (or None) means unthrottled (maximum speed).
+    """
+
+    def __init__(self, filename, callback, speed=1.0):
+        self.filename = filename
+        self.callback = callback
+        self.speed = speed
+        self.replayed = 0
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_alive(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def run(self):
+        self.start_time = time.monotonic()
+        first_adv_time = None
+        try:
+            for record in read_capture(self.filename):
+                if self.stop_event.is_set():
+                    break
+                if self.speed:
+                    adv_time = record[0].timestamp()
+                    if first_adv_time is None:
+                        first_adv_time = adv_time
+                    delay = (
+                        self.start_time
+                        + (adv_time - first_adv_time) / self.speed
+                        - time.monotonic()
+                    )
+                    if delay > 0 and self.stop_event.wait(delay):
+                        break
+                self.callback(*record)
+                self.replayed += 1
+        except OSError as e:
+            self.error = e
+        self.end_time = time.monotonic()
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.monotonic()) - self.start_time
+
+    def stats(self):
+        elapsed = self.elapsed
+        return {
+            "replayed": self.replayed,
+            "elapsed": elapsed,
+            "replay_rate": self.replayed / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,145 @@
+#############################################################################
+# ble_filter module
+#############################################################################
+
+import re
+
+
+class PrefixMatcher:
+    """
+    Match strings against a set of prefixes.
+
+    Prefixes are grouped by length into sets, so that the cost of a match
+    only depends on the number of distinct prefix lengths (e.g., at most 17
+    with MAC addresses) and not on the number of prefixes.
+    """
+
+    def __init__(self, prefixes=(), ignore_case=False):
+        self.ignore_case = ignore_case
+        self.prefixes = {}  # prefix length -> set of prefixes
+        self.lengths = ()
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def __len__(self):
+        return sum(len(i) for i in self.prefixes.values())
+
+    def add(self, prefix):
+        if not prefix:
+            return
+        if self.ignore_case:
+            prefix = prefix.upper()
+        self.prefixes.setdefault(len(prefix), set()).add(prefix)
+        self.lengths = tuple(sorted(self.prefixes))
+
+    def match(self, value):
+        if not value:
+            return False
+        if self.ignore_case:
+            value = value.upper()
+        prefixes = self.prefixes
+        for length in self.lengths:
+            if value[:length] in prefixes[length]:
+                return True
+        return False
+
+
+def split_filter(filter_str):
+    """Split a filter string whose elements are separated by comma or ;"""
+    if not filter_str:
+        return []
+    return [i for i in re.split(r'\s*[;,]\s*', filter_str.strip()) if i]
+
+
+def read_filter_file(filename):
+    """
+    Read the elements of a filter file: one element per line; empty lines
+    and lines starting with # are ignored.
+    """
+    with open(filename, "r") as file:
+        return [
+            line.strip() for line in file
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+
+class AdvertisementFilter:
+    """
+    Compiled MAC address and local name filter of the BLE advertisements.
+
+    Each element is the initial portion of a MAC address or of a local name;
+    elements starting with "!" are excluded (deny list). If an allow list is
+    defined, advertisements not matching it are dropped. MAC addresses are
+    compared ignoring the case.
+
+    The filter is compiled once, when the filter strings change; the match()
+    method is invoked for each advertisement and updates the hit/miss
+    counters of each list.
+    """
+    DENY_MARKER = "!"
+    COUNTERS = (
+        "received",
+        "passed",
+        "mac_allow_hit",
+        "mac_allow_miss",
+        "mac_deny_hit",
+        "name_allow_hit",
+        "name_allow_miss",
+        "name_deny_hit",
+    )
+
+    def __init__(self, filter_mac="", filter_name="", filter_mac_files=()):
+        self.counters = {}
+        self.reset_counters()
+        self.compile(filter_mac, filter_name, filter_mac_files)
+
+    def reset_counters(self):
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def stats(self):
+        return dict(self.counters)
+
+    def compile(self, filter_mac="", filter_name="", filter_mac_files=()):
+        mac_allow = PrefixMatcher(ignore_case=True)
+        mac_deny = PrefixMatcher(ignore_case=True)
+        name_allow = PrefixMatcher()
+        name_deny = PrefixMatcher()
+        mac_elements = split_filter(filter_mac)
+        for filename in filter_mac_files or ():
+            mac_elements += read_filter_file(filename)
+        for element in mac_elements:
+            self.add_element(element, mac_allow, mac_deny)
+        for element in split_filter(filter_name):
+            self.add_element(element, name_allow, name_deny)
+        # single assignment, so that the BLE thread always reads a
+        # consistent set of rules
+        self.rules = (mac_allow, mac_deny, name_allow, name_deny)
+
+    def add_element(self, element, allow, deny):
+        if element.startswith(self.DENY_MARKER):
+            deny.add(element[len(self.DENY_MARKER):].strip())
+        else:
+            allow.add(element)
+
+    def match(self, address, local_name):
+        mac_allow, mac_deny, name_allow, name_deny = self.rules
+        counters = self.counters
+        counters["received"] += 1
+        if mac_deny.lengths and mac_deny.match(address):
+            counters["mac_deny_hit"] += 1
+            return False
+        if mac_allow.lengths:
+            if not mac_allow.match(address):
+                counters["mac_allow_miss"] += 1
+                return False
+            counters["mac_allow_hit"] += 1
+        if name_deny.lengths and name_deny.match(local_name):
+            counters["name_deny_hit"] += 1
+            return False
+        if name_allow.lengths:
+            if not name_allow.match(local_name):
+                counters["name_allow_miss"] += 1
+                return False
+            counters["name_allow_hit"] += 1
+        counters["passed"] += 1
+        return True
@@ -0,0 +1,170 @@
+#############################################################################
+# ble_scanner module
+#############################################################################
+
+import logging
+import asyncio
+import threading
+from .ble_filter import AdvertisementFilter
+from .ble_backends import BleakBackend
+from .metrics import PipelineMetrics, MetricsExporter
+from .ble_capture import CaptureWriter
+
+
+class BleakScannerEngine:
+    """
+    BLE scanning logic without GUI (mixin): scanner backend, MAC/name
+    filter and bleak_advertising() hook. It is used by BleakScannerConstruct
+    and by the headless BleakCapture.
+
+    The advertisements are produced by scanner_backend (a ScannerBackend);
+    when None, BleakBackend (the Bluetooth adapter via bleak) is used.
+    """
+    bleak_stop_event = None
+    bleak_event_loop = None
+    bluetooth_thread = None
+    filter_mac = ""
+    filter_name = ""
+    scanner_backend = None
+    metrics = None
+
+    def init_scanner(
+            self,
+            filter_mac_file=None,
+            bleak_scanner_kwargs=None,
+            scanner_backend=None,
+            metrics_file=None,
+            metrics_interval=10):
+        self.scanner_backend = scanner_backend
+        if self.metrics is None:
+            self.metrics = PipelineMetrics()
+        self.metrics_exporter = (
+            MetricsExporter(self.metrics, metrics_file, metrics_interval)
+            if metrics_file else None
+        )
+        self.filter_mac_files = (
+            [filter_mac_file] if isinstance(filter_mac_file, str)
+            else list(filter_mac_file or [])
+        )
+        self.adv_filter = AdvertisementFilter()
+        self.compile_filter()
+        self.bleak_scanner_kwargs = (
+            bleak_scanner_kwargs if bleak_scanner_kwargs else {}
+        )
+        self.adv_context = threading.local()
+
+    def compile_filter(self):
+        try:
+            self.adv_filter.compile(
+                self.filter_mac, self.filter_name, self.filter_mac_files)
+        except OSError as e:
+            logging.error("Cannot read the MAC filter file: %s", e)
+            self.adv_filter.compile(self.filter_mac, self.filter_name)
+
+    def filter_stats(self):
+        """Hit/miss counters of the MAC and local name filters."""
+        return self.adv_filter.stats()
+
+    def process_advertisement(
+            self, device, advertisement_data, timestamp=None):
+        """
+        Pass an advertisement to bleak_advertising(). If timestamp is set,
+        it is used by add_packet_frame() in place of the current time (e.g.,
+        when loading a capture file).
+        """
+        self.adv_context.timestamp = timestamp
+        try:
+            self.bleak_advertising(device, advertisement_data)
+        finally:
+            self.adv_context.timestamp = None
+
+    def get_adv_timestamp(self):
+        """Timestamp of the advertisement being processed, or None"""
+        return getattr(self.adv_context, "timestamp", None)
+
+    async def bt_adv(self, bleak_scanner_kwargs):
+        self.bleak_stop_event = asyncio.Event()
+        self.bleak_event_loop = asyncio.get_event_loop()
+
+        def detection_callback(device, advertisement_data):
+            self.metrics.incr("received")
+            if not self.adv_filter.match(
+                    device.address, advertisement_data.local_name):
+                self.metrics.incr("filtered")
+                return
+            self.bleak_advertising(device, advertisement_data)
+
+        backend = self.scanner_backend or BleakBackend(bleak_scanner_kwargs)
+        try:
+            await backend.scan(detection_callback, self.bleak_stop_event)
+        except backend.unavailable_errors() as e:
+            logging.critical("Critical error: Bluetooth not available. %s", e)
+            await self.on_bluetooth_error(e)
+        logging.warning("BLE thread stopped.")
+
+    async def on_bluetooth_error(self, error):
+        """Called by bt_adv() when Bluetooth is not available."""
+
+    # This method must be overridden
+    def bleak_advertising(self, device, advertisement_data):
+        logging.info(
+            "Advertising: device=%s, advertisement_data=%s",
+            device, advertisement_data
+        )
+
+
+class BleakCapture(BleakScannerEngine):
+    """
+    Headless BLE capture: filtered advertisements are appended to a capture
+    file (see CaptureWriter), without any GUI. The capture file can be
+    loaded later into BleakScannerConstruct.
+
+    bleak_advertising() can be overridden to select the advertisements to
+    be saved with write_advertisement().
+    """
+
+    def __init__(
+            self,
+            capture_file,
+            filter_mac="",
+            filter_name="",
+            filter_mac_file=None,
+            bleak_scanner_kwargs=None,
+            scanner_backend=None,
+            metrics_file=None,
+            metrics_interval=10):
+        self.capture_file = capture_file
+        self.filter_mac = filter_mac or ""
+        self.filter_name = filter_name or ""
+        self.writer = None
+        self.init_scanner(
+            filter_mac_file,
+            bleak_scanner_kwargs,
+            scanner_backend,
+            metrics_file,
+            metrics_interval)
+
+    def bleak_advertising(self, device, advertisement_data):
+        self.write_advertisement(device, advertisement_data)
+
+    def write_advertisement(self, device, advertisement_data):
+        self.writer.write(
+            device, advertisement_data, timestamp=self.get_adv_timestamp())
+        self.metrics.incr("inserted")
+
+    def run(self):
+        """Capture until interrupted (Ctrl-C); return the written records."""
+        with CaptureWriter(self.capture_file) as self.writer:
+            logging.warning("Capturing to '%s'.", self.capture_file)
+            if self.metrics_exporter:
+                self.metrics_exporter.start()
+            try:
+                asyncio.run(self.bt_adv(self.bleak_scanner_kwargs))
+            except KeyboardInterrupt:
+                pass
+            if self.metrics_exporter:
+                self.metrics_exporter.stop()
+            logging.warning(
+                "Captured %s advertisements. Filter counters: %s",
+                self.writer.written, self.filter_stats())
+        return self.writer.written
@@ -5,16 +5,18 @@
 #############################################################################
 
 import logging
-import re
 import asyncio
-from functools import partial
+import time
 from threading import Thread
-import subprocess
+from datetime import datetime, timezone
 import wx
 from .wx_logging_plugin import WxLogging
-from bleak import BleakScanner, BleakError  # pip3 install bleak
+from .wx_metrics_plugin import MetricsWindow
+from .ingestion import IngestionQueue, DuplicateSuppressor
+from .ble_scanner import BleakScannerEngine  # pip3 install bleak
+from .ble_capture import is_capture_file, CaptureReplay
+from .parse_worker import ParseWorkerPool
 from construct_gallery import ConstructGallery
-import bleak
 
 
 class FilterEntryDialog(wx.Dialog):
@@ -55,7 +57,9 @@ class FilterEntryDialog(wx.Dialog):
         sizer.Add(box, 0, wx.GROW | wx.ALL, 5)
 
         label = wx.StaticText(
-            self, -1, "Multiple elements are allowed (separated by comma).")
+            self, -1,
+            "Multiple elements are allowed (separated by comma). "
+            "Prefix an element with ! to exclude it.")
         sizer.Add(label, 0, wx.ALIGN_RIGHT | wx.ALL, 15)
 
         sizer.Add(buttons, 0, wx.EXPAND | wx.ALL, 5)
@@ -76,19 +80,21 @@ class FilterEntryDialog(wx.Dialog):
         return self.name_input.GetValue()
 
 
-class BleakScannerConstruct(ConstructGallery):
+class BleakScannerConstruct(ConstructGallery, BleakScannerEngine):
     BLEAK_IS_USED = True  # it means this class is valid and bleak is installed
-    bleak_stop_event = None
-    bleak_event_loop = None
-    bluetooth_thread = None
-    filter_mac = ""
-    filter_name = ""
+    data_file_wildcard = (
+        "Pickle files (*.pickle)|*.pickle|"
+        "Journal files (*.journal)|*.journal|"
+        "Archive files (*.archive)|*.archive|"
+        "Capture files (*.jsonl)|*.jsonl|All files|*.*"
+    )
 
     def __init__(
             self,
             *args,
             filter_hint_mac=None,
             filter_hint_name=None,
+            filter_mac_file=None,  # file of MAC prefixes (one per line)
             reference_label="MAC address",
             load_menu_label="Log Data and Configuration",
             clear_label="Log Data",
@@ -96,6 +102,15 @@ class BleakScannerConstruct(ConstructGallery):
             logging_plugin=True,
             auto_ble_start=False,
             bleak_scanner_kwargs=None,  # this allows to pass configuration options to the bleak scanner
+            flush_interval=100,  # milliseconds between two insertions of queued packets into the gallery
+            max_batch_size=500,  # maximum number of queued packets inserted at each flush
+            dedup_mode=None,  # None, "change" or "window" (see DuplicateSuppressor)
+            dedup_window=1000,  # milliseconds, used by dedup_mode="window"
+            scanner_backend=None,  # ScannerBackend; None uses bleak (BleakBackend)
+            parse_workers=0,  # number of workers pre-parsing the packets (0 = disabled)
+            parse_processes=False,  # use processes instead of threads for parse_workers
+            metrics_file=None,  # JSON Lines file where metrics are periodically appended
+            metrics_interval=10,  # seconds between two metrics exports
             **kwargs  # this allows to add all ConstructGallery arguments
     ):
         super().__init__(  # ConstructGallery initialization
@@ -107,10 +122,43 @@ class BleakScannerConstruct(ConstructGallery):
             **kwargs)
         self.filter_hint_mac = filter_hint_mac
         self.filter_hint_name = filter_hint_name
-        bleak_scanner_kwargs = (
-            bleak_scanner_kwargs if bleak_scanner_kwargs else {}
+        self.init_scanner(
+            filter_mac_file,
+            bleak_scanner_kwargs,
+            scanner_backend,
+            metrics_file,
+            metrics_interval)
+
+        # Ingestion queue filled by the BLE thread and drained by a timer
+        self.ingestion_queue = IngestionQueue(max_batch_size, self.metrics)
+        self.flush_interval = flush_interval
+        self.flush_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_flush_timer, self.flush_timer)
+        self.flush_timer.Start(self.flush_interval)
+        self.duplicate_suppressor = DuplicateSuppressor(
+            dedup_mode, dedup_window)
+        self.parse_pool = (
+            ParseWorkerPool(
+                parse_workers,
+                parse_processes,
+                self.gallery_dict.context_factories)
+            if parse_workers else None
         )
-        self.bleak_scanner_kwargs = bleak_scanner_kwargs
+        # construct of the parse jobs, read from the editor by the GUI thread
+        self.parse_construct = None
+        self.replay = None
+        self.replay_inserted = 0  # "inserted" counter when replay started
+        self.replay_stats = {}
+        self.metrics.add_gauge(
+            "queue_depth", lambda: self.ingestion_queue.depth)
+        self.metrics.add_gauge("gallery_size", self.gallery_dict.len)
+        if self.parse_pool:
+            self.metrics.add_gauge(
+                "parse_backlog",
+                lambda: self.parse_pool.submitted - self.parse_pool.parsed)
+        self.metrics_window = None
+        if self.metrics_exporter:
+            self.metrics_exporter.start()
 
         # Start and stop buttons
         control_sizer = wx.StaticBoxSizer(
@@ -127,6 +175,11 @@ class BleakScannerConstruct(ConstructGallery):
         self.filterButton.Bind(wx.EVT_BUTTON, self.on_filter)
         control_sizer.Add(self.filterButton, 1, wx.EXPAND | wx.CENTER, 5)
 
+        # Metrics button
+        self.metricsButton = wx.Button(self, wx.ID_ANY, label="Metrics")
+        self.metricsButton.Bind(wx.EVT_BUTTON, self.on_metrics)
+        control_sizer.Add(self.metricsButton, 1, wx.EXPAND | wx.CENTER, 5)
+
         self.stopButton = wx.Button(self, wx.ID_ANY, label="Stop")
         self.stopButton.Enable(False)
         self.stopButton.Bind(wx.EVT_BUTTON, lambda event: self.ble_stop())
@@ -142,8 +195,100 @@ class BleakScannerConstruct(ConstructGallery):
         if auto_ble_start:
             wx.CallLater(200, self.ble_start)
 
-    def add_packet_frame(self, *args, **kwargs):
-        return wx.CallAfter(self.add_data, *args, **kwargs)
+    def add_packet_frame(
+            self,
+            data,
+            reference=None,
+            label=None,
+            append_label=None,
+            discard_duplicates=False,
+            date_separator=" ",
+            duplicate_separator="-"):
+        """
+        Queue a packet for the gallery. This method can be called by any
+        thread; the timestamp of the label is the one of the reception (or
+        the original one, when loading a capture file).
+        Repeated payloads are dropped here, depending on dedup_mode; with
+        parse_workers, the payload is submitted to the parse workers and the
+        packet is inserted when its parsing is completed.
+        """
+        timestamp = self.get_adv_timestamp() or datetime.now(timezone.utc)
+        if not self.duplicate_suppressor.accept(
+                reference, data, append_label, now=timestamp.timestamp()):
+            self.metrics.incr("deduplicated")
+            return
+        packet = {
+            "data": data,
+            "reference": reference,
+            "label": label,
+            "append_label": append_label,
+            "discard_duplicates": discard_duplicates,
+            "date_separator": date_separator,
+            "duplicate_separator": duplicate_separator,
+            "timestamp": timestamp,
+        }
+        construct = self.parse_construct
+        if self.parse_pool and construct is not None:
+            contextkw = self.gallery_dict.get_reference_contextkw(reference)
+            if contextkw is not None:
+                packet["parse_job"] = self.parse_pool.submit(
+                    construct, data, contextkw)
+        self.ingestion_queue.put(packet)
+        self.metrics.incr("queued")
+
+    def on_flush_timer(self, event):
+        if self.parse_pool and self.construct_hex_editor:
+            self.parse_construct = self.construct_hex_editor.construct
+        if not self.flush_packet_frames():
+            self.apply_retention()  # age limit without incoming packets
+            # flush_packet_frames() also returns 0 while the first queued
+            # packet is being parsed: the parse jobs of the replayed packets
+            # are completed when the queue is empty
+            if (self.replay and not self.replay.is_alive() and
+                    not self.ingestion_queue.depth):
+                self.end_replay()
+
+    def flush_packet_frames(self):
+        """Insert a batch of queued packets into the gallery."""
+        if self.parse_pool:
+            return self.ingestion_queue.flush(
+                self.add_parsed_data_list, ready=self.is_packet_parsed)
+        return self.ingestion_queue.flush(self.add_data_list)
+
+    @staticmethod
+    def is_packet_parsed(packet):
+        job = packet.get("parse_job")
+        return job is None or job.future.done()
+
+    def add_parsed_data_list(self, packets):
+        """add_data_list() of packets with the results of the parse workers"""
+        for packet in packets:
+            job = packet.pop("parse_job", None)
+            if job is not None:
+                packet["parsed"] = self.parse_pool.collect(job)
+                if packet["parsed"] is not None:
+                    self.metrics.observe(
+                        "parse_time", packet["parsed"].duration)
+        return self.add_data_list(packets)
+
+    def suppressed_counts(self):
+        """Number of duplicated packets suppressed for each reference."""
+        return self.duplicate_suppressor.suppressed_counts()
+
+    @property
+    def queue_depth(self):
+        """Number of received packets not yet inserted into the gallery."""
+        return self.ingestion_queue.depth
+
+    @property
+    def flush_latency(self):
+        """Reception-to-insertion delay (seconds) of the last flushed batch."""
+        return self.ingestion_queue.flush_latency
+
+    def on_metrics(self, event):
+        if not self.metrics_window:
+            self.metrics_window = MetricsWindow(self, self.metrics)
+        self.metrics_window.show()
 
     def on_filter(self, event):
         mac = None
@@ -166,12 +311,14 @@ class BleakScannerConstruct(ConstructGallery):
             self.filter_mac = mac
         if name is not None:
             self.filter_name = name
+        self.compile_filter()
 
     def ble_start(self, bleak_scanner_kwargs=None):
         if bleak_scanner_kwargs is None:
             bleak_scanner_kwargs = self.bleak_scanner_kwargs
         if self.bluetooth_thread and self.bluetooth_thread.is_alive():
             return
+        self.compile_filter()
         self.bluetooth_thread = Thread(
             target=lambda: asyncio.run(self.bt_adv(bleak_scanner_kwargs)))
         logging.warning("BLE thread started.")
@@ -193,93 +340,90 @@ class BleakScannerConstruct(ConstructGallery):
             self.bluetooth_thread.join(1)
         self.startButton.Enable(True)
         self.stopButton.Enable(False)
-        logging.warning("stop")
+        logging.warning(
+            "stop. Filter counters: %s. Suppressed duplicates: %s",
+            self.filter_stats(), self.suppressed_counts())
         self.status_message(f"BLE stopped.")
 
     def on_application_close(self):
+        self.close_journal()
+        self.gallery_dict.close_archives()
         self.ble_stop()
+        self.stop_replay()
+        self.flush_timer.Stop()
+        self.gallery_dict.close()
+        self.stop_background_parsing()
+        if self.parse_pool:
+            self.parse_pool.shutdown()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
         if hasattr(self, 'pyshell') and self.pyshell:
             self.pyshell.Destroy()
 
-    async def bt_adv(self, bleak_scanner_kwargs):
-        self.bleak_stop_event = asyncio.Event()
-        self.bleak_event_loop = asyncio.get_event_loop()
-
-        def detection_callback(device, advertisement_data):
-            found = False
-            i = None
-            for i in re.split('; |, ', self.filter_mac):
-                if i and device.address.upper().startswith(i.upper()):
-                    found = True
-                    break
-            if i and not found:
-                return
-            found = False
-            for i in re.split('; |, ', self.filter_name):
-                if (i and advertisement_data.local_name and
-                        advertisement_data.local_name.startswith(i)):
-                    found = True
-                    break
-            if i and not found:
-                return
-            self.bleak_advertising(device, advertisement_data)
-
-        scanning_mode = bleak_scanner_kwargs.get('scanning_mode')
-        if (
-            scanning_mode
-            and scanning_mode.lower() == 'passive'
-            and "BleakScannerBlueZDBus" in str(
-                bleak.get_platform_scanner_backend_type()
-            )
-        ):
-            from bleak.assigned_numbers import AdvertisementDataType
-            from bleak.backends.bluezdbus.advertisement_monitor import OrPattern
-            from bleak.backends.bluezdbus.scanner import (
-                BlueZScannerArgs, BlueZDiscoveryFilters
-            )
-            ble_z_args = {
-                'bluez': BlueZScannerArgs(
-                    or_patterns=[
-                        OrPattern(0, AdvertisementDataType.FLAGS, b"\x06"),
-                        OrPattern(0, AdvertisementDataType.FLAGS, b"\x1a"),
-                    ]
-                )
-            }
-            bleak_scanner_kwargs = {**bleak_scanner_kwargs, **ble_z_args}
-        try:
-            async with BleakScanner(
-                detection_callback=partial(detection_callback),
-                **bleak_scanner_kwargs
-            ) as scanner:
-                if (
-                    scanning_mode
-                    and scanning_mode.lower() == 'passive'
-                    and "BleakScannerBlueZDBus" in str(
-                        bleak.get_platform_scanner_backend_type()
-                    )
-                ):  # https://stackoverflow.com/questions/55336017/disable-filter-duplicates-setting-for-le-set-scan-enable-command
-                    subprocess.run(  # Disable the 'Filter duplicates' kernel setting when the bluez Advertising Monitor is enabled
-                        "which hcitool"
-                        " && sudo -n hcitool cmd 0x08 0x000C 0x00 0x00"  # Scan disabled (needed)
-                        " && sudo -n hcitool cmd 0x08 0x000C 0x01 0x00",  # Scan enabled, disabling Filter duplicates
-                        shell=True,
-                        capture_output=True
-                    )
-                await self.bleak_stop_event.wait()
-        except (FileNotFoundError, BleakError) as e:
-            logging.critical("Critical error: Bluetooth not available. %s", e)
-            self.stopButton.Enable(False)
-            self.startButton.Enable(True)
-            await asyncio.sleep(0.5)
-            wx.CallAfter(
-                self.status_message,
-                f"Critical error: Bluetooth not available. {str(e)}"
-            )
-        logging.warning("BLE thread stopped.")
+    async def on_bluetooth_error(self, error):
+        self.stopButton.Enable(False)
+        self.startButton.Enable(True)
+        await asyncio.sleep(0.5)
+        wx.CallAfter(
+            self.status_message,
+            f"Critical error: Bluetooth not available. {str(error)}"
+        )
 
-    # This method must be overridden
-    def bleak_advertising(self, device, advertisement_data):
-        logging.info(
-            "Advertising: device=%s, advertisement_data=%s",
-            device, advertisement_data
+    def load_data_file(self, pathname):
+        if is_capture_file(pathname):
+            return self.load_capture(pathname)
+        return super().load_data_file(pathname)
+
+    def load_capture(self, pathname):
+        """Load a capture file written by BleakCapture (maximum speed)."""
+        return self.replay_capture(pathname, speed=0)
+
+    def replay_capture(self, pathname, speed=1.0):
+        """
+        Replay a capture file written by BleakCapture: each advertisement is
+        passed to bleak_advertising() with its original timestamp, in real
+        time (speed=1), accelerated (speed=N) or unthrottled (speed=0).
+        At the end, the ingestion rate achieved by the gallery is shown.
+        """
+        if self.replay and self.replay.is_alive():
+            self.replay.stop()
+            self.replay.thread.join(1)
+        self.replay = CaptureReplay(
+            pathname,
+            lambda timestamp, device, advertisement_data:
+                self.process_advertisement(
+                    device, advertisement_data, timestamp=timestamp),
+            speed=speed
+        )
+        self.replay_inserted = self.metrics.counters["inserted"]
+        title = self.GetTopLevelParent().GetTitle()
+        self.GetTopLevelParent().SetTitle(str(pathname) + " | " + title)
+        self.status_message(f"Replaying {pathname}...")
+        self.replay.start()
+
+    def stop_replay(self):
+        if self.replay:
+            self.replay.stop()
+
+    def end_replay(self):
+        """Called when the replay ended and all packets were inserted."""
+        replay = self.replay
+        self.replay = None
+        if replay.error:
+            wx.LogError("Cannot open file '%s'." % str(replay.filename))
+            return
+        elapsed = time.monotonic() - replay.start_time
+        # new elements (not the duplicates or the upserted elements)
+        inserted = self.metrics.counters["inserted"] - self.replay_inserted
+        self.replay_stats = {
+            **replay.stats(),
+            "inserted": inserted,
+            "ingest_elapsed": elapsed,
+            "ingest_rate": inserted / elapsed if elapsed else 0.0,
+        }
+        logging.warning("Replay completed: %s", self.replay_stats)
+        self.status_message(
+            f"Replayed {replay.replayed} advertisements: "
+            f"{inserted} elements inserted in {elapsed:.2f} s "
+            f"({self.replay_stats['ingest_rate']:.0f} elements/s)."
         )
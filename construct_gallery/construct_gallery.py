@@ -6,9 +6,11 @@
 
 # Base modules
 import importlib.util
+import copy
+import gc
 from datetime import datetime, timezone
 import pickle
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from pathlib import Path
 import sys
 import typing as t
@@ -16,6 +18,7 @@ from types import TracebackType, ModuleType
 import re
 import dataclasses
 import time
+import threading
 
 # wx module
 import wx
@@ -40,6 +43,18 @@ from . import allow_python_expr_plugin
 from . import decimal_convert_plugin
 from . import string_convert_plugin
 from . import edit_plugin
+from .ingestion import RetentionPolicy
+from .metrics import PipelineMetrics
+from .parse_worker import ParseWorkerPool, clear_context_objects
+from .parse_cache import ParseCache
+from .tree_expansion import ExpansionPolicy
+from .payload_pool import PayloadPool, PayloadArena
+from .label_index import StoreLabels
+from .wx_gallery_list import GalleryListBox, GalleryListCtrl
+from .journal import GalleryJournal, is_journal_file, read_journal
+from .archive import (
+    ArchivePayload, GalleryArchive, is_archive_file, write_archive
+)
 
 
 @dataclasses.dataclass
@@ -79,41 +94,136 @@ class HexEditorGrid(  # add plugins to HexEditorGrid
         return menus
 
 
+class GalleryRecord:
+    """Element of GalleryDict: payload and optional reference."""
+    __slots__ = ("binary", "reference")
+
+    def __init__(self, binary, reference=None):
+        self.binary = binary
+        self.reference = reference
+
+
 class GalleryDict(object):
-    @classmethod
-    def init(cls, reference_label, key_label, description_label):
-        cls.gallery_history = {}
-        cls.key_descr_dict = {}
-        cls.reference_label = reference_label
-        cls.key_label = key_label
-        cls.description_label = description_label
-        cls.fixed_contextkw = {}
-
-    @classmethod
-    def set_fixed_contextkw(cls, fixed_contextkw):
+    """
+    Elements of a gallery (label -> GalleryRecord) and key/description of
+    each reference. Each ConstructGallery owns its GalleryDict, so several
+    galleries can be used in the same process.
+
+    Elements are stored as GalleryRecord objects (with __slots__) and
+    references are interned, so that the memory used by each element is
+    small; the field names used in the contextkw, in data files and in
+    ordered_sample_bin_ref (e.g., "mac_address" for the "MAC address"
+    reference label) are computed once.
+
+    Identical payloads share a single bytes object of a PayloadPool, which
+    counts the references to each payload (payload_stats() returns the
+    dedup ratio). With arena, payloads are stored in a PayloadArena and the
+    binary of each record is the span of its payload in the arena;
+    get_payload() returns a memoryview of it and get_binary() a copy.
+
+    The contextkw of each reference (and the objects derived from it, e.g.
+    cipher contexts, see get_context_object()) is resolved once and cached
+    until the key or the description of the reference change.
+    context_factories is a dictionary of name -> factory(contextkw): the
+    object returned by each factory (e.g., a cipher initialized with the
+    key) is added to the contextkw with that name, so that constructs can
+    use it without initializing it again for each payload.
+
+    If journal (a GalleryJournal) is set, all changes are appended to it.
+    The binary of the elements loaded from a GalleryArchive is an
+    ArchivePayload, read from the archive by get_binary().
+    """
+
+    def __init__(
+            self,
+            reference_label,
+            key_label,
+            description_label,
+            arena=False,
+            context_factories=None):
+        self.gallery_history = {}
+        self.payloads = PayloadArena() if arena else PayloadPool()
+        self.key_descr_dict = {}
+        self.journal = None
+        self.archives = []  # open GalleryArchive objects
+        self.reference_label = reference_label
+        self.key_label = key_label
+        self.description_label = description_label
+        self.fixed_contextkw = {}
+        self.contextkw_cache = {}  # reference -> contextkw
+        self.context_objects = {}  # reference -> {name: derived object}
+        self.contextkw_lock = threading.Lock()
+        self.context_factories = context_factories or {}
+        self.ref_elm = self.field_name(reference_label)
+        self.key_elm = self.field_name(key_label)
+        self.descr_elm = self.field_name(description_label)
+
+    @staticmethod
+    def field_name(label):
+        if not label:
+            return None
+        return label.lower().replace(" ", "_")
+
+    def set_fixed_contextkw(self, fixed_contextkw):
         """
         If set with a construct dictionary, the contextkw remains fixed for any
         element of the gallery item, until the gallery item changes. Otherwise,
         if fixed_contextkw is {}, dynamic mode is used (key and description
         changes for each reference).
         """
-        cls.fixed_contextkw = fixed_contextkw
+        if fixed_contextkw != self.fixed_contextkw:
+            self.invalidate_contextkw()
+        self.fixed_contextkw = fixed_contextkw
+
+    def invalidate_contextkw(self, reference=None):
+        """
+        Drop the cached contextkw (and derived objects) of a reference, or
+        of all references; the context objects of the parse workers (see
+        clear_context_objects()) are all dropped.
+        """
+        with self.contextkw_lock:
+            if reference is None:
+                self.contextkw_cache = {}
+                self.context_objects = {}
+            else:
+                self.contextkw_cache.pop(reference, None)
+                self.context_objects.pop(reference, None)
+        clear_context_objects()  # objects of the parse workers
+
+    def cache_contextkw(self, reference, contextkw, key_descr):
+        """Cache contextkw, unless key_descr changed while computing it."""
+        with self.contextkw_lock:
+            if self.key_descr_dict.get(reference, {}) == key_descr:
+                self.contextkw_cache[reference] = contextkw
+
+    def get_contextkw(self, element):
+        if self.fixed_contextkw:
+            return self.fixed_contextkw
+        if not self.key_label:
+            return {}
+        _, reference = self.get_reference(element)
+        if not reference:
+            return {}
+        contextkw = self.contextkw_cache.get(reference)
+        if contextkw is None:
+            key_descr = dict(self.key_descr_dict.get(reference, {}))
+            contextkw = self.resolve_contextkw(element)
+            if contextkw:
+                self.cache_contextkw(reference, contextkw, key_descr)
+        return contextkw
 
-    @classmethod
-    def get_contextkw(cls, element):
-        if cls.fixed_contextkw:
-            return cls.fixed_contextkw
-        ref_elm, reference, key_elm, key = GalleryDict.get_key(element)
+    def resolve_contextkw(self, element):
+        ref_elm, reference, key_elm, key = self.get_key(element)
         if not reference:
             return {}
-        _, _, descr_elm, description = GalleryDict.get_description(element)
+        _, _, descr_elm, description = self.get_description(element)
         try:
             ref_elm_value = bytes.fromhex(re.sub(r'[.:\- ]', '', reference))
         except Exception as e:
             dlg = wx.MessageDialog(
                 None,
                 ref_elm + ' value is "' + reference + '": ' + str(e),
-                "Invalid data in " + cls.reference_label,
+                "Invalid data in " + self.reference_label,
                 wx.OK | wx.ICON_WARNING
             )
             dlg.ShowModal()
@@ -125,7 +235,7 @@ class GalleryDict(object):
             dlg = wx.MessageDialog(
                 None,
                 key_elm + ' value is "' + key + '": ' + str(e),
-                "Invalid data in " + cls.key_label,
+                "Invalid data in " + self.key_label,
                 wx.OK | wx.ICON_WARNING
             )
             dlg.ShowModal()
@@ -138,99 +248,253 @@ class GalleryDict(object):
         }
         if None in contextkw:
             contextkw.pop(None)
+        try:
+            self.add_context_objects(contextkw)
+        except Exception as e:
+            dlg = wx.MessageDialog(
+                None,
+                ref_elm + ' value is "' + reference + '": ' + str(e),
+                "Invalid " + self.key_label,
+                wx.OK | wx.ICON_WARNING
+            )
+            dlg.ShowModal()
+            dlg.Destroy()
+            return {}
         return contextkw
 
-    @classmethod
-    def get_key_descr_dict(cls):
-        return cls.key_descr_dict
-
-    @classmethod
-    def set_key_descr_dict(cls, key_descr_dict):
-        cls.key_descr_dict = key_descr_dict
-
-    @classmethod
-    def update_key_descr_dict(cls, key_descr_dict):
-        cls.key_descr_dict = {**cls.key_descr_dict, **key_descr_dict}
-
-    @classmethod
-    def reset(cls):
-        cls.gallery_history = {}
+    def add_context_objects(self, contextkw):
+        for name, factory in self.context_factories.items():
+            contextkw[name] = factory(dict(contextkw))
 
-    @classmethod
-    def update_dict(cls, additional_dict):
-        return cls.gallery_history.update(additional_dict)
-
-    @classmethod
-    def exists(cls, element):
-        return element in cls.gallery_history
+    def get_reference_contextkw(self, reference):
+        """
+        Like get_contextkw(), but computed from the reference of an element
+        not yet stored and without dialogs, so that it can be used by any
+        thread. Return None if the reference or the key are invalid.
+        """
+        if self.fixed_contextkw:
+            return self.fixed_contextkw
+        if not self.ref_elm or not self.key_elm or not reference:
+            return {}
+        contextkw = self.contextkw_cache.get(reference)
+        if contextkw is not None:
+            return contextkw
+        key_descr = dict(self.key_descr_dict.get(reference, {}))
+        try:
+            contextkw = {
+                self.ref_elm: bytes.fromhex(
+                    re.sub(r'[.:\- ]', '', reference)),
+                self.key_elm: bytes.fromhex(key_descr.get(self.key_elm, "")),
+            }
+        except (TypeError, ValueError):
+            return None
+        if self.descr_elm:
+            contextkw[self.descr_elm] = key_descr.get(self.descr_elm, "")
+        try:
+            self.add_context_objects(contextkw)
+        except Exception:
+            return None
+        self.cache_contextkw(reference, contextkw, key_descr)
+        return contextkw
 
-    @classmethod
-    def len(cls):
-        return len(cls.gallery_history)
+    def peek_contextkw(self, element):
+        """
+        Like get_contextkw(), but without dialogs (e.g., for background
+        parsing): return None if the contextkw of element is invalid.
+        """
+        _, reference = self.get_reference(element)
+        return self.get_reference_contextkw(reference)
 
-    @classmethod
-    def get_binary(cls, element):
-        if element not in cls.gallery_history:
+    def get_context_object(self, reference, name, factory):
+        """
+        Return an object derived from the contextkw of reference (e.g., a
+        cipher context initialized with the key), created by
+        factory(contextkw) and cached with the contextkw. Return None if the
+        contextkw is invalid. Can be used by any thread.
+        """
+        objects = self.context_objects.get(reference)
+        if objects is not None and name in objects:
+            return objects[name]
+        contextkw = self.get_reference_contextkw(reference)
+        if not contextkw:
             return None
-        value = cls.gallery_history[element]
-        if isinstance(value, dict) and "binary" in value:
-            value = value["binary"]
-        if isinstance(value, bytes):
+        context_object = factory(contextkw)
+        with self.contextkw_lock:
+            if (contextkw is self.fixed_contextkw or
+                    self.contextkw_cache.get(reference) is contextkw):
+                self.context_objects.setdefault(reference, {})[
+                    name] = context_object
+        return context_object
+
+    def get_key_descr_dict(self):
+        return self.key_descr_dict
+
+    def set_key_descr_dict(self, key_descr_dict):
+        self.key_descr_dict = key_descr_dict
+        self.invalidate_contextkw()
+        if self.journal:
+            self.journal.set_key_descr(key_descr_dict)
+
+    def update_key_descr_dict(self, key_descr_dict):
+        self.key_descr_dict = {**self.key_descr_dict, **key_descr_dict}
+        self.invalidate_contextkw()
+        if self.journal:
+            self.journal.set_key_descr(key_descr_dict, replace=False)
+
+    def reset(self):
+        self.gallery_history = {}
+        self.payloads.clear()
+        if self.journal:
+            self.journal.clear()
+        self.close_archives()
+
+    def commit(self):
+        """Complete a batch of changes (used by persistent storages)."""
+        pass
+
+    def close(self):
+        pass
+
+    def close_archives(self):
+        for archive in self.archives:
+            archive.close()
+        self.archives = []
+
+    def make_record(self, value):
+        """
+        Convert an element of a data file or of ordered_sample_bin_ref
+        (a dictionary with "binary" and reference fields, or bytes) into a
+        GalleryRecord.
+        """
+        if isinstance(value, GalleryRecord):
             return value
+        if isinstance(value, tuple):  # (binary, reference) of a journal
+            return GalleryRecord(value[0], self.intern(value[1]))
+        if isinstance(value, dict):
+            reference = value.get(self.ref_elm) if self.ref_elm else None
+            return GalleryRecord(
+                value.get("binary"), self.intern(reference) or None)
+        return GalleryRecord(value)
+
+    @staticmethod
+    def intern(reference):
+        if isinstance(reference, str):
+            return sys.intern(reference)
+        return reference
+
+    def update_dict(self, additional_dict):
+        make_record = self.make_record
+        gc_enabled = gc.isenabled()
+        gc.disable()  # no garbage collections while allocating the records
+        history = self.gallery_history
+        payloads = self.payloads
+        try:
+            for element, value in additional_dict.items():
+                record = make_record(value)
+                record.binary = payloads.add(record.binary)
+                previous = history.get(element)
+                if previous is not None:
+                    payloads.release(previous.binary)
+                history[element] = record
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if payloads.compactable():
+            payloads.compact(history.values())
+        if self.journal:
+            for element in additional_dict:
+                self.write_journal(element)
+
+    def write_journal(self, element):
+        binary = self.get_binary(element)
+        if binary is not None:
+            self.journal.set(
+                element, binary, self.get_reference(element)[1] or None)
+
+    def exists(self, element):
+        return element in self.gallery_history
+
+    def len(self):
+        return len(self.gallery_history)
+
+    def get_binary(self, element):
+        record = self.gallery_history.get(element)
+        if record is None:
+            return None
+        if type(record.binary) is int:  # span of a PayloadArena
+            return bytes(self.payloads.view(record.binary))
+        if isinstance(record.binary, ArchivePayload):
+            return record.binary.load()
+        if not isinstance(record.binary, bytes):
+            return None
+        return record.binary
+
+    def get_payload(self, element):
+        """Like get_binary(), but a payload of an arena is a memoryview."""
+        record = self.gallery_history.get(element)
+        if record is not None and type(record.binary) is int:
+            return self.payloads.view(record.binary)
+        return self.get_binary(element)
+
+    def get_length(self, element):
+        """Length of the payload of an element, without loading it."""
+        record = self.gallery_history.get(element)
+        if record is None:
+            return None
+        if type(record.binary) is int:
+            return record.binary & 0xFFFFFFFF
+        return len(record.binary)
+
+    def get_timestamp(self, element):
+        """Time when the element was stored (None if not recorded)."""
         return None
 
-    @classmethod
-    def set(cls, element, binary, reference=None):
-        if not cls.gallery_history:
-            cls.gallery_history = {element: {"binary": binary}}
-            GalleryDict.set_reference(element, reference)
-            return
-        if GalleryDict.exists(element):
-            value = cls.gallery_history[element]
-            if isinstance(value, dict):
-                if "binary" in value:
-                    cls.gallery_history[element]["binary"] = binary
-                    GalleryDict.set_reference(element, reference)
-                    return
-        cls.gallery_history[element] = {"binary": binary}
-        GalleryDict.set_reference(element, reference)
+    def release_payload(self, binary):
+        self.payloads.release(binary)
+        if self.payloads.compactable():
+            self.payloads.compact(self.gallery_history.values())
 
-    @classmethod
-    def get_reference(cls, element):
-        if not cls.reference_label:
+    def set(self, element, binary, reference=None, timestamp=None):
+        record = self.gallery_history.get(element)
+        if record is None:
+            record = self.gallery_history[element] = GalleryRecord(
+                self.payloads.add(binary))
+        else:
+            previous = record.binary
+            record.binary = self.payloads.add(binary)
+            self.release_payload(previous)
+        if reference and self.reference_label:
+            record.reference = self.intern(reference)
+        if self.journal:
+            self.write_journal(element)
+
+    def get_reference(self, element):
+        if not self.reference_label:
             return None, None
-        ref_elm = cls.reference_label.lower().replace(" ", "_")
-        if element not in cls.gallery_history:
-            return ref_elm, None
-        if (isinstance(cls.gallery_history[element], dict) and
-                ref_elm in cls.gallery_history[element]):
-            return ref_elm, cls.gallery_history[element][ref_elm]
-        return ref_elm, ""
+        record = self.gallery_history.get(element)
+        if record is None:
+            return self.ref_elm, None
+        return self.ref_elm, record.reference or ""
 
-    @classmethod
-    def set_reference(cls, element, reference):
-        if not cls.reference_label:
+    def set_reference(self, element, reference):
+        if not self.reference_label:
             return
         if not reference:
             return
-        if element not in cls.gallery_history:
+        record = self.gallery_history.get(element)
+        if record is None:
             return
-        elm_dict = cls.gallery_history[element]
-        if not isinstance(elm_dict, dict):
-            binary = elm_dict
-            elm_dict = {"binary": binary}
-        ref_elm = cls.reference_label.lower().replace(" ", "_")
-        elm_dict[ref_elm] = reference
-        cls.gallery_history[element] = elm_dict
+        record.reference = self.intern(reference)
+        if self.journal:
+            self.write_journal(element)
 
-    @classmethod
-    def reference_exists(cls, element, interactive=False):
-        ref_elm, reference = GalleryDict.get_reference(element)
+    def reference_exists(self, element, interactive=False):
+        ref_elm, reference = self.get_reference(element)
         if not reference and interactive:
             dlg = wx.MessageDialog(
                 None,
-                "Add the " + cls.reference_label + " first.",
-                "The " + cls.reference_label + " of this element is missing",
+                "Add the " + self.reference_label + " first.",
+                "The " + self.reference_label + " of this element is missing",
                 wx.OK | wx.ICON_WARNING
             )
             dlg.ShowModal()
@@ -238,79 +502,127 @@ class GalleryDict(object):
             return ref_elm, None
         return ref_elm, reference
 
-    @classmethod
-    def get_key(cls, element, interactive=False):
-        if not cls.key_label:
+    def get_key(self, element, interactive=False):
+        if not self.key_label:
             return None, None, None, None
-        ref_elm, reference = GalleryDict.reference_exists(element, interactive)
+        ref_elm, reference = self.reference_exists(element, interactive)
         if not reference:
             return None, None, None, None
-        key_elm = cls.key_label.lower().replace(" ", "_")
-        if (reference not in cls.key_descr_dict or
-                key_elm not in cls.key_descr_dict[reference]):
+        key_elm = self.key_elm
+        if (reference not in self.key_descr_dict or
+                key_elm not in self.key_descr_dict[reference]):
             return ref_elm, reference, key_elm, ""
-        return ref_elm, reference, key_elm, cls.key_descr_dict[
+        return ref_elm, reference, key_elm, self.key_descr_dict[
             reference][key_elm]
 
-    @classmethod
-    def set_key(cls, element, key):
-        _, reference, key_elm, prev_key = GalleryDict.get_key(
+    def set_key(self, element, key):
+        _, reference, key_elm, prev_key = self.get_key(
             element, interactive=True)
         if prev_key is None:
             return None
-        if reference not in cls.key_descr_dict:
-            cls.key_descr_dict[reference] = {}
-        cls.key_descr_dict[reference][key_elm] = key
-
-    @classmethod
-    def get_description(cls, element, interactive=False):
-        if not cls.description_label:
+        if reference not in self.key_descr_dict:
+            self.key_descr_dict[reference] = {}
+        self.key_descr_dict[reference][key_elm] = key
+        self.invalidate_contextkw(reference)
+        if self.journal:
+            self.journal.set_key_descr(
+                {reference: self.key_descr_dict[reference]}, replace=False)
+
+    def get_description(self, element, interactive=False):
+        if not self.description_label:
             return None, None, None, None
-        ref_elm, reference = GalleryDict.reference_exists(element, interactive)
+        ref_elm, reference = self.reference_exists(element, interactive)
         if not reference:
             return None, None, None, None
-        description_elm = cls.description_label.lower().replace(" ", "_")
-        if (reference not in cls.key_descr_dict or
-                description_elm not in cls.key_descr_dict[reference]):
+        description_elm = self.descr_elm
+        if (reference not in self.key_descr_dict or
+                description_elm not in self.key_descr_dict[reference]):
             return ref_elm, reference, description_elm, ""
-        return ref_elm, reference, description_elm, cls.key_descr_dict[
+        return ref_elm, reference, description_elm, self.key_descr_dict[
             reference][description_elm]
 
-    @classmethod
-    def set_description(cls, element, description):
-        _, reference, description_elm, prev_descr = GalleryDict.get_description(
+    def set_description(self, element, description):
+        _, reference, description_elm, prev_descr = self.get_description(
             element, interactive=True)
         if prev_descr is None:
             return None
-        if reference not in cls.key_descr_dict:
-            cls.key_descr_dict[reference] = {}
-        cls.key_descr_dict[reference][description_elm] = description
+        if reference not in self.key_descr_dict:
+            self.key_descr_dict[reference] = {}
+        self.key_descr_dict[reference][description_elm] = description
+        self.invalidate_contextkw(reference)
+        if self.journal:
+            self.journal.set_key_descr(
+                {reference: self.key_descr_dict[reference]}, replace=False)
+
+    def delete(self, element):
+        self.release_payload(self.gallery_history.pop(element).binary)
+        if self.journal:
+            self.journal.delete(element)
+
+    def pop(self, element):
+        record = self.gallery_history.pop(element, None)
+        if record is not None:
+            self.release_payload(record.binary)
+            if self.journal:
+                self.journal.delete(element)
+        return record
+
+    def keys(self):
+        return self.gallery_history.keys()
+
+    def labels_by_reference(self, reference, limit=-1):
+        """Labels of the elements of a reference (insertion order)."""
+        labels = [
+            element for element, record in self.gallery_history.items()
+            if record.reference == reference
+        ]
+        return labels if limit < 0 else labels[:limit]
 
-    @classmethod
-    def delete(cls, element):
-        del cls.gallery_history[element]
+    def payload_stats(self):
+        return self.payloads.stats()
 
-    @classmethod
-    def pop(cls, element):
-        return cls.gallery_history.pop(element, None)
+    def to_dict(self, element):
+        """Element in the format of data files: {"binary": ..., ref: ...}"""
+        record = self.gallery_history[element]
+        value = {"binary": self.get_binary(element)}
+        if record.reference and self.ref_elm:
+            value[self.ref_elm] = record.reference
+        return value
 
-    @classmethod
-    def keys(cls):
-        return cls.gallery_history.keys()
+    def snapshot(self):
+        """
+        State of the gallery for GalleryJournal compaction, without copying
+        the payloads: the payloads of an arena are views of its chunks
+        (never overwritten, as compacting the arena allocates new chunks)
+        and the payloads of archives are loaded by the compaction thread.
+        """
+        payloads = self.payloads
+        return (
+            [
+                (
+                    label,
+                    payloads.view(record.binary)
+                    if type(record.binary) is int else record.binary,
+                    record.reference
+                )
+                for label, record in self.gallery_history.items()
+                if isinstance(record.binary, (bytes, int, ArchivePayload))
+            ],
+            dict(self.key_descr_dict)
+        )
 
-    @classmethod
-    def dump(cls, items, file):
+    def dump(self, items, file):
         gallery_history = OrderedDict()
         for i in items:
-            gallery_history[i] = cls.gallery_history[i]
-        return pickle.dump([gallery_history, cls.key_descr_dict], file,
+            gallery_history[i] = self.to_dict(i)
+        return pickle.dump([gallery_history, self.key_descr_dict], file,
                            protocol=pickle.HIGHEST_PROTOCOL)
 
-    @classmethod
-    def load_dict(cls, file):
+    def load_dict(self, file):
         try:
             gallery_history, key_descr_dict = pickle.load(file)
-            cls.key_descr_dict = {**cls.key_descr_dict, **key_descr_dict}
+            self.key_descr_dict = {**self.key_descr_dict, **key_descr_dict}
+            self.invalidate_contextkw()
         except ValueError:
             file.seek(0)
             gallery_history = pickle.load(file)
@@ -360,7 +672,7 @@ class RefKeyDescrFrame(wx.Frame):
             self.grid.HideCol(2)
 
         row = 0
-        key_descr_dict = GalleryDict.get_key_descr_dict()
+        key_descr_dict = self.parent.gallery_dict.get_key_descr_dict()
         for key in key_descr_dict:
             key_elm_value = ""
             key_descr_value = ""
@@ -398,7 +710,12 @@ class RefKeyDescrFrame(wx.Frame):
                 self.key_elm: self.grid.GetCellValue(row, 1),
                 self.desc_elm: self.grid.GetCellValue(row, 2)
             }
-        GalleryDict.set_key_descr_dict(key_descr_dict)
+        previous = self.parent.gallery_dict.get_key_descr_dict()
+        self.parent.gallery_dict.set_key_descr_dict(key_descr_dict)
+        self.parent.on_key_descr_changed([
+            ref for ref in set(previous) | set(key_descr_dict)
+            if previous.get(ref) != key_descr_dict.get(ref)
+        ])
         MakeModal(self, False)
         if self.parent.gallery_selector_lbx.GetSelection() >= 0:
             self.parent.on_gallery_selection_changed(None)
@@ -730,6 +1047,13 @@ class EditableGrid(wx.grid.Grid):
 class ConstructGallery(wx.Panel, PyShellPlugin):
     GALLERY_DESCRIPTOR = "gallery_descriptor"
     CONSTRUCT_FORMAT = "construct_format"
+    PREFETCH_DELAY = 200  # ms without selections before prefetching
+    data_file_wildcard = (
+        "Pickle files (*.pickle)|*.pickle|"
+        "Journal files (*.journal)|*.journal|"
+        "Archive files (*.archive)|*.archive|All files|*.*"
+    )
+    save_file_wildcard = data_file_wildcard  # formats written by save
 
     def __init__(
             self,
@@ -751,7 +1075,23 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             col_type_width=None,
             col_value_width=None,
             run_shell_plugin=True,
-            run_hex_editor_plugins=True
+            run_hex_editor_plugins=True,
+            max_entries=None,
+            max_age=None,
+            max_bytes=None,
+            upsert=False,
+            history_size=0,
+            gallery_store=None,
+            payload_arena=False,
+            context_factories=None,
+            virtual_gallery=False,
+            gallery_columns=None,
+            parse_cache_size=32 << 20,
+            selection_delay=50,
+            prefetch_window=2,
+            expand_depth=None,
+            expand_nodes=2000,
+            keep_expansion=True
     ):
         super().__init__(parent)
 
@@ -777,6 +1117,41 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         self.col_type_width = col_type_width
         self.col_value_width = col_value_width
         self.control_position = None
+        self.retention = RetentionPolicy(
+            max_entries=max_entries, max_age=max_age, max_bytes=max_bytes)
+        self.parse_results = {}  # label -> ParseResult computed by workers
+        self.parse_pool = None  # ParseWorkerPool, used by reparse()
+        self.parse_cache = ParseCache(parse_cache_size)
+        self.editor_construct = None, None  # (construct, editor copy)
+        self.updating_editor = False  # update_editor() in progress
+        self.editor_parses = 0  # number of parses of the editor
+        self.last_update_parses = 0  # parses of the last update_editor()
+        self.selection_delay = selection_delay  # ms, 0 = parse in the GUI
+        self.selection_pool = None  # ParseWorkerPool of the selection
+        self.selection_timer = None  # debounce timer (wx.CallLater)
+        self.selection_job = None  # ParseJob of the selected element
+        self.selection_generation = 0  # incremented at each selection
+        self.prefetch_window = prefetch_window  # neighbours on each side
+        self.prefetch_pool = None  # ParseWorkerPool of the prefetcher
+        self.prefetch_timer = None
+        self.prefetch_labels = []  # labels still to be prefetched
+        self.prefetch_job = None  # (parse_cache key, ParseJob)
+        self.prefetch_generation = 0  # incremented at each cancellation
+        self.expansion = ExpansionPolicy(
+            max_depth=expand_depth,
+            max_nodes=expand_nodes,
+            keep_state=keep_expansion)
+        self.reparse_jobs = []  # (labels, ParseBatch) of reparse()
+        self.reparse_start = None
+        self.upsert = upsert
+        self.history_size = history_size
+        self.upsert_times = {}  # label -> timestamp of the last update
+        self.upsert_history = {}  # label -> deque of (timestamp, binary)
+        self.updated_selection_binary = None
+        self.metrics = PipelineMetrics()
+        self.metrics.add_gauge(
+            "parse_cache_hit_ratio",
+            lambda: self.parse_cache.stats()["hit_ratio"])
         self.default_gallery_descr = {
             "Bytes": GalleryItem(
                 construct=cs.GreedyRange(cs.Byte)
@@ -810,8 +1185,21 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         self.default_zoom = 22
         self.current_zoom = self.default_zoom
 
-        GalleryDict.init(
-            self.reference_label, self.key_label, self.description_label)
+        if gallery_store:  # SQLite database
+            from .sqlite_gallery import SqliteGalleryDict
+            self.gallery_dict = SqliteGalleryDict(
+                gallery_store,
+                self.reference_label,
+                self.key_label,
+                self.description_label,
+                context_factories=context_factories)
+        else:
+            self.gallery_dict = GalleryDict(
+                self.reference_label,
+                self.key_label,
+                self.description_label,
+                arena=payload_arena,
+                context_factories=context_factories)
 
         # "construct" selector
         self.construct_selector_lbx = wx.ListBox(
@@ -836,15 +1224,23 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             wx.StaticLine(self), 0, wx.TOP | wx.BOTTOM | wx.EXPAND, 5)
 
         # "Gallery" selector
-        self.gallery_selector_lbx = wx.ListBox(
-            self,
-            id=wx.ID_ANY,
-            pos=wx.DefaultPosition,
-            size=wx.DefaultSize,
-            choices=[],  # default values
-            name="gallery_selector",
-            style=wx.LB_HSCROLL | wx.LB_NEEDED_SB
-        )
+        if virtual_gallery:
+            self.gallery_selector_lbx = GalleryListCtrl(
+                self,
+                self.gallery_list_columns(gallery_columns),
+                store=self.gallery_dict if gallery_store else None,
+                name="gallery_selector"
+            )
+        else:
+            self.gallery_selector_lbx = GalleryListBox(
+                self,
+                id=wx.ID_ANY,
+                pos=wx.DefaultPosition,
+                size=wx.DefaultSize,
+                choices=[],  # default values
+                name="gallery_selector",
+                style=wx.LB_HSCROLL | wx.LB_NEEDED_SB
+            )
         self.vsizer.Add(self.gallery_selector_lbx, 1, wx.ALL | wx.EXPAND, 1)
         self.gallery_selector_lbx.Bind(
             wx.EVT_LISTBOX, self.on_gallery_selection_changed
@@ -929,13 +1325,14 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             wx.EVT_BUTTON, self.on_clear_element_data_clicked
         )
 
+        if self.gallery_dict.len():  # elements of an existing gallery_store
+            self.list_gallery_elements()
         if ref_key_descriptor:
-            GalleryDict.update_key_descr_dict(ref_key_descriptor)
+            self.gallery_dict.update_key_descr_dict(ref_key_descriptor)
         if ordered_sample_bin_ref:
-            GalleryDict.update_dict(ordered_sample_bin_ref)
-            for sample in ordered_sample_bin_ref.keys():
-                if sample not in self.gallery_selector_lbx.GetItems():
-                    self.gallery_selector_lbx.Append(sample)
+            self.gallery_dict.update_dict(ordered_sample_bin_ref)
+            self.gallery_selector_lbx.append_missing(
+                ordered_sample_bin_ref.keys())
 
         # "Reload construct module" button
         if isinstance(self.gallery_descriptor, ModuleType):
@@ -1007,13 +1404,14 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             construct=self.used_construct,
             contextkw={},
         )
-        self.construct_hex_editor.construct_editor.expand_all()
+        self.count_editor_parses()
+        self.expand_tree()
         self.sizer.Add(self.construct_hex_editor, 1, wx.ALL | wx.EXPAND, c_sep)
 
         self.SetSizer(self.sizer)
 
         # Status bar initialization
-        if GalleryDict.len() == 0:
+        if self.gallery_dict.len() == 0:
             self.status_message("Empty list")
             self.previous_selection = None
 
@@ -1027,7 +1425,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         if self.load_pickle_file:
             for i in self.load_pickle_file:
                 try:
-                    gallery_history = GalleryDict.load_dict(i)
+                    gallery_history = self.gallery_dict.load_dict(i)
                 except IOError:
                     wx.LogError(
                         "Invalid format in file '%s'." % i.name)
@@ -1053,6 +1451,50 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
 
         self.GetTopLevelParent().SetMinSize((700, 320))
 
+    def gallery_list_columns(self, gallery_columns=None):
+        """
+        Columns of the virtual gallery list: the label, followed by the
+        columns named in gallery_columns ("time", "reference", "length",
+        "description"). Can be overridden.
+        """
+
+        def get_time(label):
+            if label in self.upsert_times:
+                timestamp = datetime.fromtimestamp(
+                    self.upsert_times[label], timezone.utc)
+            else:
+                timestamp = self.gallery_dict.get_timestamp(label)
+            if timestamp is None:
+                return ""
+            return timestamp.astimezone().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+        def get_reference(label):
+            return self.gallery_dict.get_reference(label)[1] or ""
+
+        def get_length(label):
+            length = self.gallery_dict.get_length(label)
+            return "" if length is None else str(length)
+
+        def get_description(label):
+            return self.gallery_dict.get_description(label)[3] or ""
+
+        available = {
+            "time": ("Time", 160, get_time),
+            "reference": (self.reference_label or "Reference", 120,
+                          get_reference),
+            "length": ("Length", 60, get_length),
+            "description": (self.description_label or "Description", 160,
+                            get_description),
+        }
+        columns = [("Label", 200, str)]
+        for name in gallery_columns or []:
+            if name not in available:
+                raise ValueError(
+                    "Invalid gallery column %r: use %s." % (
+                        name, ", ".join(available)))
+            columns.append(available[name])
+        return columns
+
     def zoom(self, n):
         dvc = self.construct_hex_editor.construct_editor._dvc
 
@@ -1080,6 +1522,10 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         self.construct_hex_editor.construct_editor.Refresh()
 
     def on_application_close(self):
+        self.close_journal()
+        self.gallery_dict.close_archives()
+        self.gallery_dict.close()
+        self.stop_background_parsing()
         if hasattr(self, 'pyshell') and self.pyshell:
             self.pyshell.Destroy()
 
@@ -1110,7 +1556,9 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         """
         Callback triggered each time the binary value is changed
         """
-        self.construct_hex_editor.construct_editor.expand_all()
+        if not self.updating_editor:  # else expanded by update_editor()
+            self.cancel_selection_parse()  # edited: parsed by the editor
+            self.expand_tree()
 
         # Static resize
         cols = self.construct_hex_editor.construct_editor._dvc.GetColumns()
@@ -1124,7 +1572,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         # Cancel selection in the gallery box...
         # ...if the changed value does not match selection
         try:
-            sample_binary = GalleryDict.get_binary(
+            sample_binary = self.gallery_dict.get_binary(
                 self.gallery_selector_lbx.GetStringSelection())
             if sample_binary != binary_data.get_bytes():
                 self.gallery_selector_lbx.SetSelection(-1)
@@ -1135,6 +1583,8 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         """ load data (construct labels) in the "construct" selector """
         if not self.gallery_descriptor:
             return False
+        self.parse_cache.clear()  # objects parsed by the previous module
+        clear_context_objects()
         if isinstance(self.gallery_descriptor, ModuleType):
             spec = importlib.util.spec_from_file_location(
                 name=self.gallery_descriptor.__name__,
@@ -1192,7 +1642,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         self.gallery_selection = self.default_gallery_selection
         default_construct = list(
             gallery_descr.keys())[self.gallery_selection]
-        GalleryDict.set_fixed_contextkw(
+        self.gallery_dict.set_fixed_contextkw(
             gallery_descr[default_construct].contextkw)
         if not issubclass(
                 type(gallery_descr[default_construct].construct), cs.Construct
@@ -1206,28 +1656,26 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             return False
         self.used_construct = gallery_descr[default_construct].construct
         self.construct_selector_lbx.SetStringSelection(default_construct)
-        if self.construct_hex_editor:
-            self.construct_hex_editor.construct = self.used_construct
-            self.construct_hex_editor.binary = self.construct_hex_editor.binary
-            self.construct_hex_editor.construct_editor.expand_all()
-        self.change_gallery_selection()
+        self.change_gallery_selection()  # also updates the editor
         return True
 
     def on_save_data_file_clicked(self, event):
         self.confirm_changed_data()
         self.confirm_added_data()
-        if GalleryDict.len() == 0:
+        if self.gallery_dict.len() == 0:
             wx.MessageDialog(
                 self,
                 'No data to save',
                 'Cannot save data.',
                 wx.OK | wx.ICON_WARNING).ShowModal()
             return
+        journal = self.gallery_dict.journal
         with wx.FileDialog(
                 self,
-                "Filename to save with pickle format",
-                wildcard="Pickle files (*.pickle)|*.pickle|All files|*.*",
-                style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT,
+                "Filename to save with pickle or journal format",
+                defaultFile=journal.filename if journal else "",
+                wildcard=self.save_file_wildcard,
+                style=wx.FD_SAVE | (0 if journal else wx.FD_OVERWRITE_PROMPT),
         ) as fileDialog:
 
             if fileDialog.ShowModal() == wx.ID_CANCEL:
@@ -1235,14 +1683,72 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
 
             # save the current contents in the file
             pathname = fileDialog.GetPath()
+            if pathname.endswith(".journal") or (
+                    journal and pathname == journal.filename):
+                self.save_journal(pathname)
+                return
+            if pathname.endswith(".archive"):
+                self.save_archive(pathname)
+                return
             try:
                 with open(pathname, "wb") as file:
-                    GalleryDict.dump(self.gallery_selector_lbx.GetItems(), file)
+                    self.gallery_dict.dump(self.gallery_labels(), file)
             except IOError:
                 wx.LogError(
                     "Cannot save current data in file '%s'." % pathname)
                 return
-            self.status_message(f"Saved {GalleryDict.len()} elements.")
+            self.status_message(f"Saved {self.gallery_dict.len()} elements.")
+
+    def save_journal(self, pathname):
+        """
+        Save the gallery to a journal file (see GalleryJournal): the first
+        save writes all elements in background, then each change is appended
+        as it happens, so that saving again only flushes the journal.
+        """
+        journal = self.gallery_dict.journal
+        if journal and journal.filename == pathname:
+            journal.flush()
+            self.status_message(
+                f"Saved {journal.written} changes to journal.")
+            return
+        self.close_journal()
+        try:
+            self.gallery_dict.journal = GalleryJournal(
+                pathname, self.gallery_dict.snapshot)
+        except OSError:
+            wx.LogError("Cannot save current data in file '%s'." % pathname)
+            return
+        self.status_message(
+            f"Saving {self.gallery_dict.len()} elements to journal; "
+            "changes are saved as they happen.")
+
+    def save_archive(self, pathname):
+        """
+        Save the gallery to an indexed archive (see write_archive()), which
+        can be loaded lazily, reading each payload when it is selected.
+        """
+        def elements():
+            for label in self.gallery_labels():
+                binary = self.gallery_dict.get_binary(label)
+                if binary is not None:
+                    yield (
+                        label,
+                        binary,
+                        self.gallery_dict.get_reference(label)[1] or None
+                    )
+
+        try:
+            count = write_archive(
+                pathname, elements(), self.gallery_dict.key_descr_dict)
+        except OSError:
+            wx.LogError("Cannot save current data in file '%s'." % pathname)
+            return
+        self.status_message(f"Saved {count} elements to archive.")
+
+    def close_journal(self):
+        if self.gallery_dict.journal:
+            self.gallery_dict.journal.close()
+            self.gallery_dict.journal = None
 
     def confirm_added_data(self):
         if not self.construct_hex_editor:
@@ -1257,38 +1763,39 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 wx.YES_NO | wx.ICON_WARNING).ShowModal() == wx.ID_YES):
             self.add_selection()
         else:
-            self.construct_hex_editor.binary = b''
+            self.update_editor(binary=b'')
 
     def confirm_changed_data(self):
         if not self.construct_hex_editor:
             return
         if (self.previous_selection is not None and
                 self.previous_selection and
-                GalleryDict.exists(self.previous_selection) and
+                self.gallery_dict.exists(self.previous_selection) and
                 self.construct_hex_editor.binary !=
-                GalleryDict.get_binary(self.previous_selection)):
+                self.gallery_dict.get_binary(self.previous_selection)):
             if (wx.MessageDialog(
                     self,
                     'Keep previously modified data?',
                     'You need to confirm changing values',
                     wx.YES_NO | wx.ICON_WARNING).ShowModal() == wx.ID_YES):
-                GalleryDict.set(
+                self.gallery_dict.set(
                     self.previous_selection,
                     self.construct_hex_editor.binary
                 )
             else:
-                self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-                    self.previous_selection)
-                self.construct_hex_editor.binary = GalleryDict.get_binary(
-                    self.previous_selection)
+                self.update_editor(
+                    contextkw=self.gallery_dict.get_contextkw(
+                        self.previous_selection),
+                    binary=self.gallery_dict.get_payload(
+                        self.previous_selection))
 
     def on_load_data_file_clicked(self, event):
         self.confirm_changed_data()
         self.confirm_added_data()
         with wx.FileDialog(
                 self,
-                "Open data file (pickle format)",
-                wildcard="Pickle files (*.pickle)|*.pickle|All files|*.*",
+                "Open data file",
+                wildcard=self.data_file_wildcard,
                 style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST,
         ) as fileDialog:
 
@@ -1296,48 +1803,63 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 return  # the user changed their mind
 
             # Proceed loading the file chosen by the user
-            pathname = Path(fileDialog.GetPath())
-            try:
+            self.load_data_file(Path(fileDialog.GetPath()))
+
+    def load_data_file(self, pathname):
+        """
+        Load a data file (pickle, journal or archive format). Can be
+        overridden. Payloads of archives are read when they are selected.
+        """
+        try:
+            if is_journal_file(pathname):
+                gallery_history, key_descr_dict = read_journal(pathname)
+                self.gallery_dict.update_key_descr_dict(key_descr_dict)
+            elif is_archive_file(pathname):
+                archive = GalleryArchive(str(pathname))
+                self.gallery_dict.archives.append(archive)
+                self.gallery_dict.update_key_descr_dict(
+                    archive.key_descr_dict)
+                gallery_history = archive.elements()
+            else:
                 with open(pathname, "rb") as file:
-                    gallery_history = GalleryDict.load_dict(file)
-            except IOError:
-                wx.LogError("Cannot open file '%s'." % str(pathname))
-                return
-            except Exception as e:
-                dlg = wx.MessageDialog(
-                    None,
-                    str(e),
-                    "Archive with invalid format",
-                    wx.OK | wx.ICON_WARNING
-                )
-                dlg.ShowModal()
-                dlg.Destroy()
-                return
-            self.load_data_dict(gallery_history, str(pathname))
+                    gallery_history = self.gallery_dict.load_dict(file)
+        except IOError:
+            wx.LogError("Cannot open file '%s'." % str(pathname))
+            return
+        except Exception as e:
+            dlg = wx.MessageDialog(
+                None,
+                str(e),
+                "Archive with invalid format",
+                wx.OK | wx.ICON_WARNING
+            )
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+        self.load_data_dict(gallery_history, str(pathname))
 
     def load_data_dict(self, gallery_history, pathname):
         if pathname:
             title = self.GetTopLevelParent().GetTitle()
             self.GetTopLevelParent().SetTitle(pathname + " | " + title)
-        GalleryDict.update_dict(gallery_history)
+        self.gallery_dict.update_dict(gallery_history)
         self.status_message(
             f"Loaded {len(gallery_history)} elements. "
-            f"Total of {GalleryDict.len()} elements available."
+            f"Total of {self.gallery_dict.len()} elements available "
+            f"(payload dedup ratio "
+            f"{self.gallery_dict.payload_stats()['dedup_ratio']:.1f})."
         )
         self.gallery_selector_lbx.Clear()
-        for i in GalleryDict.keys():
-            if i not in self.gallery_selector_lbx.GetItems():
-                self.gallery_selector_lbx.Append(i)
-        if (GalleryDict.len() > 0 and self.construct_hex_editor and
+        self.list_gallery_elements()
+        if (self.gallery_dict.len() > 0 and self.construct_hex_editor and
                 not self.construct_hex_editor.IsShown()):
             self.construct_hex_editor.construct_editor.Show()
             self.gallery_selector_lbx.SetSelection(0)
-            sample_binary = GalleryDict.get_binary(
-                self.gallery_selector_lbx.GetStringSelection())
-            self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-                self.gallery_selector_lbx.GetStringSelection())
-            self.construct_hex_editor.binary = sample_binary
-            self.construct_hex_editor.construct_editor.expand_all()
+            self.update_editor(
+                contextkw=self.gallery_dict.get_contextkw(
+                    self.gallery_selector_lbx.GetStringSelection()),
+                binary=self.gallery_dict.get_payload(
+                    self.gallery_selector_lbx.GetStringSelection()))
 
     def edit_ref_attr(self):
         frame = RefKeyDescrFrame(
@@ -1350,17 +1872,20 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
 
     def clear_log(self):
         self.GetTopLevelParent().SetTitle(self.default_title)
-        GalleryDict.reset()
+        self.gallery_dict.reset()
+        self.retention.clear()
+        self.parse_results.clear()
+        self.upsert_times.clear()
+        self.upsert_history.clear()
         self.gallery_selector_lbx.Clear()
-        if GalleryDict.len() == 0:
+        if self.gallery_dict.len() == 0:
             self.status_message("Empty list")
             self.previous_selection = None
 
     def on_clear_element_data_clicked(self, event):
         if not self.construct_hex_editor:
             return
-        self.construct_hex_editor.binary = b''
-        self.construct_hex_editor.construct_editor.expand_all()
+        self.update_editor(binary=b'')
 
     def on_doubleclick_log(self, event):
         self.change_selection()
@@ -1389,7 +1914,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 txt.SetFocus()
                 break
         if self.dlg_as.ShowModal() == wx.ID_OK:
-            if GalleryDict.exists(self.dlg_as.GetValue()):
+            if self.gallery_dict.exists(self.dlg_as.GetValue()):
                 wx.MessageDialog(
                     self,
                     'Label already existing',
@@ -1397,11 +1922,11 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                     wx.OK | wx.ICON_WARNING).ShowModal()
                 self.dlg_as.Destroy()
                 return
-            _, org_reference = GalleryDict.get_reference(
+            _, org_reference = self.gallery_dict.get_reference(
                 self.gallery_selector_lbx.GetStringSelection())
-            if GalleryDict.len() == 0:
+            if self.gallery_dict.len() == 0:
                 self.status_message(self.added_data_label)
-            GalleryDict.set(
+            self.gallery_dict.set(
                 self.dlg_as.GetValue(),
                 self.construct_hex_editor.binary,
                 reference=org_reference
@@ -1434,7 +1959,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 txt.SetFocus()
                 break
         if dlg.ShowModal() == wx.ID_OK:
-            if GalleryDict.exists(dlg.GetValue()):
+            if self.gallery_dict.exists(dlg.GetValue()):
                 wx.MessageDialog(
                     self,
                     'Cannot rename with already existing label.',
@@ -1442,15 +1967,18 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                     wx.OK | wx.ICON_WARNING).ShowModal()
                 dlg.Destroy()
                 return
-            _, org_reference = GalleryDict.get_reference(
+            _, org_reference = self.gallery_dict.get_reference(
                 self.gallery_selector_lbx.GetStringSelection())
-            GalleryDict.set(  # add a new entry with its binary and reference
+            self.gallery_dict.set(  # add a new entry with its binary and reference
                 dlg.GetValue(),
                 self.construct_hex_editor.binary,
                 reference=org_reference)
             if dlg.GetValue() != self.gallery_selector_lbx.GetStringSelection():
-                GalleryDict.delete(  # remove the old entry
+                self.gallery_dict.delete(  # remove the old entry
                     self.gallery_selector_lbx.GetStringSelection())
+                self.retention.rename(
+                    self.gallery_selector_lbx.GetStringSelection(),
+                    dlg.GetValue())
             self.gallery_selector_lbx.SetString(  # change the label in the lbx
                 self.gallery_selector_lbx.GetSelection(), dlg.GetValue())
         dlg.Destroy()
@@ -1473,7 +2001,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 txt.SetFocus()
                 break
         if dlg.ShowModal() == wx.ID_OK:
-            if GalleryDict.exists(dlg.GetValue()):
+            if self.gallery_dict.exists(dlg.GetValue()):
                 wx.MessageDialog(
                     self,
                     'Label already existing',
@@ -1481,10 +2009,10 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                     wx.OK | wx.ICON_WARNING).ShowModal()
                 dlg.Destroy()
                 return
-            _, org_reference = GalleryDict.get_reference(
+            _, org_reference = self.gallery_dict.get_reference(
                 self.gallery_selector_lbx.GetStringSelection())
             if dlg.GetValue() != self.gallery_selector_lbx.GetStringSelection():
-                GalleryDict.set(
+                self.gallery_dict.set(
                     dlg.GetValue(),
                     self.construct_hex_editor.binary,
                     reference=org_reference
@@ -1529,15 +2057,15 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         if not self.reference_label:
             return
         element = self.gallery_selector_lbx.GetStringSelection()
-        _, org_reference = GalleryDict.get_reference(element)
+        _, org_reference = self.gallery_dict.get_reference(element)
         if org_reference is None:
             return
         org_key = None
         org_description = None
         confirm = ''
         if org_reference:
-            _, _, _, org_key = GalleryDict.get_key(element, interactive=True)
-            _, _, _, org_description = GalleryDict.get_description(
+            _, _, _, org_key = self.gallery_dict.get_key(element, interactive=True)
+            _, _, _, org_description = self.gallery_dict.get_description(
                 element, interactive=True)
             confirm = ' or confirm the current one'
         dlg = wx.TextEntryDialog(
@@ -1551,11 +2079,11 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 txt.SetFocus()
                 break
         if dlg.ShowModal() == wx.ID_OK:
-            GalleryDict.set_reference(element, dlg.GetValue())
+            self.gallery_dict.set_reference(element, dlg.GetValue())
             if org_key is not None:
-                GalleryDict.set_key(element, org_key)
+                self.gallery_dict.set_key(element, org_key)
             if org_description is not None:
-                GalleryDict.set_description(element, org_description)
+                self.gallery_dict.set_description(element, org_description)
             self.rebuild_bytes_selection()
         self.on_gallery_selection_changed(None)
         dlg.Destroy()
@@ -1566,9 +2094,9 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         if not self.key_label:
             return
         element = self.gallery_selector_lbx.GetStringSelection()
-        _, _, _, org_key = GalleryDict.get_key(element, interactive=True)
-        _, ref = GalleryDict.get_reference(element)
-        _, _, _, descr = GalleryDict.get_description(element, interactive=True)
+        _, _, _, org_key = self.gallery_dict.get_key(element, interactive=True)
+        _, ref = self.gallery_dict.get_reference(element)
+        _, _, _, descr = self.gallery_dict.get_description(element, interactive=True)
         if org_key is None:
             return
         confirm = ''
@@ -1586,7 +2114,9 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 txt.SetFocus()
                 break
         if dlg.ShowModal() == wx.ID_OK:
-            GalleryDict.set_key(element, dlg.GetValue())
+            self.gallery_dict.set_key(element, dlg.GetValue())
+            self.on_key_descr_changed(
+                [self.gallery_dict.get_reference(element)[1]])
             self.rebuild_bytes_selection()
         self.on_gallery_selection_changed(None)
         dlg.Destroy()
@@ -1597,13 +2127,13 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         try:
             self.construct_hex_editor.construct_editor.parse(
                 self.construct_hex_editor.binary,
-                **GalleryDict.get_contextkw(
+                **self.gallery_dict.get_contextkw(
                     self.gallery_selector_lbx.GetStringSelection()
                 )
             )
             if self.construct_hex_editor.construct_editor.root_obj:
                 new_bytes = self.construct_hex_editor.construct_editor.build(
-                    **GalleryDict.get_contextkw(
+                    **self.gallery_dict.get_contextkw(
                         self.gallery_selector_lbx.GetStringSelection()
                     )
                 )
@@ -1619,8 +2149,8 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             dlg.Destroy()
             return
         if new_bytes:
-            self.construct_hex_editor.binary = new_bytes
-            GalleryDict.set(
+            self.update_editor(binary=new_bytes)
+            self.gallery_dict.set(
                 self.gallery_selector_lbx.GetStringSelection(),
                 new_bytes
             )
@@ -1632,8 +2162,8 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         if not self.description_label:
             return
         element = self.gallery_selector_lbx.GetStringSelection()
-        _, ref = GalleryDict.get_reference(element)
-        _, _, _, org_description = GalleryDict.get_description(
+        _, ref = self.gallery_dict.get_reference(element)
+        _, _, _, org_description = self.gallery_dict.get_description(
             element, interactive=True)
         if org_description is None:
             return
@@ -1651,7 +2181,9 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 txt.SetFocus()
                 break
         if dlg.ShowModal() == wx.ID_OK:
-            GalleryDict.set_description(element, dlg.GetValue())
+            self.gallery_dict.set_description(element, dlg.GetValue())
+            self.on_key_descr_changed(
+                [self.gallery_dict.get_reference(element)[1]])
             self.rebuild_bytes_selection()
         self.on_gallery_selection_changed(None)
         dlg.Destroy()
@@ -1690,20 +2222,27 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
         if not self.construct_hex_editor:
             return
         index = obj.GetSelection()
-        GalleryDict.pop(self.gallery_selector_lbx.GetStringSelection())
+        self.gallery_dict.pop(self.gallery_selector_lbx.GetStringSelection())
+        self.retention.discard(self.gallery_selector_lbx.GetStringSelection())
+        self.parse_results.pop(
+            self.gallery_selector_lbx.GetStringSelection(), None)
+        self.upsert_times.pop(
+            self.gallery_selector_lbx.GetStringSelection(), None)
+        self.upsert_history.pop(
+            self.gallery_selector_lbx.GetStringSelection(), None)
         self.previous_selection = None
         if index < 0:
-            if GalleryDict.len() == 0:
+            if self.gallery_dict.len() == 0:
                 self.status_message("Empty list")
             return
         self.gallery_selector_lbx.Delete(index)
         if obj.GetCount() > 0:
             if index < obj.GetCount():
                 obj.SetSelection(index)
-                self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-                    self.gallery_selector_lbx.GetStringSelection())
-                self.construct_hex_editor.binary = (
-                    GalleryDict.get_binary(
+                self.update_editor(
+                    contextkw=self.gallery_dict.get_contextkw(
+                        self.gallery_selector_lbx.GetStringSelection()),
+                    binary=self.gallery_dict.get_payload(
                         self.gallery_selector_lbx.GetStringSelection()))
                 self.previous_selection = self.construct_hex_editor.binary
                 self.status_message(
@@ -1713,10 +2252,10 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 )
             else:
                 obj.SetSelection(index - 1)
-                self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-                    self.gallery_selector_lbx.GetStringSelection())
-                self.construct_hex_editor.binary = (
-                    GalleryDict.get_binary(
+                self.update_editor(
+                    contextkw=self.gallery_dict.get_contextkw(
+                        self.gallery_selector_lbx.GetStringSelection()),
+                    binary=self.gallery_dict.get_payload(
                         self.gallery_selector_lbx.GetStringSelection()))
                 self.previous_selection = self.construct_hex_editor.binary
                 self.status_message(
@@ -1725,7 +2264,7 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                     self.gallery_selector_lbx.GetStringSelection() + u'\u275e'
                 )
         else:
-            if GalleryDict.len() == 0:
+            if self.gallery_dict.len() == 0:
                 self.status_message("Empty list")
                 self.previous_selection = None
 
@@ -1753,9 +2292,8 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                 )
             )
             return
-        GalleryDict.set_fixed_contextkw(gallery_item.contextkw)
+        self.gallery_dict.set_fixed_contextkw(gallery_item.contextkw)
         self.used_construct = gallery_item.construct
-        self.construct_hex_editor.construct = self.used_construct
         if gallery_item.clear_log:
             self.previous_selection = None
             self.clear_log()
@@ -1770,31 +2308,29 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
             )
             self.previous_selection = self.gallery_selector_lbx.GetStringSelection()
         if len(gallery_item.ordered_sample_bin_ref) > 0:  # sample_bin_ref
-            GalleryDict.update_dict(gallery_item.ordered_sample_bin_ref)
-            for i in GalleryDict.keys():  # load samples
-                if i not in self.gallery_selector_lbx.GetItems():
-                    self.gallery_selector_lbx.Append(i)
+            self.gallery_dict.update_dict(gallery_item.ordered_sample_bin_ref)
+            self.list_gallery_elements()  # load samples
             self.gallery_selector_lbx.SetStringSelection(  # select the first sample
                 list(gallery_item.ordered_sample_bin_ref.keys())[0]
             )
             self.previous_selection = self.gallery_selector_lbx.GetStringSelection()
         if gallery_item.ref_key_descriptor:
-            GalleryDict.update_key_descr_dict(gallery_item.ref_key_descriptor)
+            self.gallery_dict.update_key_descr_dict(gallery_item.ref_key_descriptor)
         if self.gallery_selector_lbx.GetStringSelection():
-            sample_binary = GalleryDict.get_binary(
-                self.gallery_selector_lbx.GetStringSelection())
-            self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-                self.gallery_selector_lbx.GetStringSelection())
-            self.construct_hex_editor.binary = sample_binary
-            self.construct_hex_editor.construct_editor.expand_all()
-        else:
-            self.construct_hex_editor.binary = self.construct_hex_editor.binary
+            self.update_editor(
+                construct=self.used_construct,
+                contextkw=self.gallery_dict.get_contextkw(
+                    self.gallery_selector_lbx.GetStringSelection()),
+                binary=self.gallery_dict.get_payload(
+                    self.gallery_selector_lbx.GetStringSelection()))
+        else:  # parse the shown binary with the new construct
+            self.update_editor(construct=self.used_construct)
 
     def on_right_clicked(self, event):
         if not self.construct_hex_editor:
             return
         obj = event.GetEventObject()
-        if not isinstance(obj, wx.ListBox):
+        if not isinstance(obj, (wx.ListBox, GalleryListCtrl)):
             return
         item = obj.HitTest(event.GetPosition())
         if item == wx.NOT_FOUND:
@@ -1897,14 +2433,14 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
 
     def on_mouse_motion(self, event):  # Add tooltip
         obj = event.GetEventObject()
-        if isinstance(obj, wx.ListBox):
+        if isinstance(obj, (wx.ListBox, GalleryListCtrl)):
             item = obj.HitTest(event.GetPosition())
             if item == self.gallery_tooltip_item:
                 return  # avoid tooltip flickering when moving mouse
             self.gallery_tooltip_item = item
             if item >= 0:
                 value = self.gallery_selector_lbx.GetString(item)
-                _, reference, _, description = GalleryDict.get_description(
+                _, reference, _, description = self.gallery_dict.get_description(
                     value)
                 if description:
                     reference = description
@@ -1913,20 +2449,20 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
     def on_leave_window(self, event):  # Remove tooltip
         obj = event.GetEventObject()
         self.gallery_tooltip_item = None
-        if isinstance(obj, wx.ListBox):
+        if isinstance(obj, (wx.ListBox, GalleryListCtrl)):
             obj.SetToolTip(None)
 
     def on_gallery_selection_changed(self, event):
         if not self.construct_hex_editor:
             return
-        if (GalleryDict.len() > 0 and
+        if (self.gallery_dict.len() > 0 and
                 self.previous_selection !=
                 self.gallery_selector_lbx.GetStringSelection()):
             if (self.previous_selection is not None and
                     self.previous_selection and
-                    GalleryDict.exists(self.previous_selection) and
+                    self.gallery_dict.exists(self.previous_selection) and
                     self.construct_hex_editor.binary !=
-                    GalleryDict.get_binary(self.previous_selection)):
+                    self.gallery_dict.get_binary(self.previous_selection)):
                 if (wx.MessageDialog(
                         self,
                         'Save previously modified data?',
@@ -1934,12 +2470,12 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                         wx.YES_NO | wx.ICON_WARNING
                 ).ShowModal() == wx.ID_YES
                 ):
-                    GalleryDict.set(self.previous_selection,
-                                    self.construct_hex_editor.binary)
+                    self.gallery_dict.set(self.previous_selection,
+                                          self.construct_hex_editor.binary)
             elif (self.previous_selection is None and
-                  GalleryDict.exists(
+                  self.gallery_dict.exists(
                       self.gallery_selector_lbx.GetStringSelection()) and
-                  GalleryDict.get_binary(
+                  self.gallery_dict.get_binary(
                       self.gallery_selector_lbx.GetStringSelection()) !=
                   self.construct_hex_editor.binary and
                   self.construct_hex_editor.binary != b''):
@@ -1948,15 +2484,15 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                         'Replace saved data with new value?',
                         'Value was changed',
                         wx.YES_NO | wx.ICON_WARNING).ShowModal() == wx.ID_YES):
-                    GalleryDict.set(
+                    self.gallery_dict.set(
                         self.gallery_selector_lbx.GetStringSelection(),
                         self.construct_hex_editor.binary
                     )
         else:
-            if (GalleryDict.len() > 0 and
-                    GalleryDict.exists(
+            if (self.gallery_dict.len() > 0 and
+                    self.gallery_dict.exists(
                         self.gallery_selector_lbx.GetStringSelection()) and
-                    GalleryDict.get_binary(
+                    self.gallery_dict.get_binary(
                         self.gallery_selector_lbx.GetStringSelection()) !=
                     self.construct_hex_editor.binary):
                 if (wx.MessageDialog(
@@ -1964,18 +2500,21 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                         'Replace saved data with new value?',
                         'Value was changed',
                         wx.YES_NO | wx.ICON_WARNING).ShowModal() == wx.ID_YES):
-                    GalleryDict.set(
+                    self.gallery_dict.set(
                         self.gallery_selector_lbx.GetStringSelection(),
                         self.construct_hex_editor.binary)
         self.previous_selection = self.gallery_selector_lbx.GetStringSelection()
-        sample_binary = GalleryDict.get_binary(
+        sample_binary = self.gallery_dict.get_payload(
             self.gallery_selector_lbx.GetStringSelection())
 
         # Set example binary
-        self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-            self.gallery_selector_lbx.GetStringSelection())
-        self.construct_hex_editor.binary = sample_binary
-        self.construct_hex_editor.construct_editor.expand_all()
+        self.show_selection(
+            self.gallery_dict.get_contextkw(
+                self.gallery_selector_lbx.GetStringSelection()),
+            sample_binary,
+            self.parse_results.get(
+                self.gallery_selector_lbx.GetStringSelection()))
+        self.schedule_prefetch()
 
         if not event:
             return
@@ -1992,32 +2531,593 @@ class ConstructGallery(wx.Panel, PyShellPlugin):
                  append_label=None,
                  discard_duplicates=False,
                  date_separator=" ",
-                 duplicate_separator="-"):
+                 duplicate_separator="-",
+                 timestamp=None,
+                 parsed=None):
         if not self.construct_hex_editor:
             return False
+        self.show_added_data(data, reference)
+        result, label = self.store_data(
+            data,
+            reference=reference,
+            label=label,
+            append_label=append_label,
+            discard_duplicates=discard_duplicates,
+            date_separator=date_separator,
+            duplicate_separator=duplicate_separator,
+            timestamp=timestamp,
+            parsed=parsed)
+        if label is not None:
+            self.gallery_selector_lbx.Append(label)
+            self.metrics.incr("inserted")
+            self.apply_retention()
+        self.gallery_dict.commit()
+        self.refresh_updated_selection()
+        return result
+
+    def add_data_list(self, data_list):
+        """
+        Add a list of elements with a single insertion into the gallery
+        selector. Each element is a dictionary of add_data() arguments.
+        Return the number of inserted elements.
+        """
+        if not self.construct_hex_editor or not data_list:
+            return 0
+        self.show_added_data(
+            data_list[0]["data"], data_list[0].get("reference"))
+        labels = []
+        for data_args in data_list:
+            _, label = self.store_data(**data_args)
+            if label is not None:
+                labels.append(label)
+        if labels:
+            self.gallery_selector_lbx.InsertItems(
+                labels, self.gallery_selector_lbx.GetCount())
+            self.metrics.incr("inserted", len(labels))
+            self.apply_retention()
+        self.gallery_dict.commit()
+        self.refresh_updated_selection()
+        return len(labels)
+
+    def gallery_labels(self):
+        """
+        Labels of the gallery elements in the order of the gallery selector.
+        A virtual list reading the gallery_store shows the elements in the
+        order of the store, so they are read from the store instead of the
+        list.
+        """
+        if isinstance(self.gallery_selector_lbx.labels, StoreLabels):
+            return self.gallery_dict.keys()
+        return self.gallery_selector_lbx.GetItems()
+
+    def list_gallery_elements(self):
+        """
+        Add to the gallery selector the elements of gallery_dict which are
+        not listed (a virtual list reading the gallery_store lists all of
+        them: only its number of rows is updated).
+        """
+        lbx = self.gallery_selector_lbx
+        if isinstance(lbx.labels, StoreLabels):
+            lbx.append_missing(())
+        else:
+            lbx.append_missing(self.gallery_dict.keys())
+
+    def apply_retention(self):
+        """
+        Evict the oldest added elements exceeding the retention limits,
+        keeping GalleryDict, the gallery selector and previous_selection
+        consistent. Return the number of evicted elements.
+        """
+        labels = self.retention.expired()
+        if not labels:
+            return 0
+        lbx = self.gallery_selector_lbx
+        for label in labels:
+            if lbx.GetCount() and lbx.GetString(0) == label:
+                index = 0  # evicted elements are usually at the top
+            else:
+                index = lbx.FindString(label, True)
+            self.gallery_dict.pop(label)
+            self.parse_results.pop(label, None)
+            self.upsert_times.pop(label, None)
+            self.upsert_history.pop(label, None)
+            if index != wx.NOT_FOUND:
+                lbx.Delete(index)
+            if label == self.previous_selection:
+                self.previous_selection = None
+        self.metrics.incr("evicted", len(labels))
+        if self.gallery_dict.len() == 0:
+            self.status_message("Empty list")
+        return len(labels)
+
+    def on_key_descr_changed(self, references):
+        """
+        Called when the key or the description of references are edited.
+        With a parse pool, the elements of these references are parsed again
+        in background.
+        """
+        for label in list(self.parse_results):
+            if self.gallery_dict.get_reference(label)[1] in references:
+                del self.parse_results[label]
+        if self.parse_pool:
+            self.reparse(references)
+
+    def reparse(self, references=None, batch_size=1000):
+        """
+        Parse again in background the elements of references (all elements
+        if None) with the current construct, storing the results in
+        parse_results, so that selecting them does not parse them. The
+        elements of each reference are submitted in batches, parsed with
+        the same contextkw (and context objects, like ciphers). Uses
+        parse_pool if set, otherwise a temporary worker thread. Return the
+        number of submitted elements.
+        """
+        if not self.construct_hex_editor:
+            return 0
+        groups = {}  # reference -> labels
+        if references is None:
+            for label in self.gallery_dict.keys():
+                reference = self.gallery_dict.get_reference(label)[1]
+                groups.setdefault(reference, []).append(label)
+        else:  # indexed query with gallery_store
+            for reference in set(references):
+                labels = self.gallery_dict.labels_by_reference(reference)
+                if labels:
+                    groups[reference] = labels
+        if not groups:
+            return 0
+        collecting = bool(self.reparse_jobs)
+        if not collecting:
+            self.reparse_start = time.perf_counter()
+        pool = self.parse_pool or ParseWorkerPool(workers=1)
+        construct = self.construct_hex_editor.construct
+        submitted = 0
+        for reference, labels in groups.items():
+            contextkw = self.gallery_dict.get_reference_contextkw(reference)
+            if contextkw is None:  # invalid reference or key
+                continue
+            for start in range(0, len(labels), batch_size):
+                batch = labels[start:start + batch_size]
+                self.reparse_jobs.append((pool, batch, pool.submit_batch(
+                    construct,
+                    [self.gallery_dict.get_binary(label) for label in batch],
+                    contextkw)))
+                submitted += len(batch)
+        if pool is not self.parse_pool:
+            pool.shutdown()  # the submitted jobs are completed
+        if not collecting:
+            wx.CallLater(100, self.collect_reparse)
+        return submitted
+
+    def collect_reparse(self):
+        pending = []
+        for pool, labels, job in self.reparse_jobs:
+            if not job.future.done():
+                pending.append((pool, labels, job))
+                continue
+            for label, result in zip(labels, pool.collect_batch(job) or ()):
+                if self.gallery_dict.exists(label):
+                    self.parse_results[label] = result
+                    self.metrics.observe("parse_time", result.duration)
+        collected = len(self.reparse_jobs) - len(pending)
+        self.reparse_jobs = pending
+        if pending:
+            wx.CallLater(100, self.collect_reparse)
+        elif collected:
+            self.status_message(
+                "Parsing completed in %.1f seconds."
+                % (time.perf_counter() - self.reparse_start))
+
+    def expand_tree(self):
+        """
+        Expand the tree of the editor according to the expansion policy
+        (expand_depth, expand_nodes and keep_expansion). Can be overridden.
+        """
+        self.expansion.apply(
+            self.construct_hex_editor.construct_editor, self.used_construct)
+
+    def count_editor_parses(self):
+        """Count the parses of the construct editor (editor_parses)."""
+        construct_editor = self.construct_hex_editor.construct_editor
+        parse = construct_editor.parse
+
+        def counted_parse(binary, **contextkw):
+            self.editor_parses += 1
+            self.metrics.incr("editor_parses")
+            return parse(binary, **contextkw)
+
+        construct_editor.parse = counted_parse
+
+    def update_editor(
+            self, construct=None, contextkw=None, binary=None, parsed=None):
+        """
+        Update the construct, the contextkw and the binary of the editor at
+        once (None keeps the current value), parsing binary at most once
+        (not at all if parsed or the parse cache hold its parsed object)
+        and expanding the tree once (expand_tree(), keeping the expanded
+        entries). The number of parses is stored in last_update_parses.
+        """
+        hex_editor = self.construct_hex_editor
+        self.cancel_selection_parse()
+        if hex_editor.construct_editor.model.root_obj is not None:
+            self.expansion.save(
+                hex_editor.construct_editor, self.used_construct)
+        parses = self.editor_parses
+        self.updating_editor = True
+        try:
+            used, copied = self.editor_construct
+            if construct is not None and (
+                    construct is not used or
+                    hex_editor.construct is not copied):
+                # the editor rebuilds its copy of construct (include_metadata)
+                # each time it is set: keep it when unchanged, so that the
+                # parse cache and the expanded entries remain valid
+                hex_editor.construct = construct  # not parsed by the editor
+                self.editor_construct = construct, hex_editor.construct
+            if contextkw is None:
+                contextkw = hex_editor.contextkw
+            if binary is None:
+                binary = hex_editor.binary
+            self.show_binary(binary, contextkw, parsed)
+        finally:
+            self.updating_editor = False
+        self.expand_tree()
+        self.last_update_parses = self.editor_parses - parses
+        self.metrics.incr("editor_updates")
+
+    def show_selection(self, contextkw, binary, parsed=None):
+        """
+        Show the selected element. Unless it is already parsed (parsed or
+        parse cache), the payload is shown in the hex editor while parsing
+        is delayed by selection_delay milliseconds and done by a background
+        thread: each new selection cancels the pending parse, so that only
+        the last one of a fast navigation (e.g., holding an arrow key) is
+        parsed and rendered.
+        """
+        hex_editor = self.construct_hex_editor
+        construct = hex_editor.construct
+        if (not self.selection_delay or
+                parsed is not None and
+                parsed.matches(construct, binary, contextkw) or
+                self.parse_cache.contains(
+                    self.parse_cache.make_key(construct, binary, contextkw),
+                    construct)):
+            self.update_editor(
+                contextkw=contextkw, binary=binary, parsed=parsed)
+            return
+        self.cancel_selection_parse()
+        hex_editor.contextkw = contextkw
+        self.updating_editor = True
+        hex_editor._converting = True  # prevent the parsing of binary
+        try:
+            hex_editor.binary = binary
+        finally:
+            hex_editor._converting = False
+            self.updating_editor = False
+        editor = hex_editor.construct_editor
+        if editor.model.root_obj is not None:
+            self.expansion.save(editor, self.used_construct)
+        editor.model.root_obj = None  # not yet parsed
+        editor.show_parse_error_message(None, None)
+        editor.reload()
+        self.selection_timer = wx.CallLater(
+            self.selection_delay,
+            self.parse_selection,
+            self.selection_generation,
+            construct,
+            bytes(binary),
+            contextkw)
+
+    def parse_selection(self, generation, construct, binary, contextkw):
+        if generation != self.selection_generation:
+            return  # the selection changed
+        self.selection_timer = None
+        if self.selection_pool is None:
+            self.selection_pool = ParseWorkerPool(workers=1)
+        self.selection_job = self.selection_pool.submit(
+            construct, binary, contextkw)
+        self.collect_selection(generation)
+
+    def collect_selection(self, generation):
+        job = self.selection_job
+        if generation != self.selection_generation or job is None:
+            return  # cancelled
+        if not job.future.done():
+            wx.CallLater(10, self.collect_selection, generation)
+            return
+        self.selection_job = None
+        result = self.selection_pool.collect(job)
+        if result is not None:
+            self.metrics.observe("parse_time", result.duration)
+        self.update_editor(parsed=result)  # parses if result is None
+
+    def cancel_selection_parse(self):
+        """Cancel the pending parse of the selected element."""
+        self.selection_generation += 1
+        if self.selection_timer is not None:
+            self.selection_timer.Stop()
+            self.selection_timer = None
+        if self.selection_job is not None:
+            self.selection_job.future.cancel()  # if not yet started
+            self.selection_job = None
+
+    def schedule_prefetch(self):
+        """
+        Start prefetching the neighbours of the selected element after
+        PREFETCH_DELAY milliseconds without another selection.
+        """
+        self.cancel_prefetch()
+        if not self.prefetch_window or not self.parse_cache.max_bytes:
+            return
+        self.prefetch_timer = wx.CallLater(
+            self.PREFETCH_DELAY, self.prefetch, self.prefetch_generation)
+
+    def prefetch(self, generation):
+        """
+        Parse into the parse cache the prefetch_window elements before and
+        after the selected one (nearest first), one at a time in a
+        background thread, so that stepping through the gallery shows them
+        without parsing. Any new selection cancels the prefetching.
+        """
+        if generation != self.prefetch_generation:
+            return
+        self.prefetch_timer = None
+        lbx = self.gallery_selector_lbx
+        index = lbx.GetSelection()
+        if index == wx.NOT_FOUND:
+            return
+        count = lbx.GetCount()
+        self.prefetch_labels = [
+            lbx.GetString(n)
+            for distance in range(1, self.prefetch_window + 1)
+            for n in (index + distance, index - distance)
+            if 0 <= n < count
+        ]
+        self.prefetch_next(generation)
+
+    def prefetch_next(self, generation):
+        construct = self.construct_hex_editor.construct
+        while self.prefetch_labels:
+            label = self.prefetch_labels.pop(0)
+            if not self.gallery_dict.exists(label):
+                continue
+            contextkw = self.gallery_dict.peek_contextkw(label)
+            if contextkw is None:
+                continue  # invalid: reported when the element is selected
+            binary = self.gallery_dict.get_payload(label)
+            parsed = self.parse_results.get(label)
+            if parsed is not None and parsed.matches(
+                    construct, binary, contextkw):
+                continue
+            key = self.parse_cache.make_key(construct, binary, contextkw)
+            if self.parse_cache.contains(key, construct):
+                continue
+            if self.prefetch_pool is None:
+                self.prefetch_pool = ParseWorkerPool(workers=1)
+            self.prefetch_job = key, self.prefetch_pool.submit(
+                construct, bytes(binary), contextkw)
+            wx.CallLater(10, self.collect_prefetch, generation)
+            return
+
+    def collect_prefetch(self, generation):
+        if generation != self.prefetch_generation or not self.prefetch_job:
+            return  # cancelled
+        key, job = self.prefetch_job
+        if not job.future.done():
+            wx.CallLater(10, self.collect_prefetch, generation)
+            return
+        self.prefetch_job = None
+        result = self.prefetch_pool.collect(job)
+        if (result is not None and
+                result.construct is self.construct_hex_editor.construct):
+            self.parse_cache.put(
+                key, result.construct, result.value, result.error)
+            self.metrics.incr("prefetched")
+        self.prefetch_next(generation)
+
+    def cancel_prefetch(self):
+        self.prefetch_generation += 1
+        if self.prefetch_timer is not None:
+            self.prefetch_timer.Stop()
+            self.prefetch_timer = None
+        if self.prefetch_job is not None:
+            self.prefetch_job[1].future.cancel()  # if not yet started
+            self.prefetch_job = None
+        self.prefetch_labels = []
+
+    def stop_background_parsing(self):
+        """Cancel the parsing of the selection and the prefetching."""
+        self.cancel_selection_parse()
+        self.cancel_prefetch()
+        if self.selection_pool:
+            self.selection_pool.shutdown()
+        if self.prefetch_pool:
+            self.prefetch_pool.shutdown()
+
+    def show_binary(self, binary, contextkw, parsed=None):
+        """
+        Show binary in the editor. If parsed (ParseResult) is valid for the
+        current construct, binary and contextkw, or the parse cache holds
+        the object parsed from the same arguments, a copy of it is rendered
+        without parsing binary again; otherwise, a copy of the object parsed
+        by the editor is added to the parse cache. The editor changes the
+        object it shows when a value is edited, so it never shares it with
+        parse_results or the parse cache.
+        """
+        hex_editor = self.construct_hex_editor
+        hex_editor.contextkw = contextkw
+        construct = hex_editor.construct
+        key = self.parse_cache.make_key(construct, binary, contextkw)
+        if parsed is not None and parsed.matches(construct, binary, contextkw):
+            value, error = parsed.value, parsed.error
+            self.parse_cache.put(key, construct, value, error)
+        else:
+            cached = self.parse_cache.get(key, construct)
+            if cached is None:
+                start = time.perf_counter()
+                hex_editor.binary = binary  # parsed by the editor
+                self.metrics.observe(
+                    "parse_time", time.perf_counter() - start)
+                value = hex_editor.construct_editor.model.root_obj
+                if value is not None:  # not a parse error
+                    try:
+                        value = copy.deepcopy(value)
+                    except Exception:  # not copyable: not cached
+                        return
+                    self.parse_cache.put(key, construct, value)
+                return
+            value, error = cached
+        try:  # the editor changes its root_obj in place when edited
+            value = copy.deepcopy(value)
+        except Exception:  # not copyable: parsed by the editor
+            hex_editor.binary = binary
+            return
+        hex_editor._converting = True  # prevent the parsing of binary
+        try:
+            hex_editor.binary = binary
+        finally:
+            hex_editor._converting = False
+        editor = hex_editor.construct_editor
+        editor.model.root_obj = value
+        if error is None:
+            editor.show_parse_error_message(None, None)
+        else:
+            editor.show_parse_error_message(
+                "Error while parsing binary data: "
+                f"{type(error).__name__}\n{str(error)}",
+                error
+            )
+        editor.model.command_processor.clear_commands()
+        editor.reload()
+
+    def show_added_data(self, data, reference):
         if not self.construct_hex_editor.IsShown():
             self.construct_hex_editor.construct_editor.Show()
-            self.construct_hex_editor.contextkw = GalleryDict.get_contextkw(
-                reference)
-            self.construct_hex_editor.binary = data
-        if GalleryDict.len() == 0:
+            self.update_editor(
+                contextkw=self.gallery_dict.get_contextkw(reference),
+                binary=data)
+        if self.gallery_dict.len() == 0:
             self.status_message(self.added_data_label)
+
+    def store_data(self,
+                   data,
+                   reference=None,
+                   label=None,
+                   append_label=None,
+                   discard_duplicates=False,
+                   date_separator=" ",
+                   duplicate_separator="-",
+                   timestamp=None,
+                   parsed=None):
+        """
+        Store data in GalleryDict without updating the gallery selector.
+        parsed is an optional ParseResult precomputed for data (e.g., by a
+        ParseWorkerPool). Return a (result, label) tuple, where label is
+        None if nothing was stored (or, in upsert mode, if an existing
+        element was updated).
+        """
+        if self.upsert and (label or reference):
+            return self.upsert_data(
+                data,
+                reference=reference,
+                label=label,
+                append_label=append_label,
+                date_separator=date_separator,
+                timestamp=timestamp,
+                parsed=parsed)
+        utc_dt = timestamp or datetime.now(timezone.utc)
         if not label:
-            utc_dt = datetime.now(timezone.utc)
             label = utc_dt.astimezone().strftime(
                 '%y-%m-%d %H:%M:%S.%f').strip()
             if append_label:
                 label = label + date_separator + append_label
-        if GalleryDict.exists(label):
+        if self.gallery_dict.exists(label):
             if discard_duplicates:
-                return True
+                return True, None
             for i in range(1000):
                 new_label = label + duplicate_separator + str(i)
-                if not GalleryDict.exists(new_label):
+                if not self.gallery_dict.exists(new_label):
                     label = new_label
                     break
-            if GalleryDict.exists(label):
-                return False
-        GalleryDict.set(label, data, reference)
-        self.gallery_selector_lbx.Append(label)
-        return True
+            if self.gallery_dict.exists(label):
+                return False, None
+        self.gallery_dict.set(label, data, reference, timestamp=utc_dt)
+        if self.retention.enabled:
+            self.retention.add(label, len(data))
+        if parsed is not None:
+            self.parse_results[label] = parsed
+        return True, label
+
+    def upsert_data(self,
+                    data,
+                    reference=None,
+                    label=None,
+                    append_label=None,
+                    date_separator=" ",
+                    timestamp=None,
+                    parsed=None):
+        """
+        Upsert mode: each reference (with append_label, e.g., a MAC address
+        and a service UUID) has a single element, labelled with them, which
+        is updated in place. With history_size, the previous values are kept
+        in upsert_history. Return (result, label) like store_data(), with
+        label set only if a new element was created.
+        """
+        if not label:
+            label = str(reference)
+            if append_label:
+                label = label + date_separator + append_label
+        utc_dt = timestamp or datetime.now(timezone.utc)
+        inserted = not self.gallery_dict.exists(label)
+        if not inserted:
+            previous = self.gallery_dict.get_binary(label)
+            if self.history_size:
+                history = self.upsert_history.get(label)
+                if history is None:
+                    history = self.upsert_history[label] = deque(
+                        maxlen=self.history_size)
+                history.append((self.upsert_times.get(label), previous))
+            if (label == self.previous_selection and
+                    self.updated_selection_binary is None):
+                self.updated_selection_binary = previous
+        self.gallery_dict.set(label, data, reference, timestamp=utc_dt)
+        self.upsert_times[label] = utc_dt.timestamp()
+        if self.retention.enabled:
+            self.retention.add(label, len(data))  # moved to the newest
+        if parsed is not None:
+            self.parse_results[label] = parsed
+        else:
+            self.parse_results.pop(label, None)
+        return True, label if inserted else None
+
+    def get_history(self, label):
+        """
+        Previous values of an element updated in upsert mode, as a list of
+        (datetime, binary) tuples, the oldest first.
+        """
+        return [
+            (
+                datetime.fromtimestamp(timestamp, timezone.utc)
+                if timestamp is not None else None,
+                binary
+            )
+            for timestamp, binary in self.upsert_history.get(label, ())
+        ]
+
+    def refresh_updated_selection(self):
+        """
+        Show the new value of the selected element if it was updated in
+        upsert mode, unless the user has modified it in the editor.
+        """
+        previous = self.updated_selection_binary
+        if previous is None:
+            return
+        self.updated_selection_binary = None
+        label = self.previous_selection
+        if (not label or not self.gallery_dict.exists(label) or
+                self.construct_hex_editor.binary != previous):
+            return
+        self.update_editor(
+            contextkw=self.gallery_dict.get_contextkw(label),
+            binary=self.gallery_dict.get_payload(label),
+            parsed=self.parse_results.get(label))
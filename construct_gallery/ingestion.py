@@ -0,0 +1,238 @@
+#############################################################################
+# ingestion module
+#############################################################################
+
+import time
+import threading
+from collections import deque, OrderedDict
+from itertools import islice
+
+
+class IngestionQueue:
+    """
+    FIFO queue filled by a producer thread (e.g., the BLE thread) and drained
+    in batches by the GUI thread, so that many elements are inserted in the
+    gallery with a single operation instead of one wx.CallAfter per element.
+
+    "deque.append()" and "deque.popleft()" are thread-safe, so no lock is
+    needed between the producer and the consumer.
+    """
+
+    def __init__(self, max_batch_size=500, metrics=None):
+        self.max_batch_size = max_batch_size
+        self.metrics = metrics  # optional PipelineMetrics
+        self.queue = deque()
+        self.flushed = 0  # total number of drained elements
+        self.flush_latency = 0.0  # enqueue-to-insert delay of the last batch
+        self.max_flush_latency = 0.0
+        self.flush_duration = 0.0  # time spent by the consumer (last batch)
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def depth(self):
+        """Number of elements waiting to be drained."""
+        return len(self.queue)
+
+    def put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def clear(self):
+        self.queue.clear()
+
+    def flush(self, consumer, ready=None):
+        """
+        Drain up to max_batch_size elements and pass them to consumer as a
+        list. If ready is set, the batch stops at the first element for which
+        ready(element) is false, preserving the order. Return the number of
+        drained elements.
+        """
+        size = min(len(self.queue), self.max_batch_size)
+        if size and ready is not None:
+            for count, (_, item) in enumerate(islice(self.queue, size)):
+                if not ready(item):
+                    size = count
+                    break
+        if not size:
+            return 0
+        popleft = self.queue.popleft
+        batch = [popleft() for _ in range(size)]
+        start = time.monotonic()
+        consumer([item for _, item in batch])
+        end = time.monotonic()
+        self.flushed += size
+        self.flush_duration = end - start
+        self.flush_latency = end - batch[0][0]  # oldest element of the batch
+        if self.flush_latency > self.max_flush_latency:
+            self.max_flush_latency = self.flush_latency
+        if self.metrics:
+            self.metrics.observe_many(
+                "insert_latency", [end - queued for queued, _ in batch])
+            self.metrics.observe("flush_time", self.flush_duration)
+        return size
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.queue),
+            "flushed": self.flushed,
+            "flush_latency": self.flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "flush_duration": self.flush_duration,
+        }
+
+
+class RetentionPolicy:
+    """
+    Ring-buffer retention of the elements added to the gallery: the oldest
+    elements are evicted when their number exceeds max_entries, when they
+    are older than max_age seconds, or when the total size of their payloads
+    exceeds max_bytes. Each limit is disabled when None.
+
+    Elements are tracked in insertion order through an OrderedDict, so that
+    adding, discarding and evicting an element cost O(1).
+    """
+
+    def __init__(self, max_entries=None, max_age=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # label -> (insertion time, size)
+        self.total_bytes = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def enabled(self):
+        return bool(self.max_entries or self.max_age or self.max_bytes)
+
+    def add(self, label, size, now=None):
+        if label in self.entries:
+            self.discard(label)
+        self.entries[label] = (
+            time.monotonic() if now is None else now, size)
+        self.total_bytes += size
+
+    def discard(self, label):
+        value = self.entries.pop(label, None)
+        if value is not None:
+            self.total_bytes -= value[1]
+
+    def rename(self, label, new_label):
+        """
+        Rename an element, keeping its position in the eviction order and
+        its insertion time (the OrderedDict is rebuilt: O(n), but renaming
+        is done by the user).
+        """
+        if label not in self.entries or label == new_label:
+            return
+        self.discard(new_label)
+        items = list(self.entries.items())
+        self.entries.clear()
+        for key, value in items:
+            self.entries[new_label if key == label else key] = value
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def expired(self, now=None):
+        """Remove and return the labels to be evicted, oldest first."""
+        if not self.entries or not self.enabled:
+            return []
+        if now is None:
+            now = time.monotonic()
+        labels = []
+        entries = self.entries
+        while entries:
+            label, (insertion_time, size) = next(iter(entries.items()))
+            if not (
+                (self.max_entries and len(entries) > self.max_entries) or
+                (self.max_bytes and self.total_bytes > self.max_bytes) or
+                (self.max_age and now - insertion_time > self.max_age)
+            ):
+                break
+            entries.popitem(last=False)
+            self.total_bytes -= size
+            labels.append(label)
+        self.evicted += len(labels)
+        return labels
+
+    def stats(self):
+        return {
+            "retained": len(self.entries),
+            "retained_bytes": self.total_bytes,
+            "evicted": self.evicted,
+        }
+
+
+class DuplicateSuppressor:
+    """
+    Ingestion-side suppression of repeated payloads.
+
+    Modes:
+    - "change": a payload is accepted only if it differs from the last one
+      accepted for the same reference (and the same data key, like a
+      service UUID, when devices advertise more than one data type);
+    - "window": a payload is suppressed if the same (reference, payload)
+      pair was already received within the last "window" milliseconds;
+    - None: all payloads are accepted.
+
+    Payloads are compared through dictionary lookups (hash and equality of
+    the bytes). The number of suppressed payloads is counted per reference.
+    The methods can be called by any thread.
+    """
+    MODES = (None, "change", "window")
+
+    def __init__(self, mode=None, window=1000):
+        if mode not in self.MODES:
+            raise ValueError(
+                "Invalid duplicate suppression mode %r. Valid modes: %s" % (
+                    mode, self.MODES))
+        self.mode = mode
+        self.window = window / 1000
+        self.last_payload = {}  # (reference, data key) -> payload
+        self.last_seen = OrderedDict()  # (reference, payload) -> time
+        self.suppressed = {}  # reference -> count
+        self.lock = threading.Lock()
+
+    def accept(self, reference, data, data_key=None, now=None):
+        """Return False if the payload has to be suppressed."""
+        if not self.mode:
+            return True
+        with self.lock:
+            if self.mode == "change":
+                channel = (reference, data_key)
+                if self.last_payload.get(channel) == data:
+                    return self.suppress(reference)
+                self.last_payload[channel] = data
+                return True
+            if now is None:
+                now = time.monotonic()
+            last_seen = self.last_seen
+            while last_seen:  # purge the expired pairs (oldest first)
+                key, seen = next(iter(last_seen.items()))
+                if now - seen < self.window:
+                    break
+                last_seen.popitem(last=False)
+            key = (reference, bytes(data))
+            if key in last_seen:
+                return self.suppress(reference)
+            last_seen[key] = now
+            return True
+
+    def suppress(self, reference):
+        self.suppressed[reference] = self.suppressed.get(reference, 0) + 1
+        return False
+
+    def suppressed_counts(self):
+        with self.lock:
+            return dict(self.suppressed)
+
+    def reset(self):
+        with self.lock:
+            self.last_payload.clear()
+            self.last_seen.clear()
+            self.suppressed.clear()
@@ -0,0 +1,237 @@
+#############################################################################
+# journal module
+#############################################################################
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+JOURNAL_FORMAT = "construct-gallery-journal"
+JOURNAL_VERSION = 1
+
+
+def journal_header():
+    return json.dumps(
+        {"format": JOURNAL_FORMAT, "version": JOURNAL_VERSION}) + "\n"
+
+
+def journal_record(operation, **fields):
+    fields["op"] = operation
+    return json.dumps(fields, separators=(",", ":")) + "\n"
+
+
+class GalleryJournal:
+    """
+    Append-only journal of the changes of a gallery (JSON Lines), so that
+    saving costs O(changes) instead of rewriting the whole gallery.
+
+    Records:
+    - {"op": "set", "label": ..., "binary": hex, "reference": ...}: new or
+      changed element
+    - {"op": "del", "label": ...}: deleted element
+    - {"op": "clear"}: all elements deleted
+    - {"op": "keys", "key_descr": {...}, "replace": bool}: key/description
+      of the references (replaced or merged)
+
+    Records are buffered and flushed by a background thread at least every
+    flush_interval seconds (and every flush_records records), so that a crash
+    loses at most the last few records.
+
+    snapshot is a function returning the current state of the gallery, as a
+    (elements, key_descr_dict) tuple, where elements is an iterable of
+    (label, binary, reference) tuples. When the journal holds more than
+    compact_ratio records per element (and at least compact_min_records),
+    it is compacted in a background thread: the snapshot is written to a
+    temporary file, the records appended in the meanwhile are copied after
+    it and the file replaces the journal. A new journal (or an existing one,
+    with rewrite=True) is written by a compaction.
+
+    snapshot is called by the thread changing the gallery (e.g., the GUI
+    thread), so it should be cheap: elements is iterated by the compaction
+    thread, so it can be lazy, and binary can be any bytes-like object or
+    an object with a load() method returning the payload (e.g., an
+    ArchivePayload). Replaying a record of the snapshot again is harmless,
+    so elements may also include the changes made after snapshot().
+    """
+
+    def __init__(
+            self,
+            filename,
+            snapshot,
+            rewrite=True,
+            flush_interval=1.0,
+            flush_records=100,
+            compact_min_records=1000,
+            compact_ratio=2.0):
+        self.filename = filename
+        self.snapshot = snapshot
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.records = 0  # records in the journal file
+        self.live = 0  # elements of the last snapshot
+        self.written = 0  # records written since the journal was opened
+        self.pending = 0  # records not yet flushed
+        self.compactions = 0
+        self.compaction_thread = None
+        self.error = None
+        if rewrite or not is_journal_file(filename):
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write(journal_header())
+        self.file = open(filename, "a", encoding="utf-8")
+        self.stop_event = threading.Event()
+        self.flush_thread = threading.Thread(
+            target=self.run_flush, daemon=True)
+        self.flush_thread.start()
+        if rewrite:
+            self.compact()
+
+    def write(self, record):
+        with self.lock:
+            self.file.write(record)
+            self.records += 1
+            self.written += 1
+            self.pending += 1
+            if self.pending >= self.flush_records:
+                self.flush()
+        if (self.records >= self.compact_min_records and
+                self.records > self.compact_ratio * self.live):
+            self.compact()
+
+    def set(self, label, binary, reference=None):
+        self.write(journal_record(
+            "set", label=label, binary=binary.hex(), reference=reference))
+
+    def delete(self, label):
+        self.write(journal_record("del", label=label))
+
+    def clear(self):
+        self.write(journal_record("clear"))
+
+    def set_key_descr(self, key_descr_dict, replace=True):
+        self.write(journal_record(
+            "keys", key_descr=key_descr_dict, replace=replace))
+
+    def flush(self):
+        with self.lock:
+            if self.pending and not self.file.closed:
+                self.file.flush()
+            self.pending = 0
+
+    def run_flush(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    @property
+    def compacting(self):
+        return bool(
+            self.compaction_thread and self.compaction_thread.is_alive())
+
+    def compact(self):
+        """Start the compaction of the journal in a background thread."""
+        if self.compacting:
+            return False
+        with self.lock:
+            self.flush()
+            mark = os.path.getsize(self.filename)
+            elements, key_descr_dict = self.snapshot()
+        self.compaction_thread = threading.Thread(
+            target=self.run_compaction,
+            args=(elements, key_descr_dict, mark),
+            daemon=True)
+        self.compaction_thread.start()
+        return True
+
+    def run_compaction(self, elements, key_descr_dict, mark):
+        temp_filename = self.filename + ".tmp"
+        try:
+            live = 0
+            with open(temp_filename, "w", encoding="utf-8") as file:
+                file.write(journal_header())
+                file.write(journal_record(
+                    "keys", key_descr=key_descr_dict, replace=True))
+                for label, binary, reference in elements:
+                    if hasattr(binary, "load"):
+                        binary = binary.load()
+                    file.write(journal_record(
+                        "set",
+                        label=label,
+                        binary=binary.hex(),
+                        reference=reference))
+                    live += 1
+            with self.lock:  # append the records written in the meanwhile
+                self.flush()
+                self.file.close()
+                with open(self.filename, "rb") as journal:
+                    journal.seek(mark)
+                    tail = journal.read()
+                with open(temp_filename, "ab") as file:
+                    file.write(tail)
+                os.replace(temp_filename, self.filename)
+                self.records = live + 1 + tail.count(b"\n")
+                self.live = live
+                self.file = open(self.filename, "a", encoding="utf-8")
+            self.compactions += 1
+        except Exception as e:  # e.g., I/O error, closed archive or database
+            self.error = e
+            with self.lock:
+                if self.file.closed:
+                    self.file = open(self.filename, "a", encoding="utf-8")
+
+    def close(self):
+        self.stop_event.set()
+        if self.compaction_thread:
+            self.compaction_thread.join()
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+    def stats(self):
+        return {
+            "records": self.records,
+            "written": self.written,
+            "compactions": self.compactions,
+        }
+
+
+def is_journal_file(filename):
+    """Check the header of a file written by GalleryJournal."""
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+    except (OSError, ValueError):
+        return False
+    return isinstance(header, dict) and header.get("format") == JOURNAL_FORMAT
+
+
+def read_journal(filename):
+    """
+    Replay a journal, returning (elements, key_descr_dict), where elements
+    is an OrderedDict of label -> (binary, reference). A truncated last
+    record (e.g., after a crash) is ignored.
+    """
+    elements = OrderedDict()
+    key_descr_dict = {}
+    with open(filename, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            operation = record.get("op")
+            if operation == "set":
+                elements[record["label"]] = (
+                    bytes.fromhex(record["binary"]), record.get("reference"))
+            elif operation == "del":
+                elements.pop(record["label"], None)
+            elif operation == "clear":
+                elements.clear()
+            elif operation == "keys":
+                if record.get("replace"):
+                    key_descr_dict = dict(record["key_descr"])
+                else:
+                    key_descr_dict.update(record["key_descr"])
+    return elements, key_descr_dict
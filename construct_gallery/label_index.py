@@ -0,0 +1,193 @@
+#############################################################################
+# label_index module
+#############################################################################
+
+class LabelIndex:
+    """
+    Ordered list of the labels shown by a list widget, with a map of each
+    label to its position, so that finding a label (e.g., selecting it or
+    checking whether it is listed) does not scan the list.
+
+    The map stores absolute positions: removing the first label (the
+    usual eviction of the oldest element) only increments the base offset,
+    so appending and removing from the top keep the map valid in O(1).
+    Other insertions, deletions and renames invalidate the map, which is
+    rebuilt once, at the next lookup (as any deletion when labels are
+    duplicated; the first one is found).
+    """
+
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self.positions = {}  # label -> absolute position (base + index)
+        self.base = 0
+        self.duplicates = False
+        self.valid = False
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, n):
+        return self.labels[n]
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __contains__(self, label):
+        return self.find(label) != -1
+
+    def rebuild(self):
+        self.base = 0
+        self.positions = {}
+        for n, label in enumerate(self.labels):
+            self.positions.setdefault(label, n)
+        self.duplicates = len(self.positions) != len(self.labels)
+        self.valid = True
+
+    def find(self, label):
+        """Position of a label, or -1."""
+        if not self.valid:
+            self.rebuild()
+        position = self.positions.get(label)
+        if position is None:
+            return -1
+        return position - self.base
+
+    def missing(self, labels):
+        """Labels not in the list (in their order, without duplicates)."""
+        if not self.valid:
+            self.rebuild()
+        missing = []
+        seen = set()
+        for label in labels:
+            if label not in self.positions and label not in seen:
+                seen.add(label)
+                missing.append(label)
+        return missing
+
+    def append(self, label):
+        if self.valid:
+            if label in self.positions:
+                self.duplicates = True
+            else:
+                self.positions[label] = self.base + len(self.labels)
+        self.labels.append(label)
+
+    def extend(self, labels):
+        labels = list(labels)
+        if self.valid:
+            position = self.base + len(self.labels)
+            for n, label in enumerate(labels):
+                if label in self.positions:
+                    self.duplicates = True
+                else:
+                    self.positions[label] = position + n
+        self.labels.extend(labels)
+
+    def insert(self, labels, pos):
+        if pos >= len(self.labels):
+            self.extend(labels)
+            return
+        self.labels[pos:pos] = labels
+        self.valid = False
+
+    def delete(self, n):
+        label = self.labels.pop(n)
+        if n or self.duplicates or not self.valid:
+            self.valid = False
+            return
+        del self.positions[label]
+        self.base += 1
+
+    def set(self, n, label):
+        self.labels[n] = label
+        self.valid = False
+
+    def clear(self):
+        self.labels = []
+        self.positions = {}
+        self.base = 0
+        self.duplicates = False
+        self.valid = True
+
+
+class StoreLabels:
+    """
+    Labels of a gallery store which can read its elements by page (e.g.,
+    SqliteGalleryDict, with page(), position() and move()), with the
+    interface of LabelIndex, for a list showing all the elements of the
+    store in insertion order: the labels are read a page at a time when
+    they are shown and found through the position map of the store (see
+    SqliteGalleryDict.position()), without a copy in the list.
+
+    The changes are made to the store before the list: appending and
+    deleting only drop the cached page, while inserting or setting a label
+    moves the element to that position in the store (the list is reordered
+    by duplicating, renaming or moving up and down an element).
+    """
+    PAGE_SIZE = 256
+
+    def __init__(self, store, page_size=PAGE_SIZE):
+        self.store = store
+        self.page_size = page_size
+        self.invalidate()
+
+    def invalidate(self):
+        self.page_start = None
+        self.page = []
+        self.count = None  # number of elements when the page was read
+
+    def __len__(self):
+        return self.store.len()
+
+    def __getitem__(self, n):
+        count = self.store.len()
+        if n < 0:
+            n += count
+        if not 0 <= n < count:
+            raise IndexError(n)
+        start = n - n % self.page_size
+        if start != self.page_start or count != self.count:
+            self.page = self.store.page(start, self.page_size)
+            self.page_start = start
+            self.count = count
+        return self.page[n - start]
+
+    def __iter__(self):
+        return iter(self.store.keys())
+
+    def __contains__(self, label):
+        return self.store.exists(label)
+
+    def find(self, label):
+        """Position of a label, or -1."""
+        position = self.store.position(label)
+        return -1 if position is None else position
+
+    def missing(self, labels):
+        """All the elements of the store are listed."""
+        return []
+
+    def append(self, label):
+        self.store.move(label, self.store.len())  # no-op if just added
+        self.invalidate()
+
+    def extend(self, labels):
+        self.invalidate()
+
+    def insert(self, labels, pos):
+        if pos >= len(self):
+            self.extend(labels)
+            return
+        for n, label in enumerate(labels):
+            self.store.move(label, pos + n)
+        self.invalidate()
+
+    def delete(self, n):
+        self.invalidate()
+
+    def set(self, n, label):
+        self.store.move(label, n)
+        self.invalidate()
+
+    def clear(self):
+        self.invalidate()
@@ -0,0 +1,201 @@
+#############################################################################
+# metrics module
+#############################################################################
+
+import json
+import time
+import bisect
+import threading
+
+
+class Histogram:
+    """
+    Histogram with fixed bucket upper bounds (seconds by default); values
+    above the last bound are counted in an overflow bucket. Percentiles are
+    approximated by the upper bound of the bucket.
+    """
+    BOUNDS = (
+        0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+        0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0
+    )
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        threshold = self.count * percent / 100
+        total = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            total += count
+            if total >= threshold:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": list(self.buckets),
+        }
+
+
+class PipelineMetrics:
+    """
+    Counters, histograms and gauges of the BLE pipeline, updated by any
+    thread (BLE thread, parse workers, GUI thread).
+
+    Counters:
+    - received: advertisements received by the scanner
+    - filtered: advertisements dropped by the MAC/name filter
+    - deduplicated: packets dropped by the duplicate suppression
+    - queued: packets queued for the gallery
+    - inserted: elements inserted into the gallery
+    - evicted: elements removed by the retention policy
+    - editor_updates: updates of the editor (e.g., selection of an element)
+    - editor_parses: parses of the editor (at most one for each update)
+    - prefetched: elements parsed in advance into the parse cache
+
+    Histograms (seconds):
+    - insert_latency: delay between the reception of a packet and its
+      insertion into the gallery
+    - parse_time: parse time of a payload (GUI or worker)
+    - flush_time: time spent by the GUI to insert a batch of packets
+
+    Gauges are functions returning the current value of a quantity (e.g.,
+    the queue depth), registered with add_gauge().
+    """
+    COUNTERS = (
+        "received", "filtered", "deduplicated", "queued", "inserted", "evicted",
+        "editor_updates", "editor_parses", "prefetched"
+    )
+    HISTOGRAMS = ("insert_latency", "parse_time", "flush_time")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+        self.gauges = {}
+        self.start_time = time.monotonic()
+
+    def incr(self, name, count=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(value)
+
+    def observe_many(self, name, values):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            add = self.histograms[name].add
+            for value in values:
+                add(value)
+
+    def add_gauge(self, name, function):
+        self.gauges[name] = function
+
+    def reset(self):
+        with self.lock:
+            self.counters = dict.fromkeys(self.COUNTERS, 0)
+            for histogram in self.histograms.values():
+                histogram.reset()
+            self.start_time = time.monotonic()
+
+    def snapshot(self):
+        """Return a JSON serializable copy of all the metrics."""
+        gauges = {}
+        for name, function in self.gauges.items():
+            try:
+                gauges[name] = function()
+            except Exception:
+                gauges[name] = None
+        with self.lock:
+            return {
+                "time": time.time(),
+                "uptime": time.monotonic() - self.start_time,
+                "counters": dict(self.counters),
+                "gauges": gauges,
+                "histograms": {
+                    name: histogram.snapshot()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    @staticmethod
+    def rates(previous, current):
+        """Per-second rates of the counters between two snapshots."""
+        if not previous:
+            return dict.fromkeys(current["counters"], 0.0)
+        elapsed = current["uptime"] - previous["uptime"]
+        return {
+            name: (
+                (value - previous["counters"].get(name, 0)) / elapsed
+                if elapsed > 0 else 0.0
+            )
+            for name, value in current["counters"].items()
+        }
+
+
+class MetricsExporter:
+    """
+    Append a snapshot of PipelineMetrics (with the counter rates since the
+    previous one) to a JSON Lines file every interval seconds, in a daemon
+    thread, for offline analysis. A last snapshot is written by stop().
+    """
+
+    def __init__(self, metrics, filename, interval=10.0):
+        self.metrics = metrics
+        self.filename = filename
+        self.interval = interval
+        self.previous = None
+        self.written = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(self.interval + 1)
+        self.export()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def export(self):
+        snapshot = self.metrics.snapshot()
+        snapshot["rates"] = self.metrics.rates(self.previous, snapshot)
+        self.previous = snapshot
+        with open(self.filename, "a", encoding="utf-8") as file:
+            file.write(json.dumps(snapshot, default=str) + "\n")
+        self.written += 1
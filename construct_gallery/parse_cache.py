@@ -0,0 +1,121 @@
+#############################################################################
+# parse_cache module
+#############################################################################
+
+import sys
+import hashlib
+from collections import OrderedDict
+
+
+def contextkw_key(contextkw):
+    """Hashable, order-independent form of a contextkw dictionary."""
+    items = tuple(sorted(contextkw.items())) if contextkw else ()
+    try:
+        hash(items)
+    except TypeError:  # unhashable values (e.g., lists): use their repr
+        return repr(items)
+    return items
+
+
+def estimate_size(value):
+    """
+    Approximate memory size in bytes of a parsed object (construct
+    Container and ListContainer are dict and list subclasses).
+    """
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return size
+
+
+class ParseCache:
+    """
+    Bounded LRU cache of parsed objects (root_obj of the editor), keyed by
+    the identity of the construct, the normalized contextkw and the digest
+    of the payload, so that showing again a payload (the same element, or
+    an identical payload of another element) does not parse it.
+
+    The size of the entries is estimated when they are added: the least
+    recently used ones are evicted when the total exceeds max_bytes (no
+    caching if max_bytes is 0). Each entry keeps its construct, so that a
+    key is never matched by a different construct with a reused id; the
+    cache must be cleared when the construct module is reloaded.
+    """
+    ENTRY_SIZE = 200  # approximate overhead of an entry and its key
+
+    def __init__(self, max_bytes=32 << 20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clear()
+
+    def clear(self):
+        self.entries = OrderedDict()  # key -> (construct, value, error, size)
+        self.size = 0
+
+    @staticmethod
+    def make_key(construct, binary, contextkw):
+        return (
+            id(construct),
+            contextkw_key(contextkw),
+            hashlib.blake2b(binary, digest_size=16).digest(),
+        )
+
+    def get(self, key, construct):
+        """Return the cached (value, error) tuple, or None."""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] is not construct:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def contains(self, key, construct):
+        """Check whether an entry is cached (not counted as a lookup)."""
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] is construct
+
+    def put(self, key, construct, value, error=None):
+        if not self.max_bytes:
+            return
+        size = estimate_size(value) + self.ENTRY_SIZE
+        if size > self.max_bytes:
+            return
+        self.discard(key)
+        self.entries[key] = (construct, value, error, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry[3]
+            self.evictions += 1
+
+    def discard(self, key):
+        """Remove an entry."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[3]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
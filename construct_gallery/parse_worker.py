@@ -0,0 +1,241 @@
+#############################################################################
+# parse_worker module
+#############################################################################
+
+import time
+import threading
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Job submitted to ParseWorkerPool; construct, binary and contextkw are the
+# parse arguments, future returns the (value, error, duration) tuple.
+ParseJob = namedtuple("ParseJob", "future construct binary contextkw")
+# Job of ParseWorkerPool.submit_batch(); future returns a list of
+# (value, error, duration) tuples, one for each payload of binaries.
+ParseBatch = namedtuple("ParseBatch", "future construct binaries contextkw")
+
+# Objects created by the context factories in this process, for each
+# contextkw: {(name, contextkw items): object}, least recently used first;
+# at most CONTEXT_OBJECT_CACHE_SIZE objects are kept
+CONTEXT_OBJECT_CACHE_SIZE = 256
+context_object_cache = OrderedDict()
+context_object_lock = threading.Lock()
+context_generation = 0  # incremented by clear_context_objects()
+
+
+class ParseResult(
+        namedtuple(
+            "ParseResult", "construct binary contextkw value error duration")):
+    """
+    Result of the parsing of binary with construct and contextkw: value is
+    the parsed object (None if error is set), error is the exception raised
+    by the parser and duration the parse time in seconds.
+    """
+    __slots__ = ()
+
+    def matches(self, construct, binary, contextkw):
+        """Check whether the result is still valid for these arguments."""
+        return (
+            self.construct is construct and
+            self.binary == binary and
+            self.contextkw == contextkw
+        )
+
+
+def clear_context_objects(generation=None):
+    """
+    Drop the cached context objects of this process (e.g., when the key of
+    a reference changes or the construct module is reloaded). The workers
+    of a process pool drop theirs with their next job, which carries the
+    generation of the cache of the submitting process.
+    """
+    global context_generation
+    with context_object_lock:
+        context_object_cache.clear()
+        context_generation = (
+            context_generation + 1 if generation is None else generation)
+
+
+def with_context_objects(contextkw, context_factories, generation=None):
+    """
+    Return a copy of contextkw including the objects created by the
+    context_factories dictionary (name -> factory(contextkw)), e.g., a
+    cipher initialized with the key. The objects are created once for each
+    contextkw in each process and kept in a bounded LRU cache; if
+    generation differs from the one of the cache, the cache is cleared.
+    """
+    if generation is not None and generation != context_generation:
+        clear_context_objects(generation)
+    contextkw = dict(contextkw)
+    try:
+        items = tuple(sorted(contextkw.items()))
+        hash(items)
+    except TypeError:  # not hashable: no caching
+        items = None
+    for name, factory in context_factories.items():
+        if items is None:
+            contextkw[name] = factory(dict(contextkw))
+            continue
+        key = (name, items)
+        with context_object_lock:
+            cached = key in context_object_cache
+            if cached:
+                context_object_cache.move_to_end(key)
+                context_object = context_object_cache[key]
+        if not cached:
+            context_object = factory(dict(contextkw))
+            with context_object_lock:
+                context_object_cache[key] = context_object
+                while len(context_object_cache) > CONTEXT_OBJECT_CACHE_SIZE:
+                    context_object_cache.popitem(last=False)
+        contextkw[name] = context_object
+    return contextkw
+
+
+def parse_payload(
+        construct, binary, contextkw, context_factories=None, generation=None):
+    """Parse binary, returning a (value, error, duration) tuple."""
+    if context_factories:
+        contextkw = with_context_objects(
+            contextkw, context_factories, generation)
+    start = time.perf_counter()
+    try:
+        value = construct.parse(binary, **contextkw)
+        error = None
+    except Exception as e:
+        value = None
+        error = e
+    return value, error, time.perf_counter() - start
+
+
+def parse_batch(
+        construct, binaries, contextkw, context_factories=None,
+        generation=None):
+    """
+    Parse a list of payloads with the same construct and contextkw (e.g.,
+    all the payloads of a device), returning a list of (value, error,
+    duration) tuples. The context objects are resolved once for the batch.
+    """
+    if context_factories:
+        contextkw = with_context_objects(
+            contextkw, context_factories, generation)
+    return [
+        parse_payload(construct, binary, contextkw) for binary in binaries]
+
+
+class ParseWorkerPool:
+    """
+    Pool of threads (or processes) parsing payloads outside the GUI thread.
+
+    With processes=True, the construct, the payload, the contextkw and the
+    parsed objects must be picklable; a job whose data cannot be transferred
+    returns no result, so that the payload is parsed again by the GUI.
+    Threads are the default: parsing is done by the interpreter, but threads
+    still remove the parse time from the GUI thread.
+
+    context_factories is the dictionary of factories of the context objects
+    included in the contextkw (see GalleryDict); threads receive the
+    contextkw with its objects, while processes receive it without them and
+    create them with the factories (which must be picklable functions),
+    once for each contextkw (see clear_context_objects()).
+    """
+
+    def __init__(self, workers=2, processes=False, context_factories=None):
+        self.workers = workers
+        self.processes = processes
+        self.context_factories = context_factories or {}
+        executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=workers)
+        self.submitted = 0
+        self.parsed = 0
+        self.errors = 0
+        self.parse_time = 0.0
+
+    def transfer_arguments(self, contextkw):
+        """
+        contextkw, context factories and generation of the context objects
+        to be sent to the workers.
+        """
+        if not self.processes or not self.context_factories:
+            return contextkw, None, None
+        return (
+            {
+                name: value for name, value in contextkw.items()
+                if name not in self.context_factories
+            },
+            self.context_factories,
+            context_generation
+        )
+
+    def submit(self, construct, binary, contextkw):
+        """Submit a payload (any thread); return a ParseJob."""
+        self.submitted += 1
+        return ParseJob(
+            self.executor.submit(
+                parse_payload,
+                construct,
+                binary,
+                *self.transfer_arguments(contextkw)),
+            construct,
+            binary,
+            contextkw,
+        )
+
+    def submit_batch(self, construct, binaries, contextkw):
+        """
+        Submit a list of payloads parsed with the same construct and
+        contextkw; return a ParseBatch.
+        """
+        self.submitted += len(binaries)
+        return ParseBatch(
+            self.executor.submit(
+                parse_batch,
+                construct,
+                binaries,
+                *self.transfer_arguments(contextkw)),
+            construct,
+            binaries,
+            contextkw,
+        )
+
+    def collect(self, job):
+        """Return the ParseResult of a completed job, or None."""
+        try:
+            value, error, duration = job.future.result()
+        except Exception:  # e.g., data not picklable by a process pool
+            return None
+        self.parsed += 1
+        if error is not None:
+            self.errors += 1
+        self.parse_time += duration
+        return ParseResult(
+            job.construct, job.binary, job.contextkw, value, error, duration)
+
+    def collect_batch(self, job):
+        """Return the list of ParseResult of a completed batch, or None."""
+        try:
+            results = job.future.result()
+        except Exception:
+            return None
+        parse_results = []
+        for binary, (value, error, duration) in zip(job.binaries, results):
+            self.parsed += 1
+            if error is not None:
+                self.errors += 1
+            self.parse_time += duration
+            parse_results.append(ParseResult(
+                job.construct, binary, job.contextkw, value, error, duration))
+        return parse_results
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "parsed": self.parsed,
+            "parse_errors": self.errors,
+            "parse_time": self.parse_time,
+            "mean_parse_time": (
+                self.parse_time / self.parsed if self.parsed else 0.0),
+        }
@@ -0,0 +1,233 @@
+#############################################################################
+# payload_pool module
+#############################################################################
+
+import struct
+
+
+class PayloadPool:
+    """
+    Content-addressed pool of payloads with reference counts: identical
+    payloads stored in the gallery (e.g., the same advertisement received
+    many times under different labels) share a single bytes object. The
+    pool is keyed by the payload itself (bytes hash their content), so
+    lookups are exact.
+
+    add() returns the shared payload and increments its reference count;
+    release() decrements it, removing the payload from the pool when it is
+    no longer used. bytearray and memoryview payloads are copied to bytes,
+    so that they are shared too and the pool does not keep the buffer of
+    the caller alive; other objects (e.g., payloads of archives loaded on
+    demand) are returned unchanged and not counted.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.shared = {}  # payload -> shared payload
+        self.counts = {}  # payload -> reference count
+        self.references = 0
+        self.referenced_bytes = 0
+        self.stored_bytes = 0
+
+    def add(self, binary):
+        if isinstance(binary, (bytearray, memoryview)):
+            binary = bytes(binary)
+        elif type(binary) is not bytes:
+            return binary
+        shared = self.shared.get(binary)
+        if shared is None:
+            shared = self.shared[binary] = binary
+            self.counts[binary] = 0
+            self.stored_bytes += len(binary)
+        self.counts[binary] += 1
+        self.references += 1
+        self.referenced_bytes += len(binary)
+        return shared
+
+    def release(self, binary):
+        if type(binary) is not bytes or binary not in self.counts:
+            return
+        self.counts[binary] -= 1
+        self.references -= 1
+        self.referenced_bytes -= len(binary)
+        if not self.counts[binary]:
+            del self.counts[binary]
+            del self.shared[binary]
+            self.stored_bytes -= len(binary)
+
+    def count(self, binary):
+        """Number of references to a payload."""
+        return self.counts.get(binary, 0)
+
+    def compactable(self):
+        return False
+
+    def stats(self):
+        return {
+            "payloads": len(self.counts),
+            "references": self.references,
+            "stored_bytes": self.stored_bytes,
+            "referenced_bytes": self.referenced_bytes,
+            "dedup_ratio": (
+                self.referenced_bytes / self.stored_bytes
+                if self.stored_bytes else 1.0
+            ),
+        }
+
+
+class PayloadArena:
+    """
+    Compact alternative to PayloadPool: distinct payloads are copied into
+    large preallocated bytearray chunks (the arena), each one preceded by
+    its reference count (COUNT struct), and each element only holds the span
+    of its payload, an int (offset << 32 | length), so that no object is
+    allocated for each payload. view() returns a memoryview of a span.
+    Identical payloads share their span: they are found through the
+    hash of the payload, checking the content (payloads with colliding
+    hashes are stored separately). Payloads larger than a chunk are
+    returned unchanged (kept as bytes).
+
+    Chunks are never resized (a bytearray cannot be resized while views of
+    it exist) and the bytes of a payload are not overwritten: compact()
+    replaces the chunks, leaving the old ones unchanged for the views still
+    in use.
+    The space of the released payloads is reclaimed by compact(), which
+    copies the live payloads into new chunks when they are less than
+    compact_ratio of the used arena.
+    """
+    COUNT = struct.Struct("<I")
+
+    def __init__(self, chunk_size=1 << 20, compact_ratio=0.5):
+        self.chunk_size = chunk_size
+        self.compact_ratio = compact_ratio
+        self.clear()
+
+    def clear(self):
+        self.chunks = []
+        self.position = 0  # arena offset of the next payload
+        self.spans = {}  # hash of the payload -> span
+        self.references = 0
+        self.referenced_bytes = 0
+        self.stored_bytes = 0
+        self.payloads = 0
+
+    def allocate(self, binary, count=0):
+        length = len(binary)
+        size = self.COUNT.size + length
+        chunk, position = divmod(self.position, self.chunk_size)
+        if position + size > self.chunk_size:  # start a new chunk
+            chunk += 1
+            position = 0
+        while len(self.chunks) <= chunk:
+            self.chunks.append(bytearray(self.chunk_size))
+        self.COUNT.pack_into(self.chunks[chunk], position, count)
+        position += self.COUNT.size
+        self.chunks[chunk][position:position + length] = binary
+        offset = chunk * self.chunk_size + position
+        self.position = offset + length
+        self.stored_bytes += length
+        self.payloads += 1
+        return offset << 32 | length
+
+    def view(self, span):
+        chunk, position = divmod(span >> 32, self.chunk_size)
+        return memoryview(self.chunks[chunk])[
+            position:position + (span & 0xFFFFFFFF)]
+
+    def get_count(self, span):
+        chunk, position = divmod(span >> 32, self.chunk_size)
+        return self.COUNT.unpack_from(
+            self.chunks[chunk], position - self.COUNT.size)[0]
+
+    def set_count(self, span, count):
+        chunk, position = divmod(span >> 32, self.chunk_size)
+        self.COUNT.pack_into(
+            self.chunks[chunk], position - self.COUNT.size, count)
+
+    def add(self, binary):
+        if (not isinstance(binary, (bytes, bytearray, memoryview)) or
+                self.COUNT.size + len(binary) > self.chunk_size):
+            return binary
+        binary = bytes(binary)
+        key = hash(binary)
+        span = self.spans.get(key)
+        if span is None or self.view(span) != binary:
+            span = self.allocate(binary, 1)
+            if key not in self.spans:
+                self.spans[key] = span
+        else:
+            self.set_count(span, self.get_count(span) + 1)
+        self.references += 1
+        self.referenced_bytes += len(binary)
+        return span
+
+    def release(self, span):
+        if type(span) is not int:
+            return
+        count = self.get_count(span)
+        if not count:
+            return
+        length = span & 0xFFFFFFFF
+        self.set_count(span, count - 1)
+        self.references -= 1
+        self.referenced_bytes -= length
+        if count == 1:
+            key = hash(bytes(self.view(span)))
+            if self.spans.get(key) == span:
+                del self.spans[key]
+            self.stored_bytes -= length
+            self.payloads -= 1
+
+    def count(self, binary):
+        span = self.spans.get(hash(bytes(binary)))
+        if span is None or self.view(span) != binary:
+            return 0
+        return self.get_count(span)
+
+    def live_bytes(self):
+        return self.stored_bytes + self.payloads * self.COUNT.size
+
+    def compactable(self):
+        return (self.position > self.chunk_size and
+                self.live_bytes() < self.compact_ratio * self.position)
+
+    def compact(self, records):
+        """
+        Copy the live payloads into new chunks, updating the spans of
+        records (objects with a binary attribute).
+        """
+        chunks = self.chunks
+        self.chunks = []
+        self.position = self.stored_bytes = self.payloads = 0
+        moved = {}  # old span -> new span
+        for record in records:
+            span = record.binary
+            if type(span) is not int:
+                continue
+            if span not in moved:
+                chunk, position = divmod(span >> 32, self.chunk_size)
+                count = self.COUNT.unpack_from(
+                    chunks[chunk], position - self.COUNT.size)[0]
+                moved[span] = self.allocate(
+                    chunks[chunk][position:position + (span & 0xFFFFFFFF)],
+                    count)
+            record.binary = moved[span]
+        self.spans = {
+            key: moved[span]
+            for key, span in self.spans.items() if span in moved}
+
+    def stats(self):
+        return {
+            "payloads": self.payloads,
+            "references": self.references,
+            "stored_bytes": self.stored_bytes,
+            "referenced_bytes": self.referenced_bytes,
+            "dedup_ratio": (
+                self.referenced_bytes / self.stored_bytes
+                if self.stored_bytes else 1.0
+            ),
+            "arena_bytes": len(self.chunks) * self.chunk_size,
+            "garbage_bytes": self.position - self.live_bytes(),
+        }
@@ -0,0 +1,482 @@
+#############################################################################
+# sqlite_gallery module
+#############################################################################
+
+import gc
+import json
+import time
+import sqlite3
+import hashlib
+from datetime import datetime, timezone
+from .archive import ArchivePayload
+from .construct_gallery import GalleryDict, GalleryRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS elements (
+    id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL UNIQUE,
+    reference TEXT,
+    timestamp REAL,
+    hash BLOB
+);
+CREATE INDEX IF NOT EXISTS elements_reference ON elements (reference);
+CREATE INDEX IF NOT EXISTS elements_timestamp ON elements (timestamp);
+CREATE INDEX IF NOT EXISTS elements_hash ON elements (hash);
+CREATE TABLE IF NOT EXISTS payloads (
+    hash BLOB PRIMARY KEY,
+    binary BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = (
+    "INSERT INTO elements (label, reference, timestamp, hash) "
+    "VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (label) DO UPDATE SET "
+    "reference = COALESCE(excluded.reference, reference), "
+    "timestamp = COALESCE(excluded.timestamp, timestamp), "
+    "hash = excluded.hash"
+)
+INSERT_PAYLOAD = "INSERT OR IGNORE INTO payloads (hash, binary) VALUES (?, ?)"
+RELEASE_PAYLOAD = (  # delete a payload which is no longer referenced
+    "DELETE FROM payloads WHERE hash = ? AND NOT EXISTS "
+    "(SELECT 1 FROM elements WHERE hash = ?)"
+)
+RELEASE_PAYLOADS = (
+    "DELETE FROM payloads WHERE hash NOT IN "
+    "(SELECT hash FROM elements WHERE hash IS NOT NULL)"
+)
+SELECT_RECORD = (
+    "SELECT payloads.binary, elements.reference, elements.hash "
+    "FROM elements LEFT JOIN payloads USING (hash) "
+    "WHERE elements.label = ?"
+)
+SELECT_ELEMENTS = (
+    "SELECT elements.label, payloads.binary, elements.reference "
+    "FROM elements JOIN payloads USING (hash) "
+    "ORDER BY elements.id"
+)
+
+
+def payload_hash(binary):
+    """Content address of a payload."""
+    return hashlib.blake2b(binary, digest_size=16).digest()
+
+
+class SqliteGalleryDict(GalleryDict):
+    """
+    GalleryDict stored in a SQLite database (stdlib sqlite3), for galleries
+    which do not fit in memory. Elements are kept in insertion order, with
+    indexes on label, reference, timestamp and payload hash. Payloads are
+    content-addressed: each distinct payload is stored once in the payloads
+    table (keyed by its hash) and deleted when no element references it
+    (the references are counted through the hash index). The key and
+    description of the references are kept in memory and saved in the
+    database when they change.
+
+    The database uses WAL mode; writes are committed in batches (every
+    batch_size changes or commit_interval seconds, and by commit()), so that
+    the ingestion of many packets does not pay one transaction each.
+    update_dict() (e.g., loading a pickle file) imports all elements in a
+    single transaction. The database must be used by the thread which
+    created it (the GUI thread).
+    """
+
+    def __init__(
+            self,
+            filename,
+            reference_label,
+            key_label,
+            description_label,
+            batch_size=500,
+            commit_interval=1.0,
+            context_factories=None):
+        super().__init__(
+            reference_label,
+            key_label,
+            description_label,
+            context_factories=context_factories)
+        self.filename = filename
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.last_commit = time.monotonic()
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE name = 'key_descr'").fetchone()
+        if row:
+            self.key_descr_dict = json.loads(row[0])
+        self.count = self.connection.execute(
+            "SELECT COUNT(*) FROM elements").fetchone()[0]
+        self.positions = None  # label -> position + positions_base
+        self.positions_base = 0
+
+    # Transactions ##########################################################
+
+    def changed(self, changes=1):
+        self.pending += changes
+        if (self.pending >= self.batch_size or
+                time.monotonic() - self.last_commit >= self.commit_interval):
+            self.commit()
+
+    def commit(self):
+        if self.pending:
+            self.connection.commit()
+        self.pending = 0
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    # Key and description of the references ##############################
+
+    def save_key_descr(self):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            ("key_descr", json.dumps(self.key_descr_dict)))
+        self.changed()
+
+    def set_key_descr_dict(self, key_descr_dict):
+        super().set_key_descr_dict(key_descr_dict)
+        self.save_key_descr()
+
+    def update_key_descr_dict(self, key_descr_dict):
+        super().update_key_descr_dict(key_descr_dict)
+        self.save_key_descr()
+
+    def load_dict(self, file):
+        gallery_history = super().load_dict(file)
+        self.save_key_descr()
+        return gallery_history
+
+    def set_key(self, element, key):
+        result = super().set_key(element, key)
+        self.save_key_descr()
+        return result
+
+    def set_description(self, element, description):
+        result = super().set_description(element, description)
+        self.save_key_descr()
+        return result
+
+    # Elements ############################################################
+
+    def reset(self):
+        self.connection.execute("DELETE FROM elements")
+        self.connection.execute("DELETE FROM payloads")
+        self.pending += 1
+        self.commit()
+        self.count = 0
+        self.positions = None
+        if self.journal:
+            self.journal.clear()
+        self.close_archives()
+
+    def record_rows(self, element, record, timestamp=None):
+        """Return the row of the element and the row of its payload."""
+        binary = record.binary
+        if isinstance(binary, ArchivePayload):
+            binary = binary.load()
+        if isinstance(binary, (bytes, bytearray)):
+            binary = bytes(binary)
+            digest = payload_hash(binary)
+        else:
+            binary = digest = None
+        return (
+            (
+                element,
+                record.reference if self.reference_label else None,
+                timestamp,
+                digest,
+            ),
+            (digest, binary),
+        )
+
+    def update_dict(self, additional_dict):
+        make_record = self.make_record
+        gc_enabled = gc.isenabled()
+        gc.disable()  # no garbage collections while allocating the rows
+        try:
+            rows = [
+                self.record_rows(element, make_record(value))
+                for element, value in additional_dict.items()
+            ]
+        finally:
+            if gc_enabled:
+                gc.enable()
+        with self.connection:  # single transaction
+            self.connection.executemany(
+                INSERT_PAYLOAD, (row[1] for row in rows if row[1][0]))
+            self.connection.executemany(UPSERT, (row[0] for row in rows))
+            self.connection.execute(RELEASE_PAYLOADS)
+        self.count = self.connection.execute(
+            "SELECT COUNT(*) FROM elements").fetchone()[0]
+        self.positions = None
+        if self.journal:
+            for element in additional_dict:
+                self.write_journal(element)
+
+    def exists(self, element):
+        return self.connection.execute(
+            "SELECT 1 FROM elements WHERE label = ?", (element,)
+        ).fetchone() is not None
+
+    def len(self):
+        return self.count
+
+    def get_record(self, element):
+        row = self.connection.execute(SELECT_RECORD, (element,)).fetchone()
+        if row is None:
+            return None
+        return GalleryRecord(row[0], row[1])
+
+    def get_binary(self, element):
+        record = self.get_record(element)
+        if record is None or not isinstance(record.binary, bytes):
+            return None
+        return record.binary
+
+    def get_length(self, element):
+        row = self.connection.execute(
+            "SELECT LENGTH(payloads.binary) "
+            "FROM elements LEFT JOIN payloads USING (hash) "
+            "WHERE elements.label = ?", (element,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_timestamp(self, element):
+        row = self.connection.execute(
+            "SELECT timestamp FROM elements WHERE label = ?", (element,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return datetime.fromtimestamp(row[0], timezone.utc)
+
+    def set(self, element, binary, reference=None, timestamp=None):
+        previous = self.connection.execute(
+            "SELECT hash FROM elements WHERE label = ?", (element,)
+        ).fetchone()
+        element_row, payload_row = self.record_rows(
+            element,
+            GalleryRecord(binary, reference or None),
+            timestamp.timestamp() if timestamp else None)
+        if payload_row[0]:
+            self.connection.execute(INSERT_PAYLOAD, payload_row)
+        self.connection.execute(UPSERT, element_row)
+        if previous is None:
+            if self.positions is not None:  # appended
+                self.positions[element] = self.positions_base + self.count
+            self.count += 1
+        elif previous[0] and previous[0] != payload_row[0]:
+            self.connection.execute(
+                RELEASE_PAYLOAD, (previous[0], previous[0]))
+        self.changed()
+        if self.journal:
+            self.write_journal(element)
+
+    def get_reference(self, element):
+        if not self.reference_label:
+            return None, None
+        row = self.connection.execute(
+            "SELECT reference FROM elements WHERE label = ?", (element,)
+        ).fetchone()
+        if row is None:
+            return self.ref_elm, None
+        return self.ref_elm, row[0] or ""
+
+    def set_reference(self, element, reference):
+        if not self.reference_label or not reference:
+            return
+        self.connection.execute(
+            "UPDATE elements SET reference = ? WHERE label = ?",
+            (reference, element))
+        self.changed()
+        if self.journal and self.exists(element):
+            self.write_journal(element)
+
+    def delete(self, element):
+        if self.pop(element) is None:
+            raise KeyError(element)
+
+    def pop(self, element):
+        row = self.connection.execute(SELECT_RECORD, (element,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute(
+            "DELETE FROM elements WHERE label = ?", (element,))
+        if row[2]:
+            self.connection.execute(RELEASE_PAYLOAD, (row[2], row[2]))
+        self.count -= 1
+        if self.positions is not None:
+            if self.positions.pop(element, None) == self.positions_base:
+                self.positions_base += 1  # first element (e.g., evicted)
+            else:
+                self.positions = None
+        self.changed()
+        if self.journal:
+            self.journal.delete(element)
+        return GalleryRecord(row[0], row[1])
+
+    def keys(self):
+        return [
+            row[0] for row in self.connection.execute(
+                "SELECT label FROM elements ORDER BY id")
+        ]
+
+    def to_dict(self, element):
+        record = self.get_record(element)
+        value = {"binary": record.binary}
+        if record.reference and self.ref_elm:
+            value[self.ref_elm] = record.reference
+        return value
+
+    def snapshot(self):
+        """
+        State of the gallery for GalleryJournal compaction. The elements of
+        a database file are read by the compaction thread with its own
+        connection (after committing the pending changes), which sees a
+        consistent state of the database (WAL mode).
+        """
+        if self.filename == ":memory:":
+            return (
+                list(self.connection.execute(SELECT_ELEMENTS)),
+                dict(self.key_descr_dict)
+            )
+        self.pending += 1
+        self.commit()
+
+        def elements():
+            connection = sqlite3.connect(self.filename)
+            try:
+                yield from connection.execute(SELECT_ELEMENTS)
+            finally:
+                connection.close()
+
+        return elements(), dict(self.key_descr_dict)
+
+    def payload_stats(self):
+        payloads, stored_bytes = self.connection.execute(
+            "SELECT COUNT(*), TOTAL(LENGTH(binary)) FROM payloads"
+        ).fetchone()
+        references, referenced_bytes = self.connection.execute(
+            "SELECT COUNT(*), TOTAL(LENGTH(payloads.binary)) "
+            "FROM elements JOIN payloads USING (hash)"
+        ).fetchone()
+        return {
+            "payloads": payloads,
+            "references": references,
+            "stored_bytes": int(stored_bytes),
+            "referenced_bytes": int(referenced_bytes),
+            "dedup_ratio": (
+                referenced_bytes / stored_bytes if stored_bytes else 1.0
+            ),
+        }
+
+    def move(self, element, position):
+        """
+        Move an element before the element at position in the insertion
+        order (to the end if position is not lower than the number of
+        elements), e.g. to keep the order of the elements shown in the
+        gallery selector.
+        """
+        row = self.connection.execute(
+            "SELECT id FROM elements WHERE label = ?", (element,)
+        ).fetchone()
+        if row is None:
+            return
+        element_id = row[0]
+        execute = self.connection.execute
+        target = None
+        if position < self.count:
+            target = execute(
+                "SELECT id FROM elements ORDER BY id LIMIT 1 OFFSET ?",
+                (position,)
+            ).fetchone()
+        if target is None:  # to the end
+            last_id = execute("SELECT MAX(id) FROM elements").fetchone()[0]
+            if element_id == last_id:
+                return
+            execute(
+                "UPDATE elements SET id = ? WHERE id = ?",
+                (last_id + 1, element_id))
+        else:
+            target_id = target[0]
+            if element_id in (target_id, target_id - 1):
+                return
+            # Shift the elements in between by one, through negative ids so
+            # that no id is duplicated while updating; 0 is the free id of
+            # the moved element
+            execute("UPDATE elements SET id = 0 WHERE id = ?", (element_id,))
+            if element_id > target_id:  # up
+                execute(
+                    "UPDATE elements SET id = -(id + 1) "
+                    "WHERE id >= ? AND id < ?", (target_id, element_id))
+            else:  # down
+                execute(
+                    "UPDATE elements SET id = -(id - 1) "
+                    "WHERE id > ? AND id < ?", (element_id, target_id))
+                target_id -= 1
+            execute("UPDATE elements SET id = -id WHERE id < 0")
+            execute("UPDATE elements SET id = ? WHERE id = 0", (target_id,))
+        self.positions = None
+        self.changed()
+
+    # Queries #############################################################
+
+    def page(self, offset, limit):
+        """Labels of the elements from position offset (insertion order)."""
+        return [
+            row[0] for row in self.connection.execute(
+                "SELECT label FROM elements ORDER BY id LIMIT ? OFFSET ?",
+                (limit, offset))
+        ]
+
+    def position(self, element):
+        """
+        Position of an element in the insertion order, or None. The
+        positions of all elements are read once into a map (label ->
+        position), which stays valid while elements are appended and the
+        first one is removed (e.g., by the retention policy); other changes
+        of the order drop it, so that it is read again at the next lookup.
+        """
+        if self.positions is None:
+            self.positions = {
+                row[0]: n for n, row in enumerate(self.connection.execute(
+                    "SELECT label FROM elements ORDER BY id"))
+            }
+            self.positions_base = 0
+        position = self.positions.get(element)
+        if position is None:
+            return None
+        return position - self.positions_base
+
+    def labels_by_reference(self, reference, limit=-1):
+        return [
+            row[0] for row in self.connection.execute(
+                "SELECT label FROM elements WHERE reference = ? "
+                "ORDER BY id LIMIT ?", (reference, limit))
+        ]
+
+    def labels_by_time(self, start, end, limit=-1):
+        """Labels of the elements added between two datetime objects."""
+        return [
+            row[0] for row in self.connection.execute(
+                "SELECT label FROM elements WHERE timestamp BETWEEN ? AND ? "
+                "ORDER BY timestamp LIMIT ?",
+                (start.timestamp(), end.timestamp(), limit))
+        ]
+
+    def labels_by_payload(self, binary, limit=-1):
+        """Labels of the elements with the same payload."""
+        return [
+            row[0] for row in self.connection.execute(
+                "SELECT label FROM elements WHERE hash = ? "
+                "ORDER BY id LIMIT ?", (payload_hash(binary), limit))
+        ]
@@ -0,0 +1,88 @@
+#############################################################################
+# tree_expansion module
+#############################################################################
+
+from collections import deque
+
+
+class ExpansionPolicy:
+    """
+    Bounded expansion of the tree of a construct editor, replacing
+    expand_all(), which creates a row for each element of large arrays.
+
+    Entries are expanded breadth first (the shallow levels first), up to
+    max_depth levels (None = no limit), while the number of shown rows does
+    not exceed max_nodes (None = no limit). With keep_state, save() records
+    the paths of the expanded entries and apply() expands the same paths in
+    the tree of another payload parsed with the same construct, so that the
+    expansion chosen by the user is kept when moving through the gallery.
+    The state is kept for the construct passed to save() and apply(): the
+    one set by the application, as the construct of the editor is a copy
+    rebuilt each time it is set (None uses it). apply() never collapses
+    entries.
+    """
+
+    def __init__(self, max_depth=None, max_nodes=2000, keep_state=True):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.keep_state = keep_state
+        self.forget()
+
+    def forget(self):
+        self.construct = None  # construct of the saved state
+        self.expanded = None  # set of paths of the expanded entries
+
+    @staticmethod
+    def path(entry):
+        return tuple(entry.path)
+
+    def save(self, construct_editor, construct=None):
+        """Record the expanded entries of the editor."""
+        if not self.keep_state:
+            return
+        model = construct_editor.model
+        if model.root_entry is None:
+            return
+        expanded = set()
+        stack = list(model.get_children(None))
+        while stack:
+            entry = stack.pop()
+            if entry.subentries is None or not entry.row_expanded:
+                continue
+            expanded.add(self.path(entry))
+            stack.extend(model.get_children(entry))
+        if construct is None:
+            construct = construct_editor.construct
+        self.construct = construct
+        self.expanded = expanded
+
+    def apply(self, construct_editor, construct=None):
+        """Expand the tree of the editor; return the number of shown rows."""
+        model = construct_editor.model
+        if model.root_entry is None:
+            return 0
+        if construct is None:
+            construct = construct_editor.construct
+        saved = None
+        if self.keep_state and self.construct is construct:
+            saved = self.expanded
+        entries = model.get_children(None)
+        rows = len(entries)
+        queue = deque((entry, 1) for entry in entries)
+        while queue:
+            entry, depth = queue.popleft()
+            if entry.subentries is None:
+                continue
+            if saved is not None:
+                if self.path(entry) not in saved:
+                    continue
+            elif self.max_depth is not None and depth > self.max_depth:
+                continue
+            children = model.get_children(entry)
+            if self.max_nodes is not None and (
+                    rows + len(children) > self.max_nodes):
+                continue  # smaller entries of this level may still fit
+            construct_editor.expand_entry(entry)
+            rows += len(children)
+            queue.extend((child, depth + 1) for child in children)
+        return rows
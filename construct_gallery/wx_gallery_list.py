@@ -0,0 +1,245 @@
+import wx
+
+from .label_index import LabelIndex, StoreLabels
+
+
+class GalleryListCtrl(wx.ListCtrl):
+    """
+    Virtual list (wx.ListCtrl with LC_VIRTUAL) which can replace the
+    wx.ListBox of the gallery selector for large galleries: the labels are
+    kept in a Python list and the texts of the visible rows are computed on
+    demand by OnGetItemText(), without copying strings into the widget.
+
+    columns is a list of (heading, width, function) tuples, where
+    function(label) returns the text of the column; the first column is
+    usually the label. If store is set (a gallery store which can read its
+    elements by page, like SqliteGalleryDict), the list shows the elements
+    of the store and reads their labels by page when drawing them (see
+    StoreLabels), instead of keeping all of them in memory.
+
+    The subset of the wx.ListBox API used by ConstructGallery is implemented
+    (Append, InsertItems, Delete, Clear, GetCount, GetItems, GetString,
+    SetString, FindString, GetSelection, SetSelection, GetStringSelection,
+    SetStringSelection, HitTest) and the selection of a row by the user
+    generates wx.EVT_LISTBOX (and its activation wx.EVT_LISTBOX_DCLICK)
+    events, so that the list can be used in place of the wx.ListBox.
+    """
+
+    def __init__(self, parent, columns, store=None, name="gallery_list"):
+        super().__init__(
+            parent,
+            id=wx.ID_ANY,
+            style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL,
+            name=name
+        )
+        self.columns = columns
+        self.labels = LabelIndex() if store is None else StoreLabels(store)
+        self.selecting = False  # programmatic selection: no EVT_LISTBOX
+        self.selected_label = None  # kept when the rows shift in the store
+        for column, (heading, width, _) in enumerate(columns):
+            self.InsertColumn(column, heading, width=width)
+        self.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_item_selected)
+        self.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_item_activated)
+        # The generic implementation (e.g., wxGTK) draws the rows in a child
+        # window, which receives the mouse and key events: forward them
+        main_window = getattr(self, "GetMainWindow", None)
+        main_window = main_window() if main_window else None
+        if main_window and main_window is not self:
+            for event_type in (
+                    wx.EVT_MOTION,
+                    wx.EVT_ENTER_WINDOW,
+                    wx.EVT_LEAVE_WINDOW,
+                    wx.EVT_LEFT_DCLICK,
+                    wx.EVT_RIGHT_DOWN,
+                    wx.EVT_KEY_DOWN):
+                main_window.Bind(event_type, self.forward_event)
+
+    def OnGetItemText(self, item, column):
+        if item >= len(self.labels):
+            return ""
+        try:
+            return self.columns[column][2](self.labels[item])
+        except Exception:
+            return ""
+
+    def forward_event(self, event):
+        event.SetEventObject(self)
+        self.GetEventHandler().ProcessEvent(event)
+        event.Skip()  # default processing of the child window
+
+    def post_listbox_event(self, event_type, item):
+        event = wx.CommandEvent(event_type, self.GetId())
+        event.SetEventObject(self)
+        event.SetInt(item)
+        event.SetString(self.labels[item])
+        self.GetEventHandler().ProcessEvent(event)
+
+    def on_item_selected(self, event):
+        self.selected_label = self.labels[event.GetIndex()]
+        if not self.selecting:
+            self.post_listbox_event(wx.wxEVT_LISTBOX, event.GetIndex())
+
+    def on_item_activated(self, event):
+        self.post_listbox_event(wx.wxEVT_LISTBOX_DCLICK, event.GetIndex())
+
+    # wx.ListBox API ########################################################
+
+    def Append(self, item):
+        if isinstance(item, (list, tuple)):
+            self.labels.extend(item)
+        else:
+            self.labels.append(item)
+        self.SetItemCount(len(self.labels))
+
+    def InsertItems(self, items, pos):
+        selected = self.GetFirstSelected()
+        self.labels.insert(items, pos)
+        self.SetItemCount(len(self.labels))
+        if selected != wx.NOT_FOUND and selected >= pos:
+            selected += len(items)  # same as wx.ListBox
+            # an element of the store moved up may leave the selection out
+            self.SetSelection(
+                selected if selected < len(self.labels) else wx.NOT_FOUND)
+        self.Refresh()
+
+    def Delete(self, n):
+        selected = self.GetFirstSelected()
+        if n == selected:
+            self.SetSelection(wx.NOT_FOUND)
+        self.labels.delete(n)
+        self.SetItemCount(len(self.labels))
+        if selected > n:
+            self.SetSelection(selected - 1)
+        self.Refresh()
+
+    def Clear(self):
+        self.SetSelection(wx.NOT_FOUND)
+        self.labels.clear()
+        self.SetItemCount(0)
+        self.Refresh()
+
+    def GetCount(self):
+        return len(self.labels)
+
+    def GetItems(self):
+        return list(self.labels)
+
+    def GetString(self, n):
+        return self.labels[n]
+
+    def SetString(self, n, string):
+        if n == self.GetFirstSelected():
+            self.selected_label = string
+        self.labels.set(n, string)
+        self.Refresh()
+
+    def FindString(self, string, caseSensitive=False):
+        if not caseSensitive:
+            string = string.lower()
+            for index, label in enumerate(self.labels):
+                if label.lower() == string:
+                    return index
+            return wx.NOT_FOUND
+        return self.labels.find(string)
+
+    def GetSelection(self):
+        return self.GetFirstSelected()
+
+    def SetSelection(self, n):
+        self.selecting = True
+        try:
+            selected = self.GetFirstSelected()
+            if selected != wx.NOT_FOUND and selected != n:
+                self.Select(selected, False)
+            self.selected_label = None
+            if n != wx.NOT_FOUND:
+                self.Select(n)
+                self.Focus(n)
+                self.selected_label = self.labels[n]
+        finally:
+            self.selecting = False
+
+    def GetStringSelection(self):
+        if self.GetFirstSelected() == wx.NOT_FOUND:
+            return ""
+        return self.selected_label or ""
+
+    def SetStringSelection(self, string):
+        index = self.FindString(string, True)
+        if index == wx.NOT_FOUND:
+            return False
+        self.SetSelection(index)
+        return True
+
+    def HitTest(self, point):
+        item, _ = super().HitTest(point)
+        return item
+
+    def append_missing(self, items):
+        """Append in a single insertion the items which are not listed."""
+        missing = self.labels.missing(items)
+        self.Append(missing)  # also updates the number of rows of a store
+        return len(missing)
+
+
+class GalleryListBox(wx.ListBox):
+    """
+    wx.ListBox of the gallery selector keeping a LabelIndex of its items,
+    so that finding or selecting a label and reconciling the list with the
+    gallery do not scan the items of the widget.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.labels = LabelIndex(super().GetItems())
+
+    def Append(self, item):
+        if isinstance(item, (list, tuple)):
+            if not item:
+                return
+            super().Append(list(item))
+            self.labels.extend(item)
+        else:
+            super().Append(item)
+            self.labels.append(item)
+
+    def InsertItems(self, items, pos):
+        super().InsertItems(items, pos)
+        self.labels.insert(items, pos)
+
+    def Delete(self, n):
+        super().Delete(n)
+        self.labels.delete(n)
+
+    def Clear(self):
+        super().Clear()
+        self.labels.clear()
+
+    def GetItems(self):
+        return list(self.labels.labels)
+
+    def GetString(self, n):
+        return self.labels[n]
+
+    def SetString(self, n, string):
+        super().SetString(n, string)
+        self.labels.set(n, string)
+
+    def FindString(self, string, caseSensitive=False):
+        if caseSensitive:
+            return self.labels.find(string)
+        return super().FindString(string, caseSensitive)
+
+    def SetStringSelection(self, string):
+        index = self.labels.find(string)
+        if index == wx.NOT_FOUND:
+            return False
+        self.SetSelection(index)
+        return True
+
+    def append_missing(self, items):
+        """Append in a single insertion the items which are not listed."""
+        missing = self.labels.missing(items)
+        if missing:
+            self.Append(missing)
+        return len(missing)
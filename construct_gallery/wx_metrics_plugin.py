@@ -0,0 +1,84 @@
+import wx
+from .metrics import PipelineMetrics
+
+
+class MetricsWindow(wx.Frame):
+    """
+    Window showing the live counters (with their rate per second), gauges
+    and histograms of a PipelineMetrics object, refreshed every second.
+    """
+    COLUMNS = ("Metric", "Value", "Rate/s", "p50", "p95", "Max")
+
+    def __init__(self, parent, metrics, refresh_interval=1000):
+        super().__init__(
+            parent,
+            title="Scanner metrics",
+            size=(620, 420),
+            style=wx.DEFAULT_FRAME_STYLE | wx.FRAME_FLOAT_ON_PARENT
+        )
+        self.metrics = metrics
+        self.previous = None
+        self.list_ctrl = wx.ListCtrl(
+            self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for column, heading in enumerate(self.COLUMNS):
+            self.list_ctrl.InsertColumn(
+                column, heading, width=170 if column == 0 else 85)
+        reset_button = wx.Button(self, wx.ID_ANY, label="Reset")
+        reset_button.Bind(wx.EVT_BUTTON, self.on_reset)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.list_ctrl, 1, wx.EXPAND)
+        sizer.Add(reset_button, 0, wx.ALIGN_RIGHT | wx.ALL, 5)
+        self.SetSizer(sizer)
+
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        self.refresh_interval = refresh_interval
+        self.refresh()
+
+    def show(self):
+        self.refresh()
+        self.timer.Start(self.refresh_interval)
+        self.Show(True)
+        self.Raise()
+
+    def on_timer(self, event):
+        self.refresh()
+
+    def on_close(self, event):  # hide, so that the window can be reopened
+        self.timer.Stop()
+        self.Hide()
+
+    def on_reset(self, event):
+        self.metrics.reset()
+        self.previous = None
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        rates = PipelineMetrics.rates(self.previous, snapshot)
+        self.previous = snapshot
+        rows = []
+        for name, value in snapshot["counters"].items():
+            rows.append((name, str(value), "%.1f" % rates[name], "", "", ""))
+        for name, value in snapshot["gauges"].items():
+            rows.append((name, str(value), "", "", "", ""))
+        for name, histogram in snapshot["histograms"].items():
+            rows.append((
+                name + " (ms)",
+                str(histogram["count"]),
+                "",
+                "%.3f" % (histogram["p50"] * 1000),
+                "%.3f" % (histogram["p95"] * 1000),
+                "%.3f" % (histogram["max"] * 1000),
+            ))
+        self.list_ctrl.Freeze()
+        if self.list_ctrl.GetItemCount() != len(rows):
+            self.list_ctrl.DeleteAllItems()
+            for row in rows:
+                self.list_ctrl.Append(row)
+        else:
+            for index, row in enumerate(rows):
+                for column, value in enumerate(row):
+                    self.list_ctrl.SetItem(index, column, value)
+        self.list_ctrl.Thaw()
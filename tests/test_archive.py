@@ -0,0 +1,52 @@
+import pytest
+
+from construct_gallery.archive import (
+    GalleryArchive, ArchivePayload, write_archive, is_archive_file)
+
+
+def test_index_round_trip(tmp_path):
+    filename = str(tmp_path / "gallery.cgarch")
+    elements = [
+        ("a", b"\x01\x02", "dev1"),
+        ("b", b"\x03", None),
+        ("c", b"\x01\x02", "dev2"),  # same payload as "a"
+        ("d", b"", "dev1"),
+    ]
+    key_descr = {"dev1": {"key": "k", "description": "sensor"}}
+    assert write_archive(filename, elements, key_descr) == 4
+    assert is_archive_file(filename)
+    assert not (tmp_path / "gallery.cgarch.tmp").exists()
+    archive = GalleryArchive(filename)
+    try:
+        assert len(archive) == 4
+        assert archive.key_descr_dict == key_descr
+        loaded = archive.elements()
+        assert list(loaded) == ["a", "b", "c", "d"]
+        for label, binary, reference in elements:
+            payload, loaded_reference = loaded[label]
+            assert isinstance(payload, ArchivePayload)
+            assert len(payload) == len(binary)
+            assert payload.load() == binary
+            assert loaded_reference == reference
+        assert loaded["a"][0].offset == loaded["c"][0].offset
+    finally:
+        archive.close()
+    archive.close()  # closing twice is harmless
+
+
+def test_identical_payloads_are_written_once(tmp_path):
+    single = tmp_path / "single.cgarch"
+    double = tmp_path / "double.cgarch"
+    write_archive(str(single), [("a", bytes(100), None)], {})
+    write_archive(
+        str(double), [("a", bytes(100), None), ("b", bytes(100), None)], {})
+    assert double.stat().st_size - single.stat().st_size < 100
+
+
+def test_not_an_archive(tmp_path):
+    filename = tmp_path / "other.bin"
+    filename.write_bytes(b"\x00" * 64)
+    assert not is_archive_file(str(filename))
+    assert not is_archive_file(str(tmp_path / "missing"))
+    with pytest.raises(ValueError):
+        GalleryArchive(str(filename))
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from construct_gallery.ble_backends import ScannerBackend, SyntheticBackend
+
+
+def advertisements(backend, count):
+    return [backend.next_advertisement() for _ in range(count)]
+
+
+def test_synthetic_backend_is_deterministic():
+    kwargs = dict(devices=5, mutation_rate=0.5, manufacturer_ratio=0.5)
+    first = advertisements(SyntheticBackend(seed=7, **kwargs), 50)
+    assert first == advertisements(SyntheticBackend(seed=7, **kwargs), 50)
+    assert first != advertisements(SyntheticBackend(seed=8, **kwargs), 50)
+    addresses = {device.address for device, _ in first}
+    assert len(addresses) == 5
+    for device, adv in first:
+        assert adv.local_name == device.name
+        payloads = list(adv.service_data.values())
+        payloads += adv.manufacturer_data.values()
+        assert len(payloads) == 1 and len(payloads[0]) == 16
+
+
+def test_synthetic_scan_stops_after_count():
+    backend = SyntheticBackend(devices=3, rate=0, count=2500)
+    received = []
+
+    async def scan():
+        stop_event = asyncio.Event()
+        await backend.scan(
+            lambda device, adv: received.append(device.address), stop_event)
+        assert stop_event.is_set()
+
+    asyncio.run(scan())
+    assert len(received) == backend.sent == 2500
+
+
+def test_scanner_backend_is_abstract():
+    with pytest.raises(TypeError):
+        ScannerBackend()
@@ -0,0 +1,15 @@
+from construct_gallery.ble_benchmark import run_benchmark
+
+
+def test_benchmark():
+    snapshot = run_benchmark(
+        devices=10, count=3000, flush_interval=10, dedup_mode="change")
+    counters = snapshot["counters"]
+    assert counters["received"] == 3000
+    assert counters["filtered"] == 0
+    assert counters["deduplicated"] + counters["queued"] == 3000
+    assert counters["deduplicated"] > 0
+    assert counters["inserted"] == counters["queued"]
+    assert snapshot["histograms"]["insert_latency"]["count"] == (
+        counters["inserted"])
+    assert snapshot["received_rate"] > 0
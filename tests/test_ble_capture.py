@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from construct_gallery.ble_capture import (
+    AdvData, AdvDevice, CaptureReplay, CaptureWriter, is_capture_file,
+    read_capture)
+from construct_gallery.ingestion import IngestionQueue
+from construct_gallery.metrics import PipelineMetrics
+
+
+def advertisement(n):
+    return AdvData(
+        local_name="dev%d" % n,
+        manufacturer_data={0x0499: bytes([n, 0xff])},
+        service_data={"0000181a-0000-1000-8000-00805f9b34fb": bytes([n])},
+        service_uuids=["0000181a-0000-1000-8000-00805f9b34fb"],
+        tx_power=None,
+        rssi=-60 - n,
+        platform_data=(),
+    )
+
+
+@pytest.fixture
+def capture_file(tmp_path):
+    filename = str(tmp_path / "capture.jsonl")
+    with CaptureWriter(filename) as writer:
+        for n in range(3):
+            writer.write(
+                AdvDevice("A4:C1:38:00:00:%02X" % n, "dev%d" % n),
+                advertisement(n),
+                datetime.fromtimestamp(1700000000 + n, timezone.utc))
+    return filename
+
+
+def test_capture_round_trip(capture_file):
+    assert is_capture_file(capture_file)
+    records = list(read_capture(capture_file))
+    assert len(records) == 3
+    for n, (timestamp, device, adv) in enumerate(records):
+        assert timestamp == datetime.fromtimestamp(
+            1700000000 + n, timezone.utc)
+        assert device == AdvDevice("A4:C1:38:00:00:%02X" % n, "dev%d" % n)
+        assert adv == advertisement(n)
+
+
+def test_capture_append_and_truncated_line(capture_file):
+    with CaptureWriter(capture_file) as writer:
+        writer.write(AdvDevice("A4:C1:38:00:00:03", None), advertisement(3))
+        assert writer.written == 1
+    with open(capture_file, "a", encoding="utf-8") as file:
+        file.write('{"time": 1700000009, "addr')  # crash while writing
+    with open(capture_file, encoding="utf-8") as file:
+        assert sum('"format"' in line for line in file) == 1
+    records = list(read_capture(capture_file))
+    assert [device.address[-2:] for _, device, _ in records] == [
+        "00", "01", "02", "03"]
+
+
+def test_not_a_capture_file(tmp_path):
+    filename = tmp_path / "data.txt"
+    filename.write_text("not a capture\n")
+    assert not is_capture_file(str(filename))
+    assert not is_capture_file(str(tmp_path / "missing.jsonl"))
+
+
+def test_replay_at_maximum_speed(capture_file):
+    records = []
+    replay = CaptureReplay(
+        capture_file, lambda *record: records.append(record), speed=0)
+    replay.start()
+    replay.thread.join(5)
+    assert not replay.is_alive()
+    assert replay.error is None
+    assert records == list(read_capture(capture_file))
+    stats = replay.stats()
+    assert stats["replayed"] == 3
+    assert stats["elapsed"] < 1  # not paced by the 2 s of the capture
+
+
+def test_replay_stop(capture_file):
+    records = []
+    replay = CaptureReplay(
+        capture_file, lambda *record: records.append(record), speed=1)
+    replay.start()
+    replay.stop()
+    replay.thread.join(5)
+    assert not replay.is_alive()
+    assert len(records) <= 1
+
+
+def test_replay_missing_file(tmp_path):
+    replay = CaptureReplay(str(tmp_path / "missing.jsonl"), print, speed=0)
+    replay.run()
+    assert isinstance(replay.error, OSError)
+    assert replay.replayed == 0
+
+
+def test_end_of_replay(capture_file):
+    pytest.importorskip("wx")
+    pytest.importorskip("construct_editor")
+    from construct_gallery.bleak_scanner_construct import (
+        BleakScannerConstruct)
+
+    scanner = BleakScannerConstruct.__new__(BleakScannerConstruct)
+    scanner.parse_pool = None
+    scanner.construct_hex_editor = None
+    scanner.metrics = PipelineMetrics()
+    scanner.ingestion_queue = IngestionQueue(metrics=scanner.metrics)
+    scanner.apply_retention = lambda: None
+    messages = []
+    scanner.status_message = messages.append
+    scanner.replay_inserted = 0
+    scanner.replay = CaptureReplay(
+        capture_file,
+        lambda *record: scanner.ingestion_queue.put(record),
+        speed=0)
+    scanner.replay.start()
+    scanner.replay.thread.join(5)
+    scanner.add_data_list = (
+        lambda batch: scanner.metrics.incr("inserted", len(batch)))
+    scanner.on_flush_timer(None)  # inserts the queued packets
+    assert scanner.replay is not None
+    scanner.on_flush_timer(None)  # queue drained: end of replay
+    assert scanner.replay is None
+    assert scanner.replay_stats["replayed"] == 3
+    assert scanner.replay_stats["inserted"] == 3
+    assert messages[-1].startswith("Replayed 3 advertisements")
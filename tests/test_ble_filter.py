@@ -0,0 +1,52 @@
+from construct_gallery.ble_filter import (
+    PrefixMatcher, AdvertisementFilter, split_filter)
+
+
+def test_split_filter():
+    assert split_filter("") == []
+    assert split_filter(" A4:C1 ; !A4:C1:38,  LYWSD ") == [
+        "A4:C1", "!A4:C1:38", "LYWSD"]
+
+
+def test_prefix_matcher():
+    matcher = PrefixMatcher(["a4:c1", "11:22:33"], ignore_case=True)
+    assert len(matcher) == 2
+    assert matcher.match("A4:C1:38:00:00:01")
+    assert matcher.match("11:22:33:44:55:66")
+    assert not matcher.match("11:22:34:44:55:66")
+    assert not matcher.match("")
+    assert not PrefixMatcher(["ATC"]).match("atc_1234")
+
+
+def test_mac_allow_and_deny():
+    adv_filter = AdvertisementFilter(filter_mac="a4:c1, !A4:C1:38")
+    assert adv_filter.match("A4:C1:11:22:33:44", "name")
+    assert not adv_filter.match("A4:C1:38:22:33:44", "name")
+    assert not adv_filter.match("11:22:33:44:55:66", "name")
+    stats = adv_filter.stats()
+    assert stats["received"] == 3
+    assert stats["passed"] == 1
+    assert stats["mac_allow_hit"] == 1
+    assert stats["mac_allow_miss"] == 1
+    assert stats["mac_deny_hit"] == 1
+
+
+def test_name_filter_and_mac_file(tmp_path):
+    mac_file = tmp_path / "macs.txt"
+    mac_file.write_text("# allowed devices\n\nA4:C1:38\n")
+    adv_filter = AdvertisementFilter(
+        filter_name="ATC, !ATC_BAD", filter_mac_files=[str(mac_file)])
+    assert adv_filter.match("A4:C1:38:00:00:01", "ATC_1234")
+    assert not adv_filter.match("A4:C1:38:00:00:01", "ATC_BAD1")
+    assert not adv_filter.match("A4:C1:38:00:00:01", "LYWSD03")
+    assert not adv_filter.match("A4:C1:39:00:00:01", "ATC_1234")
+    assert not adv_filter.match("A4:C1:38:00:00:01", None)
+
+
+def test_no_filter_passes_everything():
+    adv_filter = AdvertisementFilter()
+    assert adv_filter.match("11:22:33:44:55:66", None)
+    adv_filter.compile(filter_mac="A4")
+    assert not adv_filter.match("11:22:33:44:55:66", None)
+    adv_filter.reset_counters()
+    assert adv_filter.stats()["received"] == 0
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+
+import pytest
+
+wx = pytest.importorskip("wx")
+pytest.importorskip("construct_editor")
+
+from construct_gallery.construct_gallery import (  # noqa: E402
+    ConstructGallery, GalleryDict)
+from construct_gallery.ingestion import RetentionPolicy  # noqa: E402
+from construct_gallery.metrics import PipelineMetrics  # noqa: E402
+
+MAC = "A4:C1:38:00:00:01"
+OTHER_MAC = "A4:C1:38:00:00:02"
+
+
+class Construct:
+    def __init__(self):
+        self.parsed = []
+
+    def parse(self, binary, **contextkw):
+        self.parsed.append(binary)
+        return {"value": binary[0], "bindkey": contextkw["bindkey"]}
+
+
+class HexEditor:
+    def __init__(self):
+        self.construct = Construct()
+
+
+def make_gallery(**attributes):
+    """ConstructGallery with the attributes used by the tests, without GUI"""
+    gallery = ConstructGallery.__new__(ConstructGallery)
+    defaults = dict(
+        gallery_dict=GalleryDict("MAC address", "Bindkey", "Description"),
+        construct_hex_editor=HexEditor(),
+        retention=RetentionPolicy(),
+        metrics=PipelineMetrics(),
+        parse_results={},
+        parse_pool=None,
+        reparse_jobs=[],
+        reparse_start=None,
+        upsert=False,
+        history_size=0,
+        upsert_times={},
+        upsert_history={},
+        previous_selection=None,
+        updated_selection_binary=None,
+        messages=[],
+    )
+    defaults.update(attributes)
+    for name, value in defaults.items():
+        setattr(gallery, name, value)
+    gallery.status_message = gallery.messages.append
+    return gallery
+
+
+def timestamp(second):
+    return datetime.fromtimestamp(1700000000 + second, timezone.utc)
+
+
+def test_upsert_updates_in_place():
+    gallery = make_gallery(upsert=True, history_size=2)
+    result, label = gallery.store_data(
+        b"\x01", reference=MAC, append_label="svc", timestamp=timestamp(0))
+    assert result and label == MAC + " svc"
+    for n in (2, 3, 4):
+        assert gallery.store_data(
+            bytes([n]), reference=MAC, append_label="svc",
+            timestamp=timestamp(n)) == (True, None)
+    assert gallery.gallery_dict.len() == 1
+    assert gallery.gallery_dict.get_binary(label) == b"\x04"
+    assert gallery.upsert_times[label] == timestamp(4).timestamp()
+    assert gallery.get_history(label) == [
+        (timestamp(2), b"\x02"), (timestamp(3), b"\x03")]
+    _, other_label = gallery.store_data(
+        b"\x05", reference=OTHER_MAC, append_label="svc")
+    assert other_label == OTHER_MAC + " svc"
+    assert gallery.gallery_dict.len() == 2
+
+
+def test_upsert_of_the_selected_element():
+    gallery = make_gallery(upsert=True)
+    _, label = gallery.store_data(b"\x01", reference=MAC)
+    gallery.previous_selection = label
+    gallery.store_data(b"\x02", reference=MAC)
+    gallery.store_data(b"\x03", reference=MAC)
+    # the value shown by the editor, until refresh_updated_selection()
+    assert gallery.updated_selection_binary == b"\x01"
+    assert gallery.get_history(label) == []
+
+
+def test_reparse(monkeypatch):
+    later = []
+    monkeypatch.setattr(wx, "CallLater", lambda ms, function: later.append(
+        function))
+    gallery = make_gallery()
+    gallery.gallery_dict.set_key_descr_dict({MAC: {"bindkey": "aa"}})
+    for n, reference in enumerate((MAC, OTHER_MAC, MAC)):
+        gallery.gallery_dict.set(str(n), bytes([n + 1]), reference)
+    assert gallery.reparse(batch_size=1) == 3
+    assert later == [gallery.collect_reparse]
+    assert gallery.reparse([OTHER_MAC]) == 1  # collected by the same call
+    assert len(later) == 1
+    gallery.collect_reparse()
+    assert not gallery.reparse_jobs
+    assert {
+        label: result.value for label, result in gallery.parse_results.items()
+    } == {
+        "0": {"value": 1, "bindkey": b"\xaa"},
+        "1": {"value": 2, "bindkey": b""},
+        "2": {"value": 3, "bindkey": b"\xaa"},
+    }
+    assert sorted(gallery.construct_hex_editor.construct.parsed) == [
+        b"\x01", b"\x02", b"\x02", b"\x03"]
+    assert gallery.messages[-1].startswith("Parsing completed")
+
+
+def test_reparse_skips_invalid_keys_and_deleted_elements(monkeypatch):
+    monkeypatch.setattr(wx, "CallLater", lambda ms, function: None)
+    gallery = make_gallery()
+    gallery.gallery_dict.set_key_descr_dict({MAC: {"bindkey": "not hex"}})
+    gallery.gallery_dict.set("0", b"\x01", MAC)
+    gallery.gallery_dict.set("1", b"\x02", OTHER_MAC)
+    assert gallery.reparse() == 1
+    gallery.gallery_dict.pop("1")
+    gallery.collect_reparse()
+    assert gallery.parse_results == {}
@@ -0,0 +1,88 @@
+import pytest
+
+pytest.importorskip("wx")
+pytest.importorskip("construct_editor")
+
+from construct_gallery import parse_worker  # noqa: E402
+from construct_gallery.construct_gallery import GalleryDict  # noqa: E402
+
+MAC = "A4:C1:38:00:00:01"
+
+
+def gallery_dict(**kwargs):
+    return GalleryDict("MAC address", "Bindkey", "Description", **kwargs)
+
+
+def test_instances_do_not_share_state():
+    first = gallery_dict()
+    second = gallery_dict()
+    first.set("a", b"\x01\x02", MAC)
+    first.set_key_descr_dict({MAC: {"bindkey": "00" * 16}})
+    first.set_fixed_contextkw({"fixed": 1})
+    assert first.exists("a")
+    assert not second.exists("a")
+    assert second.len() == 0
+    assert second.get_key_descr_dict() == {}
+    assert second.fixed_contextkw == {}
+    assert second.payload_stats()["references"] == 0
+
+
+def test_contextkw_cache_invalidated_on_key_change():
+    created = []
+
+    def cipher(contextkw):
+        created.append(contextkw["bindkey"])
+        return contextkw["bindkey"][::-1]
+
+    gallery = gallery_dict(context_factories={"cipher": cipher})
+    gallery.set("a", b"\x01", MAC)
+    gallery.set_key_descr_dict({MAC: {"bindkey": "0102", "description": "x"}})
+    contextkw = gallery.get_reference_contextkw(MAC)
+    assert contextkw == {
+        "mac_address": bytes.fromhex("A4C138000001"),
+        "bindkey": b"\x01\x02",
+        "description": "x",
+        "cipher": b"\x02\x01",
+    }
+    assert gallery.get_reference_contextkw(MAC) is contextkw  # cached
+    assert gallery.get_contextkw("a") is contextkw
+    assert created == [b"\x01\x02"]
+
+    gallery.update_key_descr_dict({MAC: {"bindkey": "0304"}})
+    contextkw = gallery.get_reference_contextkw(MAC)
+    assert contextkw["bindkey"] == b"\x03\x04"
+    assert contextkw["cipher"] == b"\x04\x03"
+    assert created == [b"\x01\x02", b"\x03\x04"]
+
+
+def test_context_objects_invalidated_on_description_change():
+    gallery = gallery_dict()
+    gallery.set("a", b"\x01", MAC)
+    gallery.set_key_descr_dict({MAC: {"bindkey": "01", "description": "x"}})
+
+    def description(contextkw):
+        return contextkw["description"].upper()
+
+    assert gallery.get_context_object(MAC, "descr", description) == "X"
+    gallery.set_description("a", "y")
+    assert gallery.get_reference_contextkw(MAC)["description"] == "y"
+    assert gallery.get_context_object(MAC, "descr", description) == "Y"
+
+
+def test_invalid_key_is_not_cached():
+    gallery = gallery_dict()
+    gallery.set_key_descr_dict({MAC: {"bindkey": "not hex"}})
+    assert gallery.get_reference_contextkw(MAC) is None
+    assert MAC not in gallery.contextkw_cache
+    gallery.set_key_descr_dict({MAC: {"bindkey": "01"}})
+    assert gallery.get_reference_contextkw(MAC)["bindkey"] == b"\x01"
+
+
+def test_invalidation_clears_the_parse_worker_objects():
+    gallery = gallery_dict()
+    parse_worker.with_context_objects(
+        {"key": 1}, {"cipher": lambda contextkw: object()})
+    generation = parse_worker.context_generation
+    gallery.update_key_descr_dict({MAC: {"bindkey": "01"}})
+    assert not parse_worker.context_object_cache
+    assert parse_worker.context_generation == generation + 1
@@ -0,0 +1,144 @@
+import pytest
+
+from construct_gallery.ingestion import (
+    IngestionQueue, RetentionPolicy, DuplicateSuppressor)
+from construct_gallery.metrics import PipelineMetrics
+
+
+def test_queue_flush_batches_in_order():
+    queue = IngestionQueue(max_batch_size=3)
+    for n in range(5):
+        queue.put(n)
+    batches = []
+    assert queue.flush(batches.append) == 3
+    assert queue.flush(batches.append) == 2
+    assert queue.flush(batches.append) == 0
+    assert batches == [[0, 1, 2], [3, 4]]
+    assert queue.depth == 0
+    assert queue.flushed == 5
+
+
+def test_queue_flush_stops_at_first_element_not_ready():
+    metrics = PipelineMetrics()
+    queue = IngestionQueue(metrics=metrics)
+    for n in (1, 2, 3, 4):
+        queue.put(n)
+    batches = []
+    assert queue.flush(batches.append, ready=lambda n: n != 3) == 2
+    assert batches == [[1, 2]]
+    assert queue.flush(batches.append, ready=lambda n: n != 3) == 0
+    assert queue.depth == 2
+    assert queue.flushed == 2
+    assert metrics.snapshot()["histograms"]["insert_latency"]["count"] == 2
+
+
+def test_queue_stats():
+    queue = IngestionQueue()
+    queue.put("a")
+    queue.put("b")
+    assert queue.stats()["queue_depth"] == 2
+    assert queue.flush(lambda batch: None) == 2
+    stats = queue.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["flushed"] == 2
+    assert stats["max_flush_latency"] >= stats["flush_latency"] >= 0
+    queue.put("c")
+    queue.clear()
+    assert len(queue) == 0
+
+
+def test_retention_max_entries_evicts_oldest_first():
+    retention = RetentionPolicy(max_entries=3)
+    for n, label in enumerate("abcde"):
+        retention.add(label, 1, now=n)
+    assert retention.expired(now=5) == ["a", "b"]
+    assert list(retention.entries) == ["c", "d", "e"]
+    assert retention.evicted == 2
+
+
+def test_retention_readd_moves_to_newest():
+    retention = RetentionPolicy(max_entries=2)
+    retention.add("a", 1, now=0)
+    retention.add("b", 1, now=1)
+    retention.add("a", 1, now=2)
+    retention.add("c", 1, now=3)
+    assert retention.expired(now=3) == ["b"]
+
+
+def test_retention_max_age_and_max_bytes():
+    retention = RetentionPolicy(max_age=10)
+    retention.add("a", 1, now=0)
+    retention.add("b", 1, now=5)
+    assert retention.expired(now=10) == []
+    assert retention.expired(now=12) == ["a"]
+
+    retention = RetentionPolicy(max_bytes=10)
+    retention.add("a", 6, now=0)
+    retention.add("b", 3, now=0)
+    retention.add("c", 4, now=0)
+    assert retention.expired(now=0) == ["a"]
+    assert retention.total_bytes == 7
+    retention.discard("b")
+    assert retention.stats() == {
+        "retained": 1, "retained_bytes": 4, "evicted": 1}
+
+
+def test_retention_disabled():
+    retention = RetentionPolicy()
+    retention.add("a", 100, now=0)
+    assert not retention.enabled
+    assert retention.expired(now=1000) == []
+
+
+def test_retention_rename_keeps_position_and_time():
+    retention = RetentionPolicy(max_entries=2)
+    retention.add("a", 1, now=0)
+    retention.add("b", 2, now=1)
+    retention.rename("a", "z")
+    assert list(retention.entries) == ["z", "b"]
+    assert retention.entries["z"] == (0, 1)
+    retention.add("c", 1, now=2)
+    assert retention.expired(now=2) == ["z"]
+
+
+def test_retention_rename_over_existing_label():
+    retention = RetentionPolicy()
+    retention.add("a", 1, now=0)
+    retention.add("b", 2, now=1)
+    retention.rename("a", "b")
+    assert list(retention.entries) == ["b"]
+    assert retention.total_bytes == 1
+
+
+def test_dedup_change_mode_per_reference_and_data_key():
+    dedup = DuplicateSuppressor("change")
+    assert dedup.accept("dev1", b"\x01")
+    assert not dedup.accept("dev1", b"\x01")
+    assert dedup.accept("dev2", b"\x01")
+    assert dedup.accept("dev1", b"\x01", data_key="uuid")
+    assert dedup.accept("dev1", b"\x02")
+    assert dedup.accept("dev1", b"\x01")
+    assert dedup.suppressed_counts() == {"dev1": 1}
+
+
+def test_dedup_window_mode():
+    dedup = DuplicateSuppressor("window", window=1000)
+    assert dedup.accept("dev1", b"\x01", now=0.0)
+    assert not dedup.accept("dev1", b"\x01", now=0.5)
+    assert dedup.accept("dev1", b"\x02", now=0.6)
+    assert dedup.accept("dev2", b"\x01", now=0.7)
+    # the window starts at the first accepted payload
+    assert dedup.accept("dev1", b"\x01", now=1.0)
+    assert not dedup.accept("dev1", bytearray(b"\x01"), now=1.5)
+    assert dedup.suppressed_counts() == {"dev1": 2}
+    dedup.reset()
+    assert dedup.suppressed_counts() == {}
+    assert dedup.accept("dev1", b"\x01", now=1.6)
+
+
+def test_dedup_disabled_and_invalid_mode():
+    dedup = DuplicateSuppressor()
+    assert dedup.accept("dev1", b"\x01")
+    assert dedup.accept("dev1", b"\x01")
+    with pytest.raises(ValueError):
+        DuplicateSuppressor("always")
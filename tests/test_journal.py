@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from construct_gallery.journal import (
+    GalleryJournal, is_journal_file, read_journal)
+
+
+class Gallery:
+    """In-memory gallery writing its changes to a journal."""
+
+    def __init__(self, filename, **kwargs):
+        self.elements = {}
+        self.key_descr = {}
+        self.journal = GalleryJournal(filename, self.snapshot, **kwargs)
+
+    def snapshot(self):
+        return (
+            [
+                (label, binary, reference)
+                for label, (binary, reference) in self.elements.items()
+            ],
+            dict(self.key_descr)
+        )
+
+    def set(self, label, binary, reference=None):
+        self.elements[label] = (binary, reference)
+        self.journal.set(label, binary, reference)
+
+    def delete(self, label):
+        del self.elements[label]
+        self.journal.delete(label)
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / "gallery.journal")
+
+
+def test_replay(filename):
+    gallery = Gallery(filename)
+    gallery.set("a", b"\x01", "dev1")
+    gallery.set("b", b"\x02")
+    gallery.set("a", b"\x03", "dev1")
+    gallery.delete("b")
+    gallery.set("c", b"")
+    gallery.journal.set_key_descr({"dev1": {"key": "k"}})
+    gallery.journal.set_key_descr({"dev2": {"key": "j"}}, replace=False)
+    gallery.journal.close()
+    assert is_journal_file(filename)
+    elements, key_descr = read_journal(filename)
+    assert list(elements.items()) == [
+        ("a", (b"\x03", "dev1")), ("c", (b"", None))]
+    assert key_descr == {"dev1": {"key": "k"}, "dev2": {"key": "j"}}
+
+
+def test_clear_and_truncated_record(filename):
+    gallery = Gallery(filename)
+    gallery.set("a", b"\x01")
+    gallery.journal.clear()
+    gallery.journal.set("b", b"\x02")
+    gallery.journal.close()
+    with open(filename, "a", encoding="utf-8") as file:
+        file.write('{"op":"set","label":"c","bin')  # crash while writing
+    elements, _ = read_journal(filename)
+    assert list(elements) == ["b"]
+
+
+def test_existing_journal_is_appended(filename):
+    gallery = Gallery(filename)
+    gallery.set("a", b"\x01")
+    gallery.journal.close()
+    journal = GalleryJournal(filename, None, rewrite=False)
+    journal.set("b", b"\x02")
+    journal.close()
+    elements, _ = read_journal(filename)
+    assert list(elements) == ["a", "b"]
+
+
+def test_rewrite_writes_the_snapshot(filename):
+    with open(filename, "w") as file:
+        file.write("not a journal\n")
+    assert not is_journal_file(filename)
+    gallery = Gallery.__new__(Gallery)
+    gallery.elements = {"a": (b"\x01", "dev1")}
+    gallery.key_descr = {"dev1": {"key": "k"}}
+    journal = GalleryJournal(filename, gallery.snapshot)
+    journal.close()
+    assert read_journal(filename) == (
+        {"a": (b"\x01", "dev1")}, {"dev1": {"key": "k"}})
+    assert journal.stats()["compactions"] == 1
+
+
+def test_compaction(filename):
+    gallery = Gallery(
+        filename, compact_min_records=20, compact_ratio=2.0)
+    journal = gallery.journal
+    for n in range(200):
+        gallery.set("label%d" % (n % 5), bytes([n]), "dev%d" % (n % 2))
+        if journal.compaction_thread:
+            journal.compaction_thread.join()
+        assert journal.records < 20 + 2
+    gallery.delete("label0")
+    journal.close()
+    assert journal.error is None
+    assert journal.stats()["compactions"] > 1
+    assert journal.stats()["written"] == 201
+    with open(filename, encoding="utf-8") as file:
+        assert sum(1 for _ in file) == journal.records + 1  # header
+    assert not os.path.exists(filename + ".tmp")
+    elements, _ = read_journal(filename)
+    assert dict(elements) == gallery.elements
+
+
+def test_compaction_loads_lazy_payloads(filename):
+    class Payload:
+        def load(self):
+            return b"\xaa\xbb"
+
+    journal = GalleryJournal(
+        filename, lambda: (iter([("a", Payload(), None)]), {}))
+    journal.close()
+    elements, _ = read_journal(filename)
+    assert elements["a"] == (b"\xaa\xbb", None)
+
+
+def test_compaction_error_is_recorded(filename):
+    def snapshot_elements():
+        yield "a", b"\x01", None
+        raise OSError("database closed")
+
+    journal = GalleryJournal(filename, lambda: (snapshot_elements(), {}))
+    journal.set("b", b"\x02")
+    journal.close()
+    assert isinstance(journal.error, OSError)
+    elements, _ = read_journal(filename)
+    assert list(elements) == ["b"]
@@ -0,0 +1,114 @@
+from construct_gallery.label_index import LabelIndex, StoreLabels
+
+
+def test_find_and_contains():
+    index = LabelIndex(["a", "b", "c"])
+    assert index.find("b") == 1
+    assert index.find("z") == -1
+    assert "c" in index
+    assert "z" not in index
+    assert list(index) == ["a", "b", "c"]
+    assert index.missing(["c", "x", "y", "x"]) == ["x", "y"]
+
+
+def test_append_and_delete_first_keep_the_map():
+    index = LabelIndex(["a", "b"])
+    index.find("a")
+    for label in "cde":
+        index.append(label)
+    index.delete(0)
+    index.delete(0)
+    assert index.valid
+    assert index.find("c") == 0
+    assert index.find("e") == 2
+    assert index.find("a") == -1
+    index.extend(["f", "g"])
+    assert index.valid
+    assert index.find("g") == 4
+
+
+def test_changes_invalidate_the_map():
+    index = LabelIndex(["a", "b", "c"])
+    index.find("a")
+    index.insert(["x"], 1)
+    assert index.find("b") == 2
+    index.delete(1)
+    assert index.find("b") == 1
+    index.set(0, "z")
+    assert index.find("z") == 0
+    assert index.find("a") == -1
+    index.insert(["y"], 10)  # past the end: appended
+    assert index.find("y") == 3
+    index.clear()
+    assert len(index) == 0
+    assert index.find("z") == -1
+
+
+def test_duplicates_find_the_first():
+    index = LabelIndex(["a", "b", "a"])
+    assert index.find("a") == 0
+    index.delete(0)
+    assert index.find("a") == 1
+
+
+class Store:
+    """Minimal store with the page interface of SqliteGalleryDict."""
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self.pages = 0
+
+    def len(self):
+        return len(self.labels)
+
+    def exists(self, label):
+        return label in self.labels
+
+    def keys(self):
+        return list(self.labels)
+
+    def page(self, offset, limit):
+        self.pages += 1
+        return self.labels[offset:offset + limit]
+
+    def position(self, label):
+        return self.labels.index(label) if label in self.labels else None
+
+    def move(self, label, position):
+        self.labels.remove(label)
+        self.labels.insert(position, label)
+
+
+def test_store_labels_read_pages():
+    store = Store("label%d" % n for n in range(10))
+    labels = StoreLabels(store, page_size=4)
+    assert len(labels) == 10
+    assert labels[1] == "label1"
+    assert labels[3] == "label3"
+    assert store.pages == 1
+    assert labels[5] == "label5"
+    assert labels[-1] == "label9"
+    assert store.pages == 3
+    assert labels.find("label7") == 7
+    assert labels.find("missing") == -1
+    assert "label2" in labels
+    assert labels.missing(["x"]) == []
+    assert list(labels) == store.labels
+
+
+def test_store_labels_follow_the_store():
+    store = Store(["a", "b", "c"])
+    labels = StoreLabels(store)
+    assert labels[2] == "c"
+    store.labels.append("d")  # the store is changed before the list
+    labels.append("d")
+    assert labels[3] == "d"
+    store.labels.append("e")
+    labels.insert(["e"], 1)
+    assert store.labels == ["a", "e", "b", "c", "d"]
+    assert labels[1] == "e"
+    labels.set(0, "c")  # e.g., renamed element moved back to its position
+    assert store.labels == ["c", "a", "e", "b", "d"]
+    del store.labels[0]
+    labels.delete(0)
+    assert labels[0] == "a"
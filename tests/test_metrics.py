@@ -0,0 +1,66 @@
+import json
+
+from construct_gallery.metrics import (
+    Histogram, PipelineMetrics, MetricsExporter)
+
+
+def test_histogram():
+    histogram = Histogram(bounds=(1, 2, 5))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.add(value)
+    assert histogram.buckets == [1, 2, 1, 1]
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(80) == 5
+    assert histogram.percentile(100) == 10
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 5
+    assert snapshot["max"] == 10
+    assert snapshot["mean"] == 16.5 / 5
+    assert Histogram().percentile(50) == 0.0
+
+
+def test_counters_histograms_and_gauges():
+    metrics = PipelineMetrics()
+    metrics.incr("received", 3)
+    metrics.incr("inserted")
+    metrics.incr("custom")
+    metrics.observe("parse_time", 0.001)
+    metrics.observe_many("other_time", [0.1, 0.2])
+    metrics.add_gauge("queue_depth", lambda: 7)
+    metrics.add_gauge("broken", lambda: 1 / 0)
+    snapshot = metrics.snapshot()
+    json.dumps(snapshot)
+    assert snapshot["counters"]["received"] == 3
+    assert snapshot["counters"]["inserted"] == 1
+    assert snapshot["counters"]["custom"] == 1
+    assert snapshot["histograms"]["parse_time"]["count"] == 1
+    assert snapshot["histograms"]["other_time"]["count"] == 2
+    assert snapshot["gauges"] == {"queue_depth": 7, "broken": None}
+    metrics.reset()
+    snapshot = metrics.snapshot()
+    assert set(snapshot["counters"].values()) == {0}
+    assert snapshot["histograms"]["parse_time"]["count"] == 0
+
+
+def test_rates():
+    previous = {"uptime": 10.0, "counters": {"received": 100}}
+    current = {"uptime": 12.0, "counters": {"received": 300, "inserted": 4}}
+    assert PipelineMetrics.rates(previous, current) == {
+        "received": 100.0, "inserted": 2.0}
+    assert PipelineMetrics.rates(None, current) == {
+        "received": 0.0, "inserted": 0.0}
+
+
+def test_exporter(tmp_path):
+    filename = tmp_path / "metrics.jsonl"
+    metrics = PipelineMetrics()
+    exporter = MetricsExporter(metrics, str(filename), interval=60)
+    exporter.start()
+    metrics.incr("received", 5)
+    exporter.stop()
+    exporter.stop()  # stopping twice writes a single snapshot
+    lines = filename.read_text().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["counters"]["received"] == 5
+    assert "rates" in record
@@ -0,0 +1,73 @@
+from construct_gallery.parse_cache import (
+    ParseCache, contextkw_key, estimate_size)
+
+
+class Construct:
+    pass
+
+
+def test_contextkw_key_is_order_independent():
+    assert contextkw_key({"a": 1, "b": 2}) == contextkw_key({"b": 2, "a": 1})
+    assert contextkw_key(None) == contextkw_key({}) == ()
+    assert isinstance(contextkw_key({"a": [1, 2]}), str)
+
+
+def test_estimate_size_counts_nested_objects():
+    assert estimate_size({"a": [1, 2, 3]}) > estimate_size({})
+    shared = list(range(100))
+    assert estimate_size([shared, shared]) < 2 * estimate_size(shared)
+
+
+def test_key_depends_on_construct_payload_and_contextkw():
+    construct = Construct()
+    key = ParseCache.make_key(construct, b"\x01", {"a": 1})
+    assert key == ParseCache.make_key(construct, b"\x01", {"a": 1})
+    assert key != ParseCache.make_key(Construct(), b"\x01", {"a": 1})
+    assert key != ParseCache.make_key(construct, b"\x02", {"a": 1})
+    assert key != ParseCache.make_key(construct, b"\x01", {"a": 2})
+
+
+def test_get_checks_construct_identity():
+    cache = ParseCache()
+    construct = Construct()
+    key = ParseCache.make_key(construct, b"\x01", {})
+    cache.put(key, construct, {"value": 1})
+    assert cache.get(key, construct) == ({"value": 1}, None)
+    assert cache.get(key, Construct()) is None
+    assert cache.contains(key, construct)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_errors_are_cached():
+    cache = ParseCache()
+    construct = Construct()
+    error = ValueError("bad payload")
+    cache.put("key", construct, None, error)
+    assert cache.get("key", construct) == (None, error)
+
+
+def test_lru_byte_budget():
+    value_size = estimate_size("x" * 100) + ParseCache.ENTRY_SIZE
+    cache = ParseCache(max_bytes=3 * value_size)
+    construct = Construct()
+    for key in "abc":
+        cache.put(key, construct, "x" * 100)
+    assert cache.stats()["bytes"] == 3 * value_size
+    cache.get("a", construct)  # "b" becomes the least recently used
+    cache.put("d", construct, "x" * 100)
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    cache.discard("c")
+    assert cache.stats()["bytes"] == 2 * value_size
+
+
+def test_oversized_entries_and_disabled_cache():
+    construct = Construct()
+    cache = ParseCache(max_bytes=100)
+    cache.put("key", construct, "x" * 1000)
+    assert not cache.contains("key", construct)
+    cache = ParseCache(max_bytes=0)
+    cache.put("key", construct, 1)
+    assert cache.stats()["entries"] == 0
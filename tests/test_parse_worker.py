@@ -0,0 +1,108 @@
+import pytest
+
+from construct_gallery import parse_worker
+from construct_gallery.parse_worker import (
+    ParseWorkerPool, ParseResult, parse_payload, clear_context_objects,
+    with_context_objects)
+
+
+class Construct:
+    def parse(self, binary, **contextkw):
+        if not binary:
+            raise ValueError("empty payload")
+        return {"value": binary[0] + contextkw.get("offset", 0)}
+
+
+@pytest.fixture
+def pool():
+    pool = ParseWorkerPool(workers=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_parse_payload():
+    value, error, duration = parse_payload(Construct(), b"\x02", {"offset": 1})
+    assert value == {"value": 3}
+    assert error is None
+    assert duration >= 0
+    value, error, _ = parse_payload(Construct(), b"", {})
+    assert value is None
+    assert isinstance(error, ValueError)
+
+
+def test_context_factories():
+    created = []
+
+    def factory(contextkw):
+        created.append(contextkw)
+        return contextkw["key"] * 2
+
+    class KeyConstruct:
+        def parse(self, binary, **contextkw):
+            return contextkw["offset"]
+
+    factories = {"offset": factory}
+    for _ in range(2):
+        value, _, _ = parse_payload(
+            KeyConstruct(), b"", {"key": 21}, factories)
+        assert value == 42
+    assert len(created) == 1
+
+
+def test_submit_and_collect(pool):
+    construct = Construct()
+    job = pool.submit(construct, b"\x05", {})
+    result = pool.collect(job)
+    assert isinstance(result, ParseResult)
+    assert result.value == {"value": 5}
+    assert result.matches(construct, b"\x05", {})
+    assert not result.matches(Construct(), b"\x05", {})
+    assert not result.matches(construct, b"\x06", {})
+    error_result = pool.collect(pool.submit(construct, b"", {}))
+    assert error_result.value is None
+    assert isinstance(error_result.error, ValueError)
+    stats = pool.stats()
+    assert stats["submitted"] == 2
+    assert stats["parsed"] == 2
+    assert stats["parse_errors"] == 1
+
+
+def test_batch(pool):
+    construct = Construct()
+    job = pool.submit_batch(construct, [b"\x01", b"", b"\x03"], {"offset": 1})
+    results = pool.collect_batch(job)
+    assert [r.value for r in results] == [{"value": 2}, None, {"value": 4}]
+    assert [r.binary for r in results] == [b"\x01", b"", b"\x03"]
+    assert pool.stats()["parse_errors"] == 1
+
+
+def test_context_object_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(parse_worker, "CONTEXT_OBJECT_CACHE_SIZE", 3)
+    clear_context_objects()
+    factories = {"offset": lambda contextkw: contextkw["key"]}
+    for key in range(5):
+        with_context_objects({"key": key}, factories)
+    assert len(parse_worker.context_object_cache) == 3
+    with_context_objects({"key": 2}, factories)  # most recently used
+    with_context_objects({"key": 5}, factories)
+    cached_keys = [
+        dict(items)["key"] for _, items in parse_worker.context_object_cache]
+    assert cached_keys == [4, 2, 5]
+
+
+def test_clear_context_objects():
+    created = []
+    factories = {"offset": lambda contextkw: created.append(contextkw)}
+    with_context_objects({"key": 1}, factories)
+    with_context_objects({"key": 1}, factories)
+    assert len(created) == 1
+    generation = parse_worker.context_generation
+    clear_context_objects()
+    assert not parse_worker.context_object_cache
+    assert parse_worker.context_generation == generation + 1
+    with_context_objects({"key": 1}, factories)
+    assert len(created) == 2
+    # a job carrying another generation clears the cache of the worker
+    with_context_objects({"key": 1}, factories, generation + 5)
+    assert len(created) == 3
+    assert parse_worker.context_generation == generation + 5
@@ -0,0 +1,100 @@
+from construct_gallery.payload_pool import PayloadPool, PayloadArena
+
+
+class Record:
+    def __init__(self, binary):
+        self.binary = binary
+
+
+def test_pool_shares_identical_payloads():
+    pool = PayloadPool()
+    first = pool.add(b"\x01\x02")
+    second = pool.add(bytes(bytearray(b"\x01\x02")))
+    assert first is second
+    assert pool.count(b"\x01\x02") == 2
+    stats = pool.stats()
+    assert stats["payloads"] == 1
+    assert stats["stored_bytes"] == 2
+    assert stats["referenced_bytes"] == 4
+    assert stats["dedup_ratio"] == 2.0
+    pool.release(first)
+    pool.release(second)
+    assert pool.count(b"\x01\x02") == 0
+    assert pool.stats()["stored_bytes"] == 0
+
+
+def test_pool_normalizes_buffers_to_bytes():
+    pool = PayloadPool()
+    buffer = bytearray(b"abc")
+    shared = pool.add(memoryview(buffer))
+    assert type(shared) is bytes
+    assert pool.add(buffer) is shared
+    buffer[0] = 0  # the pool does not keep the buffer of the caller
+    assert shared == b"abc"
+    assert pool.count(b"abc") == 2
+
+
+def test_pool_ignores_other_objects():
+    pool = PayloadPool()
+    payload = object()
+    assert pool.add(payload) is payload
+    pool.release(payload)
+    assert pool.stats()["references"] == 0
+    assert not pool.compactable()
+
+
+def test_arena_dedup_and_release():
+    arena = PayloadArena(chunk_size=64)
+    span = arena.add(b"hello")
+    assert isinstance(span, int)
+    assert arena.add(bytearray(b"hello")) == span
+    assert bytes(arena.view(span)) == b"hello"
+    assert arena.get_count(span) == 2
+    assert arena.count(b"hello") == 2
+    other = arena.add(memoryview(b"world"))
+    assert other != span
+    arena.release(span)
+    arena.release(span)
+    assert arena.count(b"hello") == 0
+    arena.release(span)  # already released
+    assert arena.stats()["references"] == 1
+    assert arena.stats()["payloads"] == 1
+
+
+def test_arena_large_payloads_unchanged():
+    arena = PayloadArena(chunk_size=16)
+    payload = bytes(20)
+    assert arena.add(payload) is payload
+    arena.release(payload)
+    assert arena.stats()["references"] == 0
+
+
+def test_arena_compaction():
+    arena = PayloadArena(chunk_size=64, compact_ratio=0.5)
+    records = [Record(arena.add(bytes([n]) * 10)) for n in range(20)]
+    for record in records[:-2]:
+        arena.release(record.binary)
+    records = records[-2:]
+    records.append(Record(arena.add(bytes([19]) * 10)))  # shared span
+    assert arena.compactable()
+    old_views = [bytes(arena.view(record.binary)) for record in records]
+    garbage = arena.stats()["garbage_bytes"]
+    assert garbage > 0
+    arena.compact(records)
+    assert [bytes(arena.view(r.binary)) for r in records] == old_views
+    assert records[1].binary == records[2].binary
+    assert arena.get_count(records[1].binary) == 2
+    assert arena.stats()["garbage_bytes"] == 0
+    assert arena.stats()["arena_bytes"] == 64
+    assert not arena.compactable()
+    # released payloads are still found and shared after the compaction
+    assert arena.add(bytes([18]) * 10) == records[0].binary
+    assert arena.count(bytes([18]) * 10) == 2
+
+
+def test_arena_views_survive_compaction():
+    arena = PayloadArena(chunk_size=32)
+    record = Record(arena.add(b"payload"))
+    view = arena.view(record.binary)
+    arena.compact([record])
+    assert bytes(view) == b"payload"
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# SqliteGalleryDict extends GalleryDict, defined with the wxPython widgets
+pytest.importorskip("wx")
+pytest.importorskip("construct_editor")
+
+from construct_gallery.sqlite_gallery import SqliteGalleryDict  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteGalleryDict(
+        str(tmp_path / "gallery.db"), "MAC address", "Key", "Description",
+        batch_size=10)
+    yield store
+    store.close()
+
+
+def test_set_get_and_delete(store):
+    timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    store.set("a", b"\x01\x02", "dev1", timestamp)
+    store.set("b", bytearray(b"\x03"))
+    assert store.len() == 2
+    assert store.get_binary("a") == b"\x01\x02"
+    assert store.get_binary("b") == b"\x03"
+    assert store.get_length("a") == 2
+    assert store.get_timestamp("a") == timestamp
+    assert store.get_timestamp("b") is None
+    assert store.keys() == ["a", "b"]
+    store.set("a", b"\x04")  # reference and timestamp are kept
+    assert store.get_binary("a") == b"\x04"
+    assert store.get_timestamp("a") == timestamp
+    assert store.labels_by_reference("dev1") == ["a"]
+    store.delete("a")
+    assert not store.exists("a")
+    assert store.len() == 1
+    with pytest.raises(KeyError):
+        store.delete("a")
+    assert store.pop("a") is None
+
+
+def test_payloads_are_content_addressed(store):
+    store.set("a", b"\x01" * 10)
+    store.set("b", b"\x01" * 10)
+    store.set("c", b"\x02" * 10)
+    stats = store.payload_stats()
+    assert stats["payloads"] == 2
+    assert stats["references"] == 3
+    assert stats["stored_bytes"] == 20
+    assert stats["referenced_bytes"] == 30
+    assert store.labels_by_payload(b"\x01" * 10) == ["a", "b"]
+    store.delete("a")
+    assert store.payload_stats()["payloads"] == 2
+    store.delete("b")
+    assert store.payload_stats()["payloads"] == 1
+
+
+def test_pages_positions_and_moves(store):
+    for n in range(6):
+        store.set("label%d" % n, bytes([n]))
+    assert store.page(2, 3) == ["label2", "label3", "label4"]
+    assert store.position("label4") == 4
+    assert store.position("missing") is None
+    store.move("label4", 1)
+    assert store.keys() == [
+        "label0", "label4", "label1", "label2", "label3", "label5"]
+    store.move("label0", 3)
+    assert store.keys() == [
+        "label4", "label1", "label0", "label2", "label3", "label5"]
+    store.move("label1", 10)
+    assert store.keys()[-1] == "label1"
+    assert store.position("label1") == 5
+    store.set("label6", b"\x06")
+    assert store.keys()[-1] == "label6"
+
+
+def test_labels_by_time(store):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for n in range(5):
+        store.set("label%d" % n, b"\x00", timestamp=start + timedelta(n))
+    assert store.labels_by_time(
+        start + timedelta(1), start + timedelta(3)) == [
+            "label1", "label2", "label3"]
+
+
+def test_snapshot_and_reopen(tmp_path, store):
+    store.set("a", b"\x01", "dev1")
+    store.set("b", b"\x02")
+    elements, _ = store.snapshot()
+    assert [(label, bytes(binary)) for label, binary, _ in elements] == [
+        ("a", b"\x01"), ("b", b"\x02")]
+    store.close()
+    reopened = SqliteGalleryDict(
+        str(tmp_path / "gallery.db"), "MAC address", "Key", "Description")
+    try:
+        assert reopened.len() == 2
+        assert reopened.get_binary("a") == b"\x01"
+    finally:
+        reopened.close()